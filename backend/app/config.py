@@ -12,6 +12,119 @@ class Settings(BaseSettings):
     supabase_bucket: str = "videos"
     redis_url: str = "redis://redis:6379"
 
+    # RAG example index: "pinecone" or "local" (memory-mapped NumPy, see app/services/local_index.py)
+    vector_backend: str = "pinecone"
+    local_index_dir: str = ""          # defaults to <tmp>/movinglines_vector_index
+    local_index_mode: str = "auto"     # "exact", "ivf", or "auto" (IVF above the threshold below)
+    local_index_ivf_min_vectors: int = 2000
+    local_index_nprobe: int = 8        # IVF clusters scanned per query
+    local_index_ivf_rebuild_ratio: float = 0.25  # re-cluster once this share of rows changed since the last build
+
+    # Bulk example ingestion (python -m app.services.ingestion / POST /api/examples/ingest)
+    ingest_batch_size: int = 100       # examples per embedding request and index upsert
+    ingest_concurrency: int = 4        # chunks in flight at once
+    ingest_manifest_path: str = ""     # local backend: defaults next to the index; required for pinecone
+    ingest_api_token: str = ""         # required as X-Ingest-Token; empty disables the API
+    stats_api_token: str = ""          # required as X-Stats-Token on /system/stats; empty disables it
+
+    # Harvest successful renders into the RAG corpus
+    harvest_enabled: bool = True
+    harvest_interval: int = 300        # seconds between batch upserts / revalidation passes
+    harvest_min_score: float = 0.3
+    harvest_render_seconds_ref: float = 120.0  # a render this long halves the score
+    harvest_revalidate_batch: int = 5  # entries re-rendered per pass after a manim upgrade
+
+    # Embedding cache (in-memory LRU, optional sqlite spill shared by processes on a host)
+    embedding_cache_max_entries: int = 10000
+    embedding_cache_path: str = ""     # e.g. /app/media/embeddings.sqlite3, empty = memory only
+    embedding_cache_disk_max_entries: int = 200000
+
+    # Async Supabase HTTP pool
+    supabase_pool_size: int = 20
+    supabase_keepalive: float = 30.0   # seconds an idle connection is kept open
+    supabase_timeout: float = 15.0
+
+    # Shared upstream clients: max concurrent calls per process
+    llm_max_concurrency: int = 16
+    embedding_max_concurrency: int = 8
+    imagen_max_concurrency: int = 4
+    retrieval_threads: int = 8         # executor for blocking embedding/Pinecone calls
+
+    # Generated images: content-addressed by normalized prompt, LRU-evicted by size
+    image_cache_enabled: bool = True
+    image_cache_dir: str = ""          # defaults to <tmp>/movinglines_image_cache
+    image_cache_max_bytes: int = 1024 ** 3
+    image_max_retries: int = 3         # on rate limits (429) and transient 5xx errors
+    image_retry_backoff: float = 2.0   # seconds, doubled on each retry; the API's retryDelay wins if longer
+
+    # Script generation stage timeouts (seconds)
+    planner_timeout: float = 30.0      # storyboard falls back to none
+    rag_timeout: float = 10.0          # retrieval falls back to no examples
+    llm_timeout: float = 180.0
+
+    # Streamed script generation
+    generation_stream_interval: float = 0.5  # seconds between partial-script checks and client pushes
+    generation_max_chars: int = 40000        # longer scripts are runaway generations
+    generation_scene_deadline: int = 4000    # chars of code allowed before `class GeneratedScene` must appear
+    generation_retries: int = 1              # fresh attempts after an early abort
+    # Speculative generation: >1 generates that many scripts at once and renders the first to pass
+    # static validation and the dry run. Costs extra tokens; plain (non-image) prompts only.
+    # Raise preflight_workers to match so the dry runs overlap.
+    speculative_candidates: int = 0
+    speculative_temperatures: list[float] = [0.6, 0.8, 1.0]
+
+    # Check scripts against the manim API before rendering; failures go straight to self-heal
+    static_validation_enabled: bool = True
+    # Dry-run the scene in a warm worker (animations skipped, no movie written) before the real render
+    preflight_enabled: bool = True
+    preflight_timeout: int = 60        # seconds; a preflight that times out doesn't block the render
+    preflight_workers: int = 1
+
+    # Task progress rows are batched; terminal states are always written immediately
+    task_progress_flush_interval: float = 2.0  # seconds, 0 writes every update directly
+
+    # Render job queue (consumed by `python -m app.worker`)
+    job_queue_enabled: bool = False
+    job_queue_name: str = "render"
+    job_queue_concurrency: int = 4     # max in-flight jobs across all workers
+    worker_concurrency: int = 2        # max in-flight jobs per worker process
+    job_visibility_timeout: int = 300  # seconds before an un-heartbeated job is re-queued
+    job_max_attempts: int = 3
+    job_retry_backoff: float = 10.0    # seconds, doubled on each retry
+
+    # Content-addressed render cache
+    render_cache_enabled: bool = True
+    render_cache_dir: str = ""         # defaults to <tmp>/movinglines_render_cache
+    render_cache_max_bytes: int = 5 * 1024 ** 3
+    render_cache_mirror: bool = False  # also keep entries in the storage bucket
+
+    # Manim render pool
+    render_workers: int = 2
+    render_cpus_per_worker: int = 0    # >0 pins each render to its own CPU set
+    render_memory_limit_mb: int = 0    # address-space limit per render, 0 = unlimited
+    render_timeout: int = 600          # wall-clock seconds before a render is killed
+    render_nice: int = 0
+    render_mode: str = "cli"           # "cli" spawns manim per job, "warm" uses pre-imported workers
+    warm_max_jobs_per_worker: int = 50
+    warm_max_rss_mb: int = 2048
+    render_segments: int = 1           # >1 renders animation windows in parallel and concats them
+    segment_min_animations: int = 12   # scripts with fewer animations render as one piece
+
+    # Self-heal loop: repair and re-render failed scripts within these budgets
+    heal_max_attempts: int = 3
+    heal_time_budget: float = 300.0    # seconds across all repairs of one task
+
+    # Render a fast -ql preview first and stream it while the requested quality renders
+    preview_enabled: bool = True
+    preview_concurrent: bool = False   # start both renders at once: sooner video, but two render slots per task
+
+    # Prompt -> finished video cache
+    prompt_cache_enabled: bool = True
+    prompt_cache_similarity: float = 0.95  # cosine similarity needed for a semantic hit
+    prompt_cache_ttl: int = 7 * 24 * 3600
+    prompt_cache_max_entries: int = 5000
+    prompt_cache_sync_interval: float = 30.0  # seconds between pulls of newly completed tasks
+
     class Config:
         env_file = ".env"
         extra = "ignore"
@@ -4,7 +4,8 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-from app.routers import animations, auth
+from app.routers import animations, auth, examples
+from app.config import get_settings
 
 from fastapi.responses import JSONResponse
 from starlette.middleware.cors import CORSMiddleware
@@ -13,9 +14,14 @@ import socketio
 
 fastapi_app = FastAPI(title="Manim Animation Generator", version="1.0.0")
 
+settings = get_settings()
+
 # Socket.IO setup
+# When jobs run in separate worker processes, their status emits arrive via Redis pub/sub
+sio_client_manager = socketio.AsyncRedisManager(settings.redis_url) if settings.job_queue_enabled else None
 sio = socketio.AsyncServer(
     async_mode='asgi',
+    client_manager=sio_client_manager,
     cors_allowed_origins="*", # Managed by ASGI application middleware or specific for SIO
     ping_timeout=60,
     ping_interval=25,
@@ -66,6 +72,44 @@ setup_animations_handlers(sio)
 
 fastapi_app.include_router(animations.router, prefix="/api/animations", tags=["animations"])
 fastapi_app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
+fastapi_app.include_router(examples.router, prefix="/api/examples", tags=["examples"])
+
+@fastapi_app.on_event("startup")
+async def load_vector_index():
+    if settings.vector_backend == "local":
+        import asyncio
+        from app.services.local_index import get_local_index
+        await asyncio.to_thread(get_local_index)
+
+# Fire-and-forget startup work: held here so it isn't garbage-collected mid-run
+_background_tasks: set = set()
+
+def _background_task_done(task):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"[ERROR] Background startup task failed: {task.exception()!r}")
+
+@fastapi_app.on_event("startup")
+async def warm_validator():
+    # Build the cached manim API surface now rather than on the first request
+    if settings.static_validation_enabled:
+        import asyncio
+        from app.services.manim.api_surface import get_surface
+        task = asyncio.create_task(asyncio.to_thread(get_surface))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_task_done)
+
+@fastapi_app.on_event("startup")
+async def start_harvester():
+    from app.services import harvester
+    # With the job queue, workers do the rendering and therefore the revalidation
+    harvester.start(revalidate=not settings.job_queue_enabled)
+
+@fastapi_app.on_event("shutdown")
+async def flush_task_progress():
+    from app.services import task_progress, harvester
+    await harvester.stop()
+    await task_progress.flush()
 
 @fastapi_app.get("/")
 async def root_health():
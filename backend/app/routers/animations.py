@@ -1,19 +1,33 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends, Query
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends, Query, Header
 from pydantic import BaseModel
 from typing import Optional, List, Dict
 from enum import Enum
 from datetime import datetime
 import json
+import os
+import shutil
+import tempfile
+import time
 import asyncio
+import httpx
 
 from app.services.manim import generate_manim_script, generate_improved_code
-from app.services.video_renderer import render_animation
-from app.services.database_service import upload_video, get_user_videos, get_current_user, get_supabase, create_chat_in_db, get_user_chats_from_db, delete_chat_from_db, get_chat_tasks_from_db, ensure_user_exists, get_user_credits, deduct_credit
+from app.services.manim import generator as script_generator
+from app.services.manim import pipeline as generation_pipeline
+from app.services.manim.validator import validate_script, format_diagnostics, ScriptValidationError
+from app.services.manim import ast_sanitizer, repair_rules
+from app.services.manim.ast_sanitizer import sanitize_script
+from app.services.video_renderer import render_animation, preflight_script, get_preflight_stats
+from app.services.render_pool import get_render_pool, RenderTimeout
+from app.services.warm_renderer import get_warm_pool
+from app.services.database_service import upload_video, upload_preview, remove_storage_objects, clone_video, get_user_videos, get_current_user, get_async_supabase, create_chat_in_db, get_user_chats_from_db, delete_chat_from_db, get_chat_tasks_from_db, ensure_user_exists, get_user_credits, deduct_credit
+from app.services.job_queue import JobQueue
+from app.services import render_cache, prompt_cache, cancellation, task_progress, client_registry, embedding_cache, harvester, image_generator
+from app.config import get_settings
 
 import logging
 logger = logging.getLogger(__name__)
-
-# Task management
+settings = get_settings()
 
 # Task management
 class ConnectionManager:
@@ -23,7 +37,7 @@ class ConnectionManager:
     def set_sio(self, sio):
         self.sio = sio
 
-    async def broadcast_status(self, user_id: str, task_id: str, status: str, progress: int, video_url: str = None, chat_id: str = None, generated_script: str = None, error: str = None):
+    async def broadcast_status(self, user_id: str, task_id: str, status: str, progress: int, video_url: str = None, chat_id: str = None, generated_script: str = None, error: str = None, preview_url: str = None):
         if not self.sio:
             return
             
@@ -34,12 +48,26 @@ class ConnectionManager:
             "video_url": video_url,
             "chat_id": chat_id,
             "generated_script": generated_script,
-            "error": error
+            "error": error,
+            "preview_url": preview_url
         }
         
         # In Socket.IO, we use rooms. Every authenticated user is in a room named after their user_id.
         await self.sio.emit('status_update', message, room=user_id)
 
+    async def broadcast_script_delta(self, user_id: str, task_id: str, previous: str, script: str):
+        """Push a partial script as it streams in: the client cuts its copy at `offset` and appends `delta`."""
+        if not self.sio:
+            return
+        offset = len(previous) if script.startswith(previous) else 0
+        if offset == len(script):
+            return
+        await self.sio.emit('script_delta', {
+            "task_id": task_id,
+            "offset": offset,
+            "delta": script[offset:],
+        }, room=user_id)
+
 manager = ConnectionManager()
 
 def setup_socket_handlers(sio):
@@ -60,10 +88,23 @@ def setup_socket_handlers(sio):
             user_id, email = await get_current_user(token)
             # Add this client to a room specifically for this user
             await sio.enter_room(sid, user_id)
+            await sio.save_session(sid, {'user_id': user_id})
             await sio.emit('authenticated', {'user_id': user_id}, room=sid)
         except Exception as e:
             await sio.emit('error', {'message': f"Authentication failed: {str(e)}"}, room=sid)
 
+    @sio.event
+    async def cancel_task(sid, data):
+        session = await sio.get_session(sid)
+        user_id = session.get('user_id') if session else None
+        if not user_id:
+            await sio.emit('error', {'message': 'Not authenticated'}, room=sid)
+            return
+        try:
+            await cancel_user_task(data.get('task_id'), user_id)
+        except HTTPException as e:
+            await sio.emit('error', {'message': e.detail}, room=sid)
+
     @sio.event
     async def disconnect(sid):
         pass
@@ -91,22 +132,20 @@ class AnimationResponse(BaseModel):
     status: str
     message: str
 
-def get_task_from_db(task_id: str):
+async def get_task_from_db(task_id: str):
     """Get task from database"""
-    client = get_supabase()
-    result = client.table("tasks").select("*").eq("id", task_id).execute()
+    client = get_async_supabase()
+    result = await client.table("tasks").select("*").eq("id", task_id).execute()
     return result.data[0] if result.data else None
 
-def update_task_in_db(task_id: str, updates: dict):
-    """Update task in database"""
-    client = get_supabase()
-    updates["updated_at"] = datetime.utcnow().isoformat()
-    client.table("tasks").update(updates).eq("id", task_id).execute()
+async def update_task_in_db(task_id: str, updates: dict):
+    """Update task in database (progress steps are coalesced, terminal states written immediately)"""
+    await task_progress.update(task_id, updates)
 
-def create_task_in_db(task_id: str, user_id: str, prompt: str, quality: str, chat_id: str):
+async def create_task_in_db(task_id: str, user_id: str, prompt: str, quality: str, chat_id: str):
     """Create task in database"""
-    client = get_supabase()
-    client.table("tasks").insert({
+    client = get_async_supabase()
+    await client.table("tasks").insert({
         "id": task_id,
         "user_id": user_id,
         "chat_id": chat_id,
@@ -122,27 +161,52 @@ def create_task_in_db(task_id: str, user_id: str, prompt: str, quality: str, cha
 async def get_chats(user_identity: tuple[str, str] = Depends(get_current_user)):
     """Get all chats for the current user"""
     user_id, _ = user_identity
-    return get_user_chats_from_db(user_id)
+    return await get_user_chats_from_db(user_id)
 
 @router.delete("/chats/{chat_id}")
 async def delete_chat(chat_id: str, user_identity: tuple[str, str] = Depends(get_current_user)):
     """Delete a chat session"""
     user_id, _ = user_identity
+    # Stop any render still running for this chat before its rows disappear
+    for task in await get_chat_tasks_from_db(chat_id, user_id):
+        if task.get("status") not in TERMINAL_STATUSES:
+            await cancellation.request_cancel(task["id"])
     return await delete_chat_from_db(chat_id, user_id)
 
 @router.get("/chats/{chat_id}/history")
 async def get_chat_history(chat_id: str, user_identity: tuple[str, str] = Depends(get_current_user)):
     """Get history (tasks) for a specific chat"""
     user_id, _ = user_identity
-    return get_chat_tasks_from_db(chat_id, user_id)
+    return await get_chat_tasks_from_db(chat_id, user_id)
 
 @router.get("/credits")
 async def get_credits(user_identity: tuple[str, str] = Depends(get_current_user)):
     """Get current credit balance for the user"""
     user_id, _ = user_identity
-    credits = get_user_credits(user_id)
+    credits = await get_user_credits(user_id)
     return {"credits": credits}
 
+TERMINAL_STATUSES = task_progress.TERMINAL_STATUSES
+
+async def cancel_user_task(task_id: str, user_id: str) -> dict:
+    """Cancel a task owned by `user_id`, wherever it is running."""
+    task = await get_task_from_db(task_id) if task_id else None
+    if not task or task.get("user_id") != user_id:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if task.get("status") in TERMINAL_STATUSES:
+        return {"task_id": task_id, "status": task["status"]}
+    
+    await cancellation.request_cancel(task_id)
+    await update_task_in_db(task_id, {"status": "cancelled", "error_message": "Cancelled by user"})
+    await manager.broadcast_status(user_id, task_id, "cancelled", 0)
+    return {"task_id": task_id, "status": "cancelled"}
+
+@router.post("/tasks/{task_id}/cancel")
+async def cancel_task(task_id: str, user_identity: tuple[str, str] = Depends(get_current_user)):
+    """Cancel an in-flight animation task"""
+    user_id, _ = user_identity
+    return await cancel_user_task(task_id, user_id)
+
 @router.post("/generate", response_model=AnimationResponse)
 async def generate_animation(
     request: AnimationRequest,
@@ -157,19 +221,23 @@ async def generate_animation(
     if not success:
         raise HTTPException(status_code=500, detail="Failed to synchronize user record. Please contact support.")
     
+    # Credit balance and the one-video-per-chat check are independent; fetch them together
+    chat_id = request.chat_id
+    credits, existing_tasks = await asyncio.gather(
+        get_user_credits(user_id),
+        get_chat_tasks_from_db(chat_id, user_id) if chat_id else asyncio.sleep(0, result=[])
+    )
+    
     # Check if user has credits
-    credits = get_user_credits(user_id)
     if credits <= 0:
         raise HTTPException(status_code=402, detail="No credits remaining. Please upgrade your plan to continue generating animations.")
     
     task_id = str(uuid.uuid4())
     
     # Determine Chat ID
-    chat_id = request.chat_id
     if chat_id:
         # One-video-per-chat constraint: Check if this chat already has any tasks/videos
         # This keeps the experience focused on one concept per chat.
-        existing_tasks = get_chat_tasks_from_db(chat_id, user_id)
         if existing_tasks:
             raise HTTPException(
                 status_code=400, 
@@ -178,20 +246,24 @@ async def generate_animation(
     else:
         # Create new chat with title from prompt (truncated)
         title = request.prompt[:50] + "..." if len(request.prompt) > 50 else request.prompt
-        chat_id = create_chat_in_db(user_id, title)
+        chat_id = await create_chat_in_db(user_id, title)
 
     # Create task in database
-    create_task_in_db(task_id, user_id, request.prompt, request.quality.value, chat_id)
+    await create_task_in_db(task_id, user_id, request.prompt, request.quality.value, chat_id)
     
-    background_tasks.add_task(
-        process_animation,
-        task_id,
-        request.prompt,
-        request.quality.value,
-        request.duration,
-        user_id,
-        request.use_image
-    )
+    job = {
+        "task_id": task_id,
+        "prompt": request.prompt,
+        "quality": request.quality.value,
+        "duration": request.duration,
+        "user_id": user_id,
+        "use_image": request.use_image,
+    }
+    if settings.job_queue_enabled:
+        # Durable path: any worker process (python -m app.worker) can pick this up
+        await JobQueue(settings.job_queue_name).enqueue(job, job_id=task_id)
+    else:
+        background_tasks.add_task(run_animation_job, job)
     
     return AnimationResponse(
         task_id=task_id,
@@ -200,56 +272,287 @@ async def generate_animation(
         message="Animation generation started"
     )
 
+async def run_animation_job(job: dict, attempt: int | None = None):
+    """
+    Entry point shared by BackgroundTasks and queue workers.
+
+    Queue workers pass the 1-based `attempt`; transient failures on attempts
+    before settings.job_max_attempts are re-raised so the queue retries them.
+    Without `attempt` (BackgroundTasks) every failure is final.
+    """
+    if await cancellation.is_cancelled(job["task_id"]):
+        print(f"[{job['task_id']}] Cancelled before it started, skipping")
+        return
+    await process_animation(
+        job["task_id"],
+        job["prompt"],
+        job["quality"],
+        job["duration"],
+        job["user_id"],
+        job.get("use_image", False),
+        retryable=attempt is not None and attempt < settings.job_max_attempts
+    )
+
+_TRANSIENT_CODES = {500, 502, 503, 504}
+
+def _is_transient(error: BaseException) -> bool:
+    """True for infrastructure failures worth retrying: connection errors, render timeouts, upstream 5xx."""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, (RenderTimeout, ConnectionError, TimeoutError, httpx.TransportError)):
+            return True
+        code = getattr(error, "code", None)
+        if code is None:
+            code = getattr(getattr(error, "response", None), "status_code", None)
+        if isinstance(code, int) and code in _TRANSIENT_CODES:
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
 async def _apply_hybrid_images(task_id: str, script: str) -> str:
-    """Helper to find placeholders and generate them in parallel."""
-    import re
-    import asyncio
-    from app.services.image_generator import generate_image, get_fallback_image
+    """Replace image placeholders, reusing what this task already generated (e.g. on self-heal passes)."""
+    return await image_generator.resolve_image_placeholders(script, task_id)
+
+async def _check_script(task_id: str, script: str):
+    """Raise ScriptValidationError if static validation finds errors."""
+    if not settings.static_validation_enabled:
+        return
+    # First use may introspect manim in a subprocess; keep it off the event loop
+    diagnostics = await asyncio.to_thread(validate_script, script)
+    errors = [d for d in diagnostics if d["severity"] == "error"]
+    if errors:
+        print(f"[{task_id}] Static validation found {len(errors)} problem(s):\n{format_diagnostics(errors)}")
+        raise ScriptValidationError(errors)
+
+async def _preflight(task_id: str, script: str):
+    """Dry-run the scene before the real render; raise with its traceback if it fails."""
+    if not settings.preflight_enabled:
+        return
+    error = await preflight_script(script, job_id=task_id)
+    if error:
+        print(f"[{task_id}] Preflight failed, skipping the full render: {error[:300]}")
+        raise RuntimeError(f"Manim rendering failed: {error}")
+
+async def _vet_script(task_id: str, script: str):
+    """Static validation, then the dry run; raises RuntimeError with the reason on failure."""
+    script = sanitize_script(script)
+    await _check_script(task_id, script)
+    await _preflight(task_id, script)
+
+async def _publish_preview(task_id: str, user_id: str, preview_path: str, preview_paths: list):
+    try:
+        preview_url, bucket_path = await upload_preview(preview_path, user_id)
+        preview_paths.append(bucket_path)
+        print(f"[{task_id}] Preview ready: {preview_url}")
+        await manager.broadcast_status(user_id, task_id, "rendering", 65, preview_url=preview_url)
+    except Exception as e:
+        logger.warning(f"[{task_id}] Preview upload failed, continuing with full render: {e}")
+
+async def _render_with_preview(task_id: str, user_id: str, script: str, quality: str, preview_paths: list,
+                               work_dir: str | None = None) -> str:
+    """
+    Render a fast -ql preview, then the requested quality.
+
+    The full render only starts once the preview has rendered, so a script
+    that fails (or a task cancelled after the user saw the preview) never
+    spends full-quality render time. The preview is uploaded and pushed to
+    the client while the full render runs. With settings.preview_concurrent
+    both renders start together instead: the video is ready sooner, but
+    every task holds two render slots. With `work_dir`, both renders keep
+    their media there so a later attempt reuses manim's partial movie files.
+    """
+    full_dir = os.path.join(work_dir, quality) if work_dir else None
+    if not settings.preview_enabled or quality == "l":
+        return await render_animation(script, quality, job_id=task_id, work_dir=full_dir)
     
-    # Use set to avoid redundant requests for identical prompts
-    image_prompts = list(set(re.findall(r"{{IMAGE:(.*?)}}", script)))
+    preview_dir = os.path.join(work_dir, "preview") if work_dir else None
+    full_render = None
+    if settings.preview_concurrent:
+        full_render = asyncio.create_task(render_animation(script, quality, job_id=task_id, work_dir=full_dir))
+    try:
+        preview_path = await render_animation(script, "l", job_id=f"{task_id}:preview", work_dir=preview_dir)
+    except BaseException:
+        if full_render is not None:
+            full_render.cancel()
+            await asyncio.gather(full_render, return_exceptions=True)
+        raise
     
-    if image_prompts:
-        print(f"[{task_id}] Generating {len(image_prompts)} unique images in parallel...")
-        
-        # Launch all tasks
-        tasks = [generate_image(p) for p in image_prompts]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        for img_prompt, result in zip(image_prompts, results):
-            if isinstance(result, Exception):
-                logger.warning(f"[{task_id}] Failed to generate image for '{img_prompt}': {result}")
-                img_path = get_fallback_image()
+    if full_render is None:
+        full_render = asyncio.create_task(render_animation(script, quality, job_id=task_id, work_dir=full_dir))
+    try:
+        await _publish_preview(task_id, user_id, preview_path, preview_paths)
+        return await full_render
+    finally:
+        if not full_render.done():
+            full_render.cancel()
+            await asyncio.gather(full_render, return_exceptions=True)
+
+_repair_stats = {"first_try": 0, "healed": 0, "exhausted": 0, "repairs": 0, "timeouts": 0}
+_repair_fixes: dict[str, int] = {}
+
+async def _render_with_repairs(task_id: str, user_id: str, prompt: str, script: str, quality: str, use_image: bool,
+                               preview_paths: list, vetted: bool = False, error: RuntimeError | None = None
+                               ) -> tuple[str, str, list[dict], float]:
+    """
+    Render the sanitized script, repairing and re-rendering it on failure.
+
+    Failures repair_rules recognizes are patched locally; the rest go to the
+    LLM. Repairs stop after settings.heal_max_attempts or once
+    settings.heal_time_budget has passed, and the last error is raised. A
+    RenderTimeout is raised straight away without a repair. Every
+    attempt renders into the same work dir, so manim re-renders only the
+    animations a repair actually changed. `error` starts straight with a
+    repair. Returns (video_path, script, repair log, seconds of the
+    successful render).
+    """
+    work_dir = os.path.join(tempfile.gettempdir(), "movinglines_work", task_id)
+    history: list[dict] = []
+    tried: set[str] = set()  # scripts that already failed; a rule patch that recreates one goes to the LLM
+    started = time.monotonic()
+    try:
+        while True:
+            if error is None:
+                try:
+                    if not vetted:
+                        # Scripts that are certain to crash go straight to repair without a render
+                        await _vet_script(task_id, script)
+                    render_started = time.perf_counter()
+                    video_path = await _render_with_preview(task_id, user_id, script, quality, preview_paths, work_dir)
+                    render_seconds = time.perf_counter() - render_started
+                    break
+                except RenderTimeout:
+                    # Says nothing about the script: no repair, let the caller (or the job queue) decide
+                    _repair_stats["timeouts"] += 1
+                    if history:
+                        history[-1]["outcome"] = "timed_out"
+                    print(f"[{task_id}] Render timed out, not attempting a repair")
+                    raise
+                except RuntimeError as e:
+                    error = e
+
+            if history:
+                history[-1]["outcome"] = "failed"
+            attempt = len(history) + 1
+            if attempt > settings.heal_max_attempts or time.monotonic() - started > settings.heal_time_budget:
+                _repair_stats["exhausted"] += 1
+                print(f"[{task_id}] Giving up after {len(history)} repair attempt(s)")
+                raise error
+
+            error_str = str(error)
+            logger.warning(f"[{task_id}] Attempt {attempt} failed: {error_str[:200]}")
+            print(f"[{task_id}] Attempting self-healing ({attempt}/{settings.heal_max_attempts})...")
+            tried.add(script)
+            # Mechanical failures get a deterministic patch; the LLM only sees the rest
+            patch = repair_rules.repair_script(script, error)
+            if patch is not None and sanitize_script(patch[0]) not in tried:
+                healed, fixed_by = patch[0], f"rule:{'+'.join(patch[1])}"
+                print(f"[{task_id}] Patched locally ({fixed_by})")
             else:
-                img_path = result
-            
-            img_path_escaped = img_path.replace("\\", "/")
-            # Use regex to replace ALL occurrences of this specific placeholder
-            # Escaping the prompt for regex safety
-            placeholder = f"{{{{IMAGE:{re.escape(img_prompt)}}}}}"
-            script = re.sub(placeholder, img_path_escaped, script)
-            
-    return script
+                healed = await generate_improved_code({
+                    'prompt': prompt,
+                    'code': script,
+                    'error': error_str,
+                    'line': repair_rules.failing_line(error_str),
+                    'use_image': use_image,
+                    'history': history,
+                })
+                healed, fixed_by = await _apply_hybrid_images(task_id, healed), "llm"
+            script, rules = ast_sanitizer.sanitize_with_report(healed)
+            history.append({
+                "attempt": attempt,
+                "error": error_str[-1000:],
+                "fixed_by": fixed_by,
+                "sanitizer_rules": sorted(set(rules)),
+                "outcome": "pending",
+            })
+            _repair_stats["repairs"] += 1
+            error, vetted = None, False
 
-async def process_animation(task_id: str, prompt: str, quality: str, duration: int, user_id: str, use_image: bool = False):
+            await update_task_in_db(task_id, {"generated_script": script, "repair_log": history})
+            await manager.broadcast_status(user_id, task_id, "rendering", 55, generated_script=script) # Slight progress bump for retry
+            print(f"[{task_id}] Retrying with improved code...")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if history:
+        history[-1]["outcome"] = "rendered"
+        _repair_stats["healed"] += 1
+        last = history[-1]
+        for fix in [last["fixed_by"], *(f"sanitizer:{r}" for r in last["sanitizer_rules"])]:
+            _repair_fixes[fix] = _repair_fixes.get(fix, 0) + 1
+        print(f"[{task_id}] Repair {last['attempt']} succeeded: {video_path}")
+    else:
+        _repair_stats["first_try"] += 1
+    return video_path, script, history, render_seconds
+
+async def process_animation(task_id: str, prompt: str, quality: str, duration: int, user_id: str, use_image: bool = False,
+                            retryable: bool = False):
+    """
+    Generate, render and upload one animation, reporting progress as it goes.
+
+    With `retryable`, transient failures are recorded on the task and
+    re-raised for the job queue to retry instead of failing the task.
+    """
     import traceback
-    from app.services.video_renderer import sanitize_manim_script
+    preview_paths = []
+    cancellation.register(task_id)
     try:
         print(f"[{task_id}] Starting animation generation flow...")
         
-        update_task_in_db(task_id, {"status": "generating_script", "progress": 20})
+        await update_task_in_db(task_id, {"status": "generating_script", "progress": 20})
         await manager.broadcast_status(user_id, task_id, "generating_script", 20)
         
+        # Near-identical prompt already rendered: reuse its script and video
+        cached = await prompt_cache.lookup(prompt, quality, duration, use_image=use_image)
+        if cached:
+            try:
+                video_url = await clone_video(cached["video_url"], user_id, prompt)
+            except Exception as e:
+                logger.warning(f"[{task_id}] Cached video unusable, generating fresh: {e}")
+                prompt_cache.forget_video(cached["video_url"])
+                cached = None
+        if cached:
+            print(f"[{task_id}] Prompt cache hit ({cached['match']}, similarity={cached['similarity']:.3f})")
+            await deduct_credit(user_id)
+            await update_task_in_db(task_id, {
+                "status": "completed",
+                "progress": 100,
+                "video_url": video_url,
+                "generated_script": cached["script"]
+            })
+            await manager.broadcast_status(user_id, task_id, "completed", 100, video_url=video_url, generated_script=cached["script"])
+            return
+        
         print(f"[{task_id}] Generating Manim script (duration: {duration}s, use_image: {use_image})...")
-        script = await generate_manim_script(prompt, duration, force_image=use_image)
+        streamed = ""
+
+        async def push_partial(partial: str):
+            nonlocal streamed
+            await manager.broadcast_script_delta(user_id, task_id, streamed, partial)
+            streamed = partial
+
+        # Speculative mode vets candidates as they finish; image scripts need their images first, so they don't qualify
+        speculative = settings.speculative_candidates > 1 and not use_image
+        rejected: RuntimeError | None = None
+        if speculative:
+            try:
+                script = await generate_manim_script(
+                    prompt, duration, on_partial=push_partial,
+                    candidates=settings.speculative_candidates, vet=lambda s: _vet_script(task_id, s)
+                )
+            except script_generator.CandidatesFailedError as e:
+                script, rejected = e.script, e
+        else:
+            script = await generate_manim_script(prompt, duration, force_image=use_image, on_partial=push_partial)
         print(f"[{task_id}] Script generated:\n{script[:200]}...")
         
         # --- HYBRID IMAGE INTEGRATION ---
         script = await _apply_hybrid_images(task_id, script)
 
         # Sanitize script for Manim CE 0.18 compatibility and persist what will actually render
-        script_sanitized = sanitize_manim_script(script)
-        update_task_in_db(task_id, {
+        script_sanitized = sanitize_script(script)
+        await update_task_in_db(task_id, {
             "status": "rendering",
             "progress": 50,
             "generated_script": script_sanitized
@@ -258,36 +561,14 @@ async def process_animation(task_id: str, prompt: str, quality: str, duration: i
         
         print(f"[{task_id}] Rendering animation...")
         
-        try:
-            video_path = await render_animation(script_sanitized, quality)
-            print(f"[{task_id}] Video rendered at: {video_path}")
-        except RuntimeError as render_error:
-            error_str = str(render_error)
-            logger.warning(f"[{task_id}] First attempt failed: {error_str[:200]}")
-            
-            # Always attempt self-healing for any rendering error
-            print(f"[{task_id}] Attempting self-healing...")
-            
-            error_context = {
-                'prompt': prompt,
-                'code': script,
-                'error': error_str,
-                'use_image': use_image
-            }
-            
-            script = await generate_improved_code(error_context)
-            # Re-apply hybrid images for the new script
-            script = await _apply_hybrid_images(task_id, script)
-            # Sanitize again and persist
-            script_sanitized = sanitize_manim_script(script)
-            update_task_in_db(task_id, {"generated_script": script_sanitized})
-            await manager.broadcast_status(user_id, task_id, "rendering", 55, generated_script=script_sanitized) # Slight progress bump for retry
-            
-            print(f"[{task_id}] Retrying with improved code...")
-            video_path = await render_animation(script_sanitized, quality)
-            print(f"[{task_id}] Retry successful: {video_path}")
+        video_path, script_sanitized, repair_log, render_seconds = await _render_with_repairs(
+            task_id, user_id, prompt, script_sanitized, quality, use_image, preview_paths,
+            vetted=speculative and rejected is None, error=rejected
+        )
+        retried = bool(repair_log)
+        print(f"[{task_id}] Video rendered at: {video_path}")
         
-        update_task_in_db(task_id, {"status": "uploading", "progress": 80})
+        await update_task_in_db(task_id, {"status": "uploading", "progress": 80})
         await manager.broadcast_status(user_id, task_id, "uploading", 80)
         
         print(f"[{task_id}] Uploading to Supabase...")
@@ -295,20 +576,38 @@ async def process_animation(task_id: str, prompt: str, quality: str, duration: i
         print(f"[{task_id}] Upload complete: {video_url}")
         
         # Deduct credit after successful generation
-        deduct_credit(user_id)
+        await deduct_credit(user_id)
         print(f"[{task_id}] Credit deducted for user {user_id}")
         
-        update_task_in_db(task_id, {
+        # The completed row carries the prompt cache columns, so every process can reuse this video
+        cache_fields = {}
+        if not use_image:
+            cache_fields = await prompt_cache.remember(prompt, quality, duration, script_sanitized, video_url)
+        await update_task_in_db(task_id, {
             "status": "completed",
             "progress": 100,
-            "video_url": video_url
+            "video_url": video_url,
+            **({"repair_log": repair_log} if repair_log else {}),
+            **cache_fields
         })
         await manager.broadcast_status(user_id, task_id, "completed", 100, video_url=video_url, generated_script=script_sanitized)
         
+        if not use_image:
+            # Image scripts point at host-local image files, so only plain scripts become examples
+            harvester.record(task_id, prompt, script_sanitized, render_seconds, retried)
+        
     except Exception as e:
         error_msg = f"{str(e)}\n{traceback.format_exc()}"
         print(f"[{task_id}] ERROR: {error_msg}")
         
+        if retryable and _is_transient(e):
+            # Leave the task open; the queue re-runs the job after its backoff
+            print(f"[{task_id}] Transient failure, handing back to the queue for a retry")
+            retry_note = "Service connection issue, retrying shortly..."
+            await update_task_in_db(task_id, {"status": "processing", "progress": 0, "error_message": retry_note})
+            await manager.broadcast_status(user_id, task_id, "processing", 0, error=retry_note)
+            raise
+        
         # UI-friendly error message
         friendly_error = "Animation failed to render. Please try refining your prompt or try again."
         
@@ -316,21 +615,33 @@ async def process_animation(task_id: str, prompt: str, quality: str, duration: i
         if "ConnectError" in error_msg or "ReadError" in error_msg or "TimeoutError" in error_msg:
             friendly_error = "Service connection issue. Please try again in a few moments."
         
-        update_task_in_db(task_id, {
+        await update_task_in_db(task_id, {
             "status": "failed",
             "error_message": friendly_error
         })
         await manager.broadcast_status(user_id, task_id, "failed", 0, error=friendly_error)
+    except asyncio.CancelledError:
+        # Cancelled on purpose (cancel endpoint, socket event or chat deletion): don't
+        # propagate, or a queue worker would treat the job as crashed and retry it
+        asyncio.current_task().uncancel()
+        print(f"[{task_id}] Cancelled")
+        await update_task_in_db(task_id, {"status": "cancelled", "error_message": "Cancelled by user"})
+        await manager.broadcast_status(user_id, task_id, "cancelled", 0)
     finally:
         # Cleanup
+        cancellation.unregister(task_id)
+        image_generator.forget_task(task_id)
+        if preview_paths:
+            await remove_storage_objects(preview_paths)
         print(f"[{task_id}] Processing complete")
 
 @router.get("/status/{task_id}")
 async def get_task_status(task_id: str):
-    task = get_task_from_db(task_id)
+    task = await get_task_from_db(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
-    return task
+    # Progress buffered in this process but not flushed yet
+    return {**task, **task_progress.pending(task_id)}
 
 @router.get("/videos")
 async def list_videos(user_identity: tuple[str, str] = Depends(get_current_user)):
@@ -339,3 +650,38 @@ async def list_videos(user_identity: tuple[str, str] = Depends(get_current_user)
         return await get_user_videos(user_id)
     except Exception as e:
         return []
+
+def require_stats_token(token: Optional[str]):
+    # Exposes queue, cache and upstream internals; only enabled when a token is configured
+    if not settings.stats_api_token:
+        raise HTTPException(status_code=404, detail="Not found")
+    if token != settings.stats_api_token:
+        raise HTTPException(status_code=403, detail="Invalid stats token")
+
+@router.get("/system/stats")
+async def get_system_stats(x_stats_token: Optional[str] = Header(None)):
+    """Cache and queue counters for monitoring the render pipeline."""
+    require_stats_token(x_stats_token)
+    stats = {
+        "render_cache": render_cache.get_stats(),
+        "prompt_cache": prompt_cache.get_stats(),
+        "task_progress": task_progress.get_stats(),
+        "generation_stages": generation_pipeline.get_stats(),
+        "generation_stream": script_generator.get_stream_stats(),
+        "upstream_clients": client_registry.get_stats(),
+        "embedding_cache": embedding_cache.get_stats(),
+        "harvester": harvester.get_stats(),
+        "sanitizer": ast_sanitizer.get_stats(),
+        "repairs": {**_repair_stats, "fixed_by": dict(_repair_fixes)},
+        "repair_rules": repair_rules.get_stats(),
+        "images": image_generator.get_stats(),
+        "render_pool": get_warm_pool().stats() if settings.render_mode == "warm" else get_render_pool().stats(),
+    }
+    if settings.preflight_enabled:
+        stats["preflight"] = get_preflight_stats()
+    if settings.vector_backend == "local":
+        from app.services.local_index import get_local_index
+        stats["vector_index"] = get_local_index().stats()
+    if settings.job_queue_enabled:
+        stats["job_queue"] = await JobQueue(settings.job_queue_name).stats()
+    return stats
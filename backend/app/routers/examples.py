@@ -0,0 +1,47 @@
+from fastapi import APIRouter, HTTPException, Header
+from pydantic import BaseModel
+from typing import Optional, List
+
+from app.services import ingestion
+from app.config import get_settings
+
+settings = get_settings()
+
+router = APIRouter()
+
+class ExampleIn(BaseModel):
+    id: Optional[str] = None
+    description: str
+    code: str
+    source: Optional[str] = None
+
+class IngestRequest(BaseModel):
+    examples: List[ExampleIn]
+    force: bool = False
+
+def require_ingest_token(token: Optional[str]):
+    # Ingestion writes to the shared RAG index; only enabled when a token is configured
+    if not settings.ingest_api_token:
+        raise HTTPException(status_code=404, detail="Not found")
+    if token != settings.ingest_api_token:
+        raise HTTPException(status_code=403, detail="Invalid ingest token")
+
+@router.post("/ingest")
+async def ingest_examples(request: IngestRequest, x_ingest_token: Optional[str] = Header(None)):
+    """Start a bulk ingestion run; unchanged examples are skipped by content hash"""
+    require_ingest_token(x_ingest_token)
+    examples = [e for item in request.examples for e in ingestion.normalize_example(item.model_dump())]
+    try:
+        run_id = ingestion.start_run(examples, force=request.force)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"run_id": run_id, "examples": len(examples)}
+
+@router.get("/ingest/{run_id}")
+async def get_ingest_run(run_id: str, x_ingest_token: Optional[str] = Header(None)):
+    """Progress of an ingestion run"""
+    require_ingest_token(x_ingest_token)
+    run = ingestion.get_run(run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return run
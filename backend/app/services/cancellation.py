@@ -0,0 +1,80 @@
+"""
+Cancellation of in-flight animation tasks.
+
+Each running `process_animation` registers its asyncio task here. Cancelling
+it interrupts whatever it is awaiting: a pending LLM call, the render pool
+(which kills the Manim process group) or an upload. Temp dirs are freed by
+the renderer's own cleanup.
+
+When jobs run in queue workers, cancel requests are published over Redis so
+whichever process owns the task can stop it, and a short-lived marker makes
+workers skip jobs that were cancelled before being claimed.
+"""
+import asyncio
+import logging
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+CANCEL_CHANNEL = "movinglines:cancel"
+CANCEL_MARKER_TTL = 24 * 3600
+
+_tasks: dict[str, asyncio.Task] = {}
+
+
+def _marker_key(task_id: str) -> str:
+    return f"movinglines:cancelled:{task_id}"
+
+
+def register(task_id: str):
+    """Associate the current asyncio task with an animation task id."""
+    task = asyncio.current_task()
+    if task is not None:
+        _tasks[task_id] = task
+
+
+def unregister(task_id: str):
+    _tasks.pop(task_id, None)
+
+
+def cancel_local(task_id: str) -> bool:
+    task = _tasks.get(task_id)
+    if task is None or task.done():
+        return False
+    logger.info(f"[Cancel] Cancelling task {task_id}")
+    task.cancel()
+    return True
+
+
+async def request_cancel(task_id: str) -> bool:
+    """Cancel a task wherever it runs. Returns True if it was running in this process."""
+    cancelled_here = cancel_local(task_id)
+    if settings.job_queue_enabled:
+        from app.services.job_queue import get_redis
+        redis = get_redis()
+        await redis.set(_marker_key(task_id), "1", ex=CANCEL_MARKER_TTL)
+        await redis.publish(CANCEL_CHANNEL, task_id)
+    return cancelled_here
+
+
+async def is_cancelled(task_id: str) -> bool:
+    """True if a cancel was requested before this process picked the job up."""
+    if not settings.job_queue_enabled:
+        return False
+    from app.services.job_queue import get_redis
+    return bool(await get_redis().exists(_marker_key(task_id)))
+
+
+async def listen_for_cancellations():
+    """Run in queue workers: cancel local tasks when any process requests it."""
+    from app.services.job_queue import get_redis
+    pubsub = get_redis().pubsub()
+    await pubsub.subscribe(CANCEL_CHANNEL)
+    try:
+        async for message in pubsub.listen():
+            if message.get("type") == "message":
+                cancel_local(message["data"])
+    finally:
+        await pubsub.unsubscribe(CANCEL_CHANNEL)
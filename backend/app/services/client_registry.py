@@ -0,0 +1,185 @@
+"""
+Process-wide registry of upstream API clients.
+
+Constructing a Gemini chat model, embeddings client or genai.Client opens a
+fresh channel (TLS handshake, HTTP/2 setup, auth) every time. The registry
+builds each client once per process and hands out the shared instance, so
+connections stay warm across requests. Calls to each upstream go through a
+semaphore sized from settings, which keeps one busy upstream from piling up
+hundreds of concurrent requests, and every call is counted for
+/system/stats.
+"""
+import asyncio
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from functools import lru_cache
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+LLM_MODEL = "gemini-2.5-flash"
+EMBEDDING_MODEL = "models/gemini-embedding-001"
+
+
+class Upstream:
+    """Concurrency limit and call counters for one upstream service."""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self._async_slots = asyncio.Semaphore(limit)
+        # Blocking SDK calls made from worker threads get their own budget
+        self._thread_slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self.clients_created = 0
+        self.calls = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.waited = 0
+        self.total_ms = 0.0
+
+    def _start(self, waited: bool) -> float:
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            if waited:
+                self.waited += 1
+        return time.perf_counter()
+
+    def _finish(self, start: float, failed: bool):
+        with self._lock:
+            self.in_flight -= 1
+            self.total_ms += (time.perf_counter() - start) * 1000
+            if failed:
+                self.errors += 1
+
+    @asynccontextmanager
+    async def slot(self):
+        waited = self._async_slots.locked()
+        async with self._async_slots:
+            start = self._start(waited)
+            failed = True
+            try:
+                yield
+                failed = False
+            finally:
+                self._finish(start, failed)
+
+    @contextmanager
+    def thread_slot(self):
+        waited = not self._thread_slots.acquire(blocking=False)
+        if waited:
+            self._thread_slots.acquire()
+        try:
+            start = self._start(waited)
+            failed = True
+            try:
+                yield
+                failed = False
+            finally:
+                self._finish(start, failed)
+        finally:
+            self._thread_slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "clients_created": self.clients_created,
+            "calls": self.calls,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "waited_for_slot": self.waited,
+            "avg_ms": round(self.total_ms / self.calls, 1) if self.calls else 0.0,
+        }
+
+
+_upstreams = {
+    "gemini": Upstream("gemini", settings.llm_max_concurrency),
+    "embeddings": Upstream("embeddings", settings.embedding_max_concurrency),
+    "imagen": Upstream("imagen", settings.imagen_max_concurrency),
+}
+
+
+def upstream(name: str) -> Upstream:
+    return _upstreams[name]
+
+
+class BoundedChatModel:
+    """Shared chat model whose async calls respect the gemini concurrency limit."""
+
+    def __init__(self, model):
+        self._model = model
+
+    async def ainvoke(self, *args, **kwargs):
+        async with _upstreams["gemini"].slot():
+            return await self._model.ainvoke(*args, **kwargs)
+
+    async def astream(self, *args, **kwargs):
+        async with _upstreams["gemini"].slot():
+            async for chunk in self._model.astream(*args, **kwargs):
+                yield chunk
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+
+class BoundedEmbeddings:
+    """Shared embeddings client whose calls respect the embeddings concurrency limit."""
+
+    def __init__(self, embeddings):
+        self._embeddings = embeddings
+
+    def embed_query(self, text: str, **kwargs) -> list[float]:
+        with _upstreams["embeddings"].thread_slot():
+            return self._embeddings.embed_query(text, **kwargs)
+
+    def embed_documents(self, texts: list[str], **kwargs) -> list[list[float]]:
+        with _upstreams["embeddings"].thread_slot():
+            return self._embeddings.embed_documents(texts, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._embeddings, name)
+
+
+@lru_cache(maxsize=8)
+def get_chat_model(temperature: float = 0.6) -> BoundedChatModel:
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    _upstreams["gemini"].clients_created += 1
+    logger.info(f"[Clients] Creating shared chat model {LLM_MODEL} (temperature={temperature})")
+    return BoundedChatModel(ChatGoogleGenerativeAI(
+        model=LLM_MODEL,
+        google_api_key=settings.google_api_key,
+        temperature=temperature
+    ))
+
+
+@lru_cache()
+def get_embeddings_client() -> BoundedEmbeddings:
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    _upstreams["embeddings"].clients_created += 1
+    logger.info(f"[Clients] Creating shared embeddings client {EMBEDDING_MODEL}")
+    return BoundedEmbeddings(GoogleGenerativeAIEmbeddings(
+        model=EMBEDDING_MODEL,
+        google_api_key=settings.google_api_key
+    ))
+
+
+@lru_cache()
+def get_genai_client():
+    from google import genai
+    _upstreams["imagen"].clients_created += 1
+    # Use separate Imagen key if provided, otherwise fallback to main Google key
+    api_key = settings.imagen_api_key or settings.google_api_key
+    logger.info("[Clients] Creating shared genai client")
+    return genai.Client(api_key=api_key)
+
+
+def get_stats() -> dict:
+    return {name: u.stats() for name, u in _upstreams.items()}
@@ -1,28 +1,75 @@
 import os
 import uuid
 import jwt
+import aiofiles
+import httpx
 from datetime import datetime, timezone
 from fastapi import HTTPException, Header
 from supabase import create_client, Client
+from postgrest import AsyncPostgrestClient
+from storage3 import AsyncStorageClient
 from dotenv import load_dotenv
 
+from app.config import get_settings
+
 load_dotenv()
+settings = get_settings()
 
 _supabase_client: Client = None
+_async_supabase = None
 
 def get_supabase() -> Client:
     global _supabase_client
     if _supabase_client is None:
-        url = os.getenv("SUPABASE_URL", "")
-        if url and not url.endswith("/"):
-            url += "/"
-        key = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("SUPABASE_KEY") or os.getenv("SUPABASE_ANON_KEY")
-        if url and key:
-            _supabase_client = create_client(url, key)
-        else:
-            raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY (or ANON_KEY) must be set")
+        _supabase_client = create_client(*_supabase_credentials())
     return _supabase_client
 
+def _supabase_credentials() -> tuple[str, str]:
+    url = os.getenv("SUPABASE_URL", "")
+    if url and not url.endswith("/"):
+        url += "/"
+    key = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("SUPABASE_KEY") or os.getenv("SUPABASE_ANON_KEY")
+    if not (url and key):
+        raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY (or ANON_KEY) must be set")
+    return url, key
+
+def _pooled_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=settings.supabase_pool_size,
+            max_keepalive_connections=settings.supabase_pool_size,
+            keepalive_expiry=settings.supabase_keepalive,
+        ),
+        timeout=httpx.Timeout(settings.supabase_timeout),
+        follow_redirects=True,
+        http2=True,
+    )
+
+class AsyncSupabase:
+    """
+    Non-blocking PostgREST + Storage access over pooled keep-alive connections.
+
+    Each sub-client gets its own httpx pool because the postgrest/storage3
+    clients rebind the base_url of the http client they are given.
+    """
+
+    def __init__(self, url: str, key: str):
+        headers = {"apikey": key, "Authorization": f"Bearer {key}"}
+        self.postgrest = AsyncPostgrestClient(f"{url}rest/v1", headers=headers, http_client=_pooled_http_client())
+        self.storage = AsyncStorageClient(f"{url}storage/v1/", headers, http_client=_pooled_http_client())
+
+    def table(self, name: str):
+        return self.postgrest.from_(name)
+
+    def rpc(self, fn: str, params: dict):
+        return self.postgrest.rpc(fn, params)
+
+def get_async_supabase() -> AsyncSupabase:
+    global _async_supabase
+    if _async_supabase is None:
+        _async_supabase = AsyncSupabase(*_supabase_credentials())
+    return _async_supabase
+
 async def get_current_user(authorization: str = Header(None)) -> tuple[str, str]:
     """Extract and validate user ID and email from JWT token."""
     if not authorization:
@@ -50,11 +97,11 @@ async def ensure_user_exists(user_id: str, email: str = None) -> bool:
     Ensure user exists in public.users table, creating if necessary.
     Uses a robust check-then-create pattern to handle race conditions.
     """
-    client = get_supabase()
+    client = get_async_supabase()
     
     try:
         # 1. Check if user already exists (by ID)
-        result = client.table("users").select("id, email").eq("id", user_id).execute()
+        result = await client.table("users").select("id, email").eq("id", user_id).execute()
         if result.data:
             return True
         
@@ -64,7 +111,7 @@ async def ensure_user_exists(user_id: str, email: str = None) -> bool:
         # 3. Handle Email Conflicts
         # Check if this email is already taken by another user
         if email:
-            email_check = client.table("users").select("id").eq("email", email).execute()
+            email_check = await client.table("users").select("id").eq("email", email).execute()
             if email_check.data and email_check.data[0]['id'] != user_id:
                 # Email is taken by someone else - we must use a fallback to satisfy UNIQUE
                 print(f"[Supabase] Email conflict for {email}. Using safe alternative.")
@@ -74,7 +121,7 @@ async def ensure_user_exists(user_id: str, email: str = None) -> bool:
         # We wrapped this in a try/except because even with checks, 
         # a concurrent request could insert the same record.
         try:
-            client.table("users").insert({
+            await client.table("users").insert({
                 "id": user_id,
                 "email": safe_email,
                 "credits": 2, 
@@ -94,27 +141,27 @@ async def ensure_user_exists(user_id: str, email: str = None) -> bool:
         return False
 
 
-def get_user_credits(user_id: str) -> int:
+async def get_user_credits(user_id: str) -> int:
     """Get the current credit balance for a user."""
-    client = get_supabase()
-    result = client.table("users").select("credits").eq("id", user_id).single().execute()
+    client = get_async_supabase()
+    result = await client.table("users").select("credits").eq("id", user_id).single().execute()
     if result.data:
         return result.data.get("credits", 0)
     return 0
 
 
-def deduct_credit(user_id: str) -> bool:
+async def deduct_credit(user_id: str) -> bool:
     """
     Atomically deduct 1 credit from user using conditional UPDATE.
     Uses WHERE credits > 0 to prevent negative credits and race conditions.
     Returns True if successful, False if no credits available.
     """
-    client = get_supabase()
+    client = get_async_supabase()
     
     try:
         # Use Supabase's RPC to run an atomic UPDATE that only succeeds if credits > 0
         # This is a single SQL statement that cannot be raced
-        result = client.rpc('deduct_user_credit', {'p_user_id': user_id}).execute()
+        result = await client.rpc('deduct_user_credit', {'p_user_id': user_id}).execute()
         
         # RPC returns the number of affected rows (1 if deducted, 0 if no credits)
         if result.data and result.data > 0:
@@ -125,12 +172,12 @@ def deduct_credit(user_id: str) -> bool:
         print(f"[Credits] RPC failed, using fallback: {e}")
         
         # Get current credits first
-        current = get_user_credits(user_id)
+        current = await get_user_credits(user_id)
         if current <= 0:
             return False
         
         # Update with WHERE condition to prevent concurrent double-spend
-        result = client.table("users").update({
+        result = await client.table("users").update({
             "credits": current - 1,
             "updated_at": datetime.now(timezone.utc).isoformat()
         }).eq("id", user_id).gte("credits", current).execute()
@@ -140,7 +187,7 @@ def deduct_credit(user_id: str) -> bool:
 
 async def upload_video(video_path: str, user_id: str, prompt: str) -> str:
     """Upload video to Supabase storage and save metadata."""
-    client = get_supabase()
+    client = get_async_supabase()
     bucket = os.getenv("SUPABASE_BUCKET", "manim-videos")
     
     # Ensure user exists in public.users
@@ -151,22 +198,23 @@ async def upload_video(video_path: str, user_id: str, prompt: str) -> str:
     
     # Upload to storage
     try:
-        with open(video_path, "rb") as f:
-            client.storage.from_(bucket).upload(
-                path=file_name,
-                file=f,
-                file_options={"content-type": "video/mp4"}
-            )
+        async with aiofiles.open(video_path, "rb") as f:
+            data = await f.read()
+        await client.storage.from_(bucket).upload(
+            path=file_name,
+            file=data,
+            file_options={"content-type": "video/mp4"}
+        )
     except Exception as e:
         if "Expecting value" in str(e):
             raise RuntimeError(f"Upload failed - check bucket '{bucket}' exists and has correct permissions")
         raise e
     
     # Get public URL
-    video_url = client.storage.from_(bucket).get_public_url(file_name)
+    video_url = await client.storage.from_(bucket).get_public_url(file_name)
     
     # Save metadata to database
-    client.table("videos").insert({
+    await client.table("videos").insert({
         "id": video_id,
         "user_id": user_id,
         "prompt": prompt,
@@ -177,12 +225,66 @@ async def upload_video(video_path: str, user_id: str, prompt: str) -> str:
     
     return video_url
 
-def create_chat_in_db(user_id: str, title: str) -> str:
+async def upload_preview(video_path: str, user_id: str) -> tuple[str, str]:
+    """Upload a throwaway preview render. Returns (public_url, bucket_path); no metadata row is saved."""
+    client = get_async_supabase()
+    bucket = os.getenv("SUPABASE_BUCKET", "manim-videos")
+    
+    file_name = f"{user_id}/previews/{uuid.uuid4()}.mp4"
+    async with aiofiles.open(video_path, "rb") as f:
+        data = await f.read()
+    await client.storage.from_(bucket).upload(
+        path=file_name,
+        file=data,
+        file_options={"content-type": "video/mp4"}
+    )
+    
+    return await client.storage.from_(bucket).get_public_url(file_name), file_name
+
+async def remove_storage_objects(bucket_paths: list[str]):
+    """Best-effort removal of storage objects (e.g. previews superseded by the final video)."""
+    client = get_async_supabase()
+    bucket = os.getenv("SUPABASE_BUCKET", "manim-videos")
+    try:
+        await client.storage.from_(bucket).remove(bucket_paths)
+    except Exception as e:
+        print(f"[Cleanup] Failed to remove storage objects {bucket_paths}: {e}")
+
+async def clone_video(source_url: str, user_id: str, prompt: str) -> str:
+    """Copy an existing video into the user's storage folder and save metadata.
+
+    Each user gets their own object so deleting one chat never removes a
+    video another user is still looking at.
+    """
+    client = get_async_supabase()
+    bucket = os.getenv("SUPABASE_BUCKET", "manim-videos")
+
+    source = await client.table("videos").select("bucket_path").eq("video_url", source_url).limit(1).execute()
+    if not source.data or not source.data[0].get("bucket_path"):
+        raise RuntimeError(f"Source video not found: {source_url}")
+
+    video_id = str(uuid.uuid4())
+    file_name = f"{user_id}/{video_id}.mp4"
+    await client.storage.from_(bucket).copy(source.data[0]["bucket_path"], file_name)
+
+    video_url = await client.storage.from_(bucket).get_public_url(file_name)
+    await client.table("videos").insert({
+        "id": video_id,
+        "user_id": user_id,
+        "prompt": prompt,
+        "video_url": video_url,
+        "bucket_path": file_name,
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }).execute()
+
+    return video_url
+
+async def create_chat_in_db(user_id: str, title: str) -> str:
     """Create a new chat session."""
-    client = get_supabase()
+    client = get_async_supabase()
     chat_id = str(uuid.uuid4())
     
-    client.table("chats").insert({
+    await client.table("chats").insert({
         "id": chat_id,
         "user_id": user_id,
         "title": title,
@@ -192,24 +294,24 @@ def create_chat_in_db(user_id: str, title: str) -> str:
     
     return chat_id
 
-def get_user_chats_from_db(user_id: str):
+async def get_user_chats_from_db(user_id: str):
     """Get all chats for a user."""
-    client = get_supabase()
-    result = client.table("chats").select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
+    client = get_async_supabase()
+    result = await client.table("chats").select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
     return result.data
 
 async def delete_chat_from_db(chat_id: str, user_id: str) -> bool:
     """Delete a chat session and ALL its associated resources (tasks, videos, storage)."""
-    client = get_supabase()
+    client = get_async_supabase()
     bucket = os.getenv("SUPABASE_BUCKET", "manim-videos")
     
     # 1. Verify ownership and fetch chat
-    chat = client.table("chats").select("*").eq("id", chat_id).eq("user_id", user_id).single().execute()
+    chat = await client.table("chats").select("*").eq("id", chat_id).eq("user_id", user_id).single().execute()
     if not chat.data:
         raise HTTPException(status_code=404, detail="Chat not found")
     
     # 2. Fetch all tasks associated with this chat
-    tasks_res = client.table("tasks").select("*").eq("chat_id", chat_id).execute()
+    tasks_res = await client.table("tasks").select("*").eq("chat_id", chat_id).execute()
     tasks = tasks_res.data or []
     
     # 3. Cleanup videos and storage for each task
@@ -217,72 +319,72 @@ async def delete_chat_from_db(chat_id: str, user_id: str) -> bool:
         video_url = task.get("video_url")
         if video_url:
             # Find the video record to get the bucket path
-            video_res = client.table("videos").select("*").eq("video_url", video_url).eq("user_id", user_id).execute()
+            video_res = await client.table("videos").select("*").eq("video_url", video_url).eq("user_id", user_id).execute()
             if video_res.data:
                 for video_rec in video_res.data:
                     bucket_path = video_rec.get("bucket_path")
                     if bucket_path:
                         try:
                             # Delete from storage
-                            client.storage.from_(bucket).remove([bucket_path])
+                            await client.storage.from_(bucket).remove([bucket_path])
                             print(f"[Cleanup] Deleted storage file: {bucket_path}")
                         except Exception as e:
                             print(f"[Cleanup] Failed to delete storage file {bucket_path}: {e}")
                     
                     # Delete the video record
-                    client.table("videos").delete().eq("id", video_rec["id"]).execute()
+                    await client.table("videos").delete().eq("id", video_rec["id"]).execute()
                     print(f"[Cleanup] Deleted video record: {video_rec['id']}")
 
     # 4. Delete all tasks for this chat
-    client.table("tasks").delete().eq("chat_id", chat_id).execute()
+    await client.table("tasks").delete().eq("chat_id", chat_id).execute()
     print(f"[Cleanup] Deleted all tasks for chat: {chat_id}")
     
     # 5. Delete the chat itself
-    client.table("chats").delete().eq("id", chat_id).execute()
+    await client.table("chats").delete().eq("id", chat_id).execute()
     print(f"[Cleanup] Deleted chat record: {chat_id}")
     
     return True
 
-def get_chat_tasks_from_db(chat_id: str, user_id: str):
+async def get_chat_tasks_from_db(chat_id: str, user_id: str):
     """Get all tasks for a specific chat."""
-    client = get_supabase()
+    client = get_async_supabase()
     
     # Verify ownership
-    chat = client.table("chats").select("id").eq("id", chat_id).eq("user_id", user_id).single().execute()
+    chat = await client.table("chats").select("id").eq("id", chat_id).eq("user_id", user_id).single().execute()
     if not chat.data:
         raise HTTPException(status_code=404, detail="Chat not found")
 
     # Fetch tasks
-    result = client.table("tasks").select("*").eq("chat_id", chat_id).order("created_at", desc=True).execute()
+    result = await client.table("tasks").select("*").eq("chat_id", chat_id).order("created_at", desc=True).execute()
     return result.data
 
 async def get_user_videos(user_id: str) -> list:
     """Get all videos for a user."""
-    client = get_supabase()
+    client = get_async_supabase()
     
     print(f"[Supabase] Fetching videos for User ID: {user_id}")
     
-    response = client.table("videos").select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
+    response = await client.table("videos").select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
     
     print(f"[Supabase] Found {len(response.data)} videos")
     return response.data
 
 async def delete_video(video_id: str, user_id: str) -> bool:
     """Delete a video from storage and database."""
-    client = get_supabase()
+    client = get_async_supabase()
     bucket = os.getenv("SUPABASE_BUCKET", "manim-videos")
     
     # Verify ownership
-    video = client.table("videos").select("*").eq("id", video_id).eq("user_id", user_id).single().execute()
+    video = await client.table("videos").select("*").eq("id", video_id).eq("user_id", user_id).single().execute()
     
     if not video.data:
         raise HTTPException(status_code=404, detail="Video not found")
     
     # Delete from storage
     file_name = f"{user_id}/{video_id}.mp4"
-    client.storage.from_(bucket).remove([file_name])
+    await client.storage.from_(bucket).remove([file_name])
     
     # Delete from database
-    client.table("videos").delete().eq("id", video_id).execute()
+    await client.table("videos").delete().eq("id", video_id).execute()
     
     return True
@@ -0,0 +1,117 @@
+"""
+Size-bounded LRU index for a directory of cached files.
+
+The render and image caches keep their entries as plain files. Their sizes
+and last-use times are tracked in a small sqlite file inside the cache
+directory, so a store or a stats call costs a few indexed queries instead of
+walking and stat-ing the whole tree. The index is shared by every process on
+the host. Each process walks the directory once, when it first opens the
+index, to pick up files it doesn't know about and drop rows whose file is
+gone.
+
+Calls are blocking (file and sqlite I/O); run them off the event loop.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "lru_index.sqlite3"
+EVICT_BATCH = 100
+
+
+class DiskLRU:
+    """LRU bookkeeping for the files ending in `suffix` under `directory`."""
+
+    def __init__(self, directory: str, suffix: str, max_bytes: int):
+        self.directory = directory
+        self.suffix = suffix
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+
+    def _rel(self, path: str) -> str:
+        return os.path.relpath(path, self.directory)
+
+    def _get_db(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(self.directory, exist_ok=True)
+            db = sqlite3.connect(os.path.join(self.directory, INDEX_FILE), check_same_thread=False, timeout=10)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS entries (path TEXT PRIMARY KEY, size INTEGER NOT NULL, used_at REAL NOT NULL)")
+            db.execute("CREATE INDEX IF NOT EXISTS entries_used_at_idx ON entries(used_at)")
+            db.commit()
+            self._db = db
+            self._scan()
+        return self._db
+
+    def _scan(self):
+        """Reconcile the index with the files actually on disk."""
+        found = {}
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(self.suffix):
+                    continue
+                full = os.path.join(root, name)
+                try:
+                    st = os.stat(full)
+                except FileNotFoundError:
+                    continue
+                found[self._rel(full)] = (st.st_size, st.st_mtime)
+        known = {path for (path,) in self._db.execute("SELECT path FROM entries")}
+        self._db.executemany(
+            "INSERT OR IGNORE INTO entries (path, size, used_at) VALUES (?, ?, ?)",
+            [(path, size, mtime) for path, (size, mtime) in found.items() if path not in known]
+        )
+        self._db.executemany("DELETE FROM entries WHERE path = ?", [(path,) for path in known - found.keys()])
+        self._db.commit()
+        logger.info(f"[DiskLRU] Indexed {len(found)} files in {self.directory}")
+
+    def touch(self, path: str):
+        """Mark an entry as just used."""
+        with self._lock:
+            db = self._get_db()
+            db.execute("UPDATE entries SET used_at = ? WHERE path = ?", (time.time(), self._rel(path)))
+            db.commit()
+
+    def add(self, path: str):
+        """Record a file that was just written, then evict down to the size budget."""
+        size = os.path.getsize(path)
+        with self._lock:
+            db = self._get_db()
+            db.execute(
+                "INSERT OR REPLACE INTO entries (path, size, used_at) VALUES (?, ?, ?)",
+                (self._rel(path), size, time.time())
+            )
+            db.commit()
+            self._evict(db)
+
+    def _evict(self, db: sqlite3.Connection):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        while total > self.max_bytes:
+            rows = db.execute("SELECT path, size FROM entries ORDER BY used_at LIMIT ?", (EVICT_BATCH,)).fetchall()
+            if not rows:
+                break
+            dropped = []
+            for path, size in rows:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.directory, path))
+                    self.evictions += 1
+                except FileNotFoundError:
+                    pass
+                dropped.append((path,))
+                total -= size
+            db.executemany("DELETE FROM entries WHERE path = ?", dropped)
+            db.commit()
+
+    def totals(self) -> tuple[int, int]:
+        """(entries, bytes) currently indexed."""
+        with self._lock:
+            count, size = self._get_db().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return count, size
@@ -0,0 +1,164 @@
+"""
+Cache of text embeddings.
+
+The same text gets embedded over and over: the prompt at generation time and
+again in every self-heal, the prompt cache lookup, and repeated prompts
+across users. Vectors are kept in an in-memory LRU keyed on the normalized
+text, task type and embedding model, and optionally written through to a
+sqlite file (`settings.embedding_cache_path`) so they survive restarts and
+are shared by every process on the host.
+
+Calls are blocking (they may hit the embeddings API); run them off the event
+loop.
+"""
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from app.config import get_settings
+from app.services.client_registry import EMBEDDING_MODEL, get_embeddings_client
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+_memory: OrderedDict[str, np.ndarray] = OrderedDict()
+_lock = threading.Lock()
+_db: sqlite3.Connection | None = None
+_writes_since_trim = 0
+TRIM_EVERY = 500
+_stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "api_calls": 0}
+
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+def _key(text: str, task_type: str) -> str:
+    raw = f"{EMBEDDING_MODEL}\0{task_type}\0{normalize_text(text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _get_db() -> sqlite3.Connection | None:
+    global _db
+    if not settings.embedding_cache_path:
+        return None
+    if _db is None:
+        os.makedirs(os.path.dirname(os.path.abspath(settings.embedding_cache_path)), exist_ok=True)
+        _db = sqlite3.connect(settings.embedding_cache_path, check_same_thread=False, timeout=10)
+        _db.execute("PRAGMA journal_mode=WAL")
+        _db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, used_at REAL NOT NULL)"
+        )
+        _db.execute("CREATE INDEX IF NOT EXISTS embeddings_used_at_idx ON embeddings(used_at)")
+        _db.commit()
+    return _db
+
+
+def _remember(key: str, vector: np.ndarray):
+    _memory[key] = vector
+    _memory.move_to_end(key)
+    while len(_memory) > settings.embedding_cache_max_entries:
+        _memory.popitem(last=False)
+        _stats["evictions"] += 1
+
+
+def _lookup(keys: list[str]) -> dict[str, np.ndarray]:
+    found = {}
+    with _lock:
+        for key in keys:
+            vector = _memory.get(key)
+            if vector is not None:
+                _memory.move_to_end(key)
+                found[key] = vector
+        _stats["memory_hits"] += len(found)
+
+        missing = [k for k in keys if k not in found]
+        db = _get_db()
+        if db is not None and missing:
+            rows = []
+            # Stay under sqlite's bound-parameter limit
+            for start in range(0, len(missing), 500):
+                chunk = missing[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows += db.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk).fetchall()
+            for key, blob in rows:
+                vector = np.frombuffer(blob, dtype=np.float32)
+                found[key] = vector
+                _remember(key, vector)
+            if rows:
+                _stats["disk_hits"] += len(rows)
+                db.executemany("UPDATE embeddings SET used_at = ? WHERE key = ?", [(time.time(), k) for k, _ in rows])
+                db.commit()
+    return found
+
+
+def _store(items: dict[str, np.ndarray]):
+    global _writes_since_trim
+    with _lock:
+        for key, vector in items.items():
+            _remember(key, vector)
+        db = _get_db()
+        if db is None:
+            return
+        now = time.time()
+        db.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector, used_at) VALUES (?, ?, ?)",
+            [(key, vector.tobytes(), now) for key, vector in items.items()]
+        )
+        # Spill file is bounded too: every so often drop the least recently used rows
+        _writes_since_trim += len(items)
+        if _writes_since_trim >= TRIM_EVERY:
+            _writes_since_trim = 0
+            db.execute(
+                "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (settings.embedding_cache_disk_max_entries,)
+            )
+        db.commit()
+
+
+def embed(texts: list[str], task_type: str = "retrieval_query") -> list[list[float]]:
+    """Embed `texts`, calling the API once for all cache misses."""
+    keys = [_key(t, task_type) for t in texts]
+    found = _lookup(list(dict.fromkeys(keys)))
+
+    # Unique missing texts, in first-seen order
+    missing: dict[str, str] = {}
+    for key, text in zip(keys, texts):
+        if key not in found and key not in missing:
+            missing[key] = normalize_text(text)
+    if missing:
+        _stats["misses"] += len(missing)
+        _stats["api_calls"] += 1
+        client = get_embeddings_client()
+        miss_texts = list(missing.values())
+        if len(miss_texts) == 1 and task_type == "retrieval_query":
+            vectors = [client.embed_query(miss_texts[0])]
+        else:
+            vectors = client.embed_documents(miss_texts, task_type=task_type)
+        fresh = {key: np.asarray(v, dtype=np.float32) for key, v in zip(missing, vectors)}
+        _store(fresh)
+        found.update(fresh)
+
+    return [found[key].tolist() for key in keys]
+
+
+def embed_one(text: str, task_type: str = "retrieval_query") -> list[float]:
+    return embed([text], task_type)[0]
+
+
+def get_stats() -> dict:
+    lookups = _stats["memory_hits"] + _stats["disk_hits"] + _stats["misses"]
+    hits = _stats["memory_hits"] + _stats["disk_hits"]
+    return {
+        **_stats,
+        "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+        "memory_entries": len(_memory),
+        "disk_enabled": bool(settings.embedding_cache_path),
+    }
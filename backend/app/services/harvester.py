@@ -0,0 +1,238 @@
+"""
+Harvests successfully rendered scripts into the RAG corpus.
+
+Our own successful renders are the closest examples to what users ask for.
+`process_animation` reports each completed render here. Candidates are
+scored: a first-attempt success counts fully, one that needed self-healing
+counts half, and long renders score lower. Candidates are deduplicated by a
+structural AST fingerprint, so scripts that differ only in text, numbers or
+formatting are stored once. Every `settings.harvest_interval` seconds they
+are upserted into the vector store in one batch and recorded in the
+`harvested_examples` table.
+
+Processes started with `start(revalidate=True)` (the queue workers, or the
+API when there is no queue) also re-validate entries harvested under an older
+Manim version by re-rendering them at low quality. Each row is claimed with a
+conditional update first, so concurrent processes never render the same one.
+Entries that fail with a Manim traceback are removed from the index and marked
+expired; timeouts and crashed renders are inconclusive and just release the
+claim.
+"""
+import ast
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from importlib import metadata
+
+from app.config import get_settings
+from app.services.database_service import get_async_supabase
+from app.services.vector_store import upsert_examples, delete_examples
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+_buffer: dict[str, dict] = {}
+_loop_task: asyncio.Task | None = None
+_revalidating = False
+_stats = {"recorded": 0, "low_score": 0, "duplicates": 0, "harvested": 0,
+          "revalidated": 0, "expired": 0, "inconclusive": 0, "errors": 0}
+
+
+def manim_version() -> str:
+    try:
+        return metadata.version("manim")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+class _Canonicalize(ast.NodeTransformer):
+    """Blank out literals and docstrings so only the program structure remains."""
+
+    def visit_Constant(self, node: ast.Constant):
+        return ast.copy_location(ast.Constant(value=type(node.value).__name__), node)
+
+    def visit_JoinedStr(self, node: ast.JoinedStr):
+        return ast.copy_location(ast.Constant(value="str"), node)
+
+    def _strip_docstring(self, node):
+        body = node.body
+        if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) \
+                and isinstance(body[0].value.value, str):
+            node.body = body[1:] or [ast.Pass()]
+        return self.generic_visit(node)
+
+    visit_Module = visit_ClassDef = visit_FunctionDef = visit_AsyncFunctionDef = _strip_docstring
+
+
+def ast_fingerprint(script: str) -> str | None:
+    """Structural hash of the script, or None if it doesn't parse."""
+    try:
+        tree = _Canonicalize().visit(ast.parse(script))
+    except SyntaxError:
+        return None
+    return hashlib.sha256(ast.dump(tree, annotate_fields=False).encode("utf-8")).hexdigest()
+
+
+def score(render_seconds: float, retried: bool) -> float:
+    base = 0.5 if retried else 1.0
+    return round(base / (1.0 + render_seconds / settings.harvest_render_seconds_ref), 3)
+
+
+def record(task_id: str, prompt: str, script: str, render_seconds: float, retried: bool):
+    """Queue a successful render as a corpus candidate."""
+    if not settings.harvest_enabled:
+        return
+    _stats["recorded"] += 1
+    s = score(render_seconds, retried)
+    if s < settings.harvest_min_score:
+        _stats["low_score"] += 1
+        return
+    fingerprint = ast_fingerprint(script)
+    if fingerprint is None:
+        return
+    current = _buffer.get(fingerprint)
+    if current is not None:
+        _stats["duplicates"] += 1
+        if current["score"] >= s:
+            return
+    _buffer[fingerprint] = {
+        "fingerprint": fingerprint,
+        "vector_id": f"harvest-{fingerprint[:24]}",
+        "task_id": task_id,
+        "prompt": prompt,
+        "script": script,
+        "score": s,
+        "render_seconds": round(render_seconds, 2),
+        "retried": retried,
+        "manim_version": manim_version(),
+    }
+
+
+async def flush():
+    """Upsert buffered candidates that aren't already in the corpus."""
+    if not _buffer:
+        return
+    batch = dict(_buffer)
+    _buffer.clear()
+    try:
+        await _harvest(batch)
+    except Exception:
+        # Put the candidates back for the next tick unless newer ones replaced them
+        for fingerprint, candidate in batch.items():
+            _buffer.setdefault(fingerprint, candidate)
+        raise
+
+
+async def _harvest(batch: dict[str, dict]):
+    client = get_async_supabase()
+
+    existing = await client.table("harvested_examples").select("fingerprint").in_("fingerprint", list(batch)).execute()
+    for row in existing.data or []:
+        batch.pop(row["fingerprint"], None)
+        _stats["duplicates"] += 1
+    if not batch:
+        return
+
+    rows = list(batch.values())
+    await upsert_examples([
+        {"id": r["vector_id"], "description": r["prompt"], "code": r["script"], "source": "harvested"}
+        for r in rows
+    ])
+    await client.table("harvested_examples").upsert(rows, on_conflict="fingerprint", ignore_duplicates=True).execute()
+    _stats["harvested"] += len(rows)
+    logger.info(f"[Harvester] Added {len(rows)} rendered scripts to the example corpus")
+
+
+def _is_script_failure(error: Exception) -> bool:
+    """Only a Python traceback from the scene proves the script broke; timeouts and killed renders don't."""
+    from app.services.render_pool import RenderTimeout
+    return not isinstance(error, RenderTimeout) and "Traceback (most recent call last)" in str(error)
+
+
+async def _claim(client, fingerprint: str, version: str) -> bool:
+    """Mark one stale row as being revalidated by this process; False if another process got it first."""
+    result = await client.table("harvested_examples") \
+        .update({"status": "revalidating", "claimed_at": datetime.utcnow().isoformat()}) \
+        .eq("fingerprint", fingerprint).eq("status", "active").neq("manim_version", version).execute()
+    return bool(result.data)
+
+
+async def revalidate():
+    """Re-render entries harvested under another Manim version; expire the ones that now fail."""
+    from app.services.video_renderer import render_animation
+
+    version = manim_version()
+    client = get_async_supabase()
+    # Claims older than a render can take belong to a process that died mid-revalidation
+    lease = (datetime.utcnow() - timedelta(seconds=2 * settings.render_timeout)).isoformat()
+    await client.table("harvested_examples").update({"status": "active"}) \
+        .eq("status", "revalidating").lt("claimed_at", lease).execute()
+
+    result = await client.table("harvested_examples").select("fingerprint, vector_id, script") \
+        .eq("status", "active").neq("manim_version", version) \
+        .limit(settings.harvest_revalidate_batch).execute()
+
+    for row in result.data or []:
+        if not await _claim(client, row["fingerprint"], version):
+            continue
+        now = datetime.utcnow().isoformat()
+        try:
+            await render_animation(row["script"], "l", job_id=f"revalidate:{row['fingerprint'][:12]}")
+        except Exception as e:
+            if not _is_script_failure(e):
+                logger.info(f"[Harvester] Revalidating {row['vector_id']} was inconclusive, will retry: {str(e)[:200]}")
+                await client.table("harvested_examples").update({"status": "active"}) \
+                    .eq("fingerprint", row["fingerprint"]).execute()
+                _stats["inconclusive"] += 1
+                continue
+            logger.info(f"[Harvester] {row['vector_id']} fails on manim {version}, expiring: {str(e)[:200]}")
+            await delete_examples([row["vector_id"]])
+            await client.table("harvested_examples").update({"status": "expired", "validated_at": now}) \
+                .eq("fingerprint", row["fingerprint"]).execute()
+            _stats["expired"] += 1
+            continue
+        await client.table("harvested_examples") \
+            .update({"status": "active", "manim_version": version, "validated_at": now}) \
+            .eq("fingerprint", row["fingerprint"]).execute()
+        _stats["revalidated"] += 1
+
+
+async def _run():
+    while True:
+        await asyncio.sleep(settings.harvest_interval)
+        for step in (flush, revalidate) if _revalidating else (flush,):
+            try:
+                await step()
+            except Exception as e:
+                _stats["errors"] += 1
+                logger.warning(f"[Harvester] {step.__name__} failed: {e}")
+
+
+def start(revalidate: bool = False):
+    """
+    Start the background harvest loop in this process. Revalidation renders
+    compete with user renders for pool slots, so only the processes that
+    render jobs pass `revalidate`.
+    """
+    global _loop_task, _revalidating
+    _revalidating = revalidate
+    if settings.harvest_enabled and _loop_task is None:
+        _loop_task = asyncio.create_task(_run())
+
+
+async def stop():
+    """Stop the loop and write out whatever is still buffered."""
+    global _loop_task
+    if _loop_task is not None:
+        _loop_task.cancel()
+        await asyncio.gather(_loop_task, return_exceptions=True)
+        _loop_task = None
+    try:
+        await flush()
+    except Exception as e:
+        logger.warning(f"[Harvester] Final flush failed: {e}")
+
+
+def get_stats() -> dict:
+    return {**_stats, "buffered": len(_buffer)}
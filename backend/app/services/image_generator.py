@@ -1,14 +1,54 @@
-from google import genai
-from app.config import get_settings
-import tempfile
+"""
+Imagen-backed images for `{{IMAGE:description}}` placeholders.
+
+Images are content-addressed by their normalized prompt and kept on local disk
+under `settings.image_cache_dir` with LRU eviction by total size (tracked in a
+DiskLRU index, so saves don't walk the directory), so a prompt
+is only ever generated once per host. Concurrent requests for the same prompt
+share one call, calls go through the imagen upstream's concurrency limit, and
+a rate-limited call pauses every caller for the delay the API asks for before
+retrying. Within a task, images resolved once are reused by every self-heal
+pass; failed ones fall back to a transparent pixel and are retried on the next
+pass.
+"""
+import asyncio
+import hashlib
+import io
+import logging
 import os
+import random
+import re
+import tempfile
+import time
 import uuid
-import logging
+
 from PIL import Image
 
+from app.config import get_settings
+from app.services.client_registry import get_genai_client, upstream
+from app.services.disk_lru import DiskLRU
+
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+IMAGEN_MODEL = "imagen-4.0-fast-generate-001"
+PROMPT_TEMPLATE = "A high-quality, illustrative, educational vector-style image of: {prompt}"
+ASPECT_RATIO = "1:1"
+IMAGE_PLACEHOLDER_RE = re.compile(r"{{IMAGE:(.*?)}}")
+TRANSIENT_CODES = {500, 502, 503, 504}
+# RetryInfo detail on RESOURCE_EXHAUSTED errors, e.g. 'retryDelay': '17s'
+_RETRY_DELAY_RE = re.compile(r"retryDelay['\"]?\s*:\s*['\"]?(\d+(?:\.\d+)?)s")
+
+_in_flight: dict[str, asyncio.Task] = {}
+_task_images: dict[str, dict[str, str]] = {}
+_cooldown_until = 0.0
+_lru: DiskLRU | None = None
+_stats = {
+    "requests": 0, "cache_hits": 0, "joined": 0, "task_reuse": 0,
+    "generated": 0, "failed": 0, "retries": 0, "rate_limited": 0,
+}
+
+
 def get_fallback_image() -> str:
     """Create a 1x1 transparent pixel to avoid permission errors on empty paths."""
     temp_dir = tempfile.gettempdir()
@@ -18,57 +58,210 @@ def get_fallback_image() -> str:
         img.save(path)
     return path
 
+
+def normalize_prompt(prompt: str) -> str:
+    """Canonical form so case, spacing and stray quotes don't produce a second image."""
+    return " ".join(prompt.split()).strip(" \"'.").lower()
+
+
+def cache_key(prompt: str) -> str:
+    h = hashlib.sha256()
+    h.update(normalize_prompt(prompt).encode("utf-8"))
+    h.update(f"\0model={IMAGEN_MODEL}\0aspect={ASPECT_RATIO}\0{PROMPT_TEMPLATE}".encode("utf-8"))
+    return h.hexdigest()
+
+
+# -----------------------
+# Disk cache
+# -----------------------
+def _cache_dir() -> str:
+    path = settings.image_cache_dir or os.path.join(tempfile.gettempdir(), "movinglines_image_cache")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _index() -> DiskLRU:
+    global _lru
+    if _lru is None:
+        _lru = DiskLRU(_cache_dir(), ".png", settings.image_cache_max_bytes)
+    return _lru
+
+
+def _entry_path(key: str) -> str:
+    return os.path.join(_cache_dir(), key[:2], f"{key}.png")
+
+
+def lookup(key: str) -> str | None:
+    """Return the cached image path for `key`, bumping its LRU position."""
+    path = _entry_path(key)
+    if os.path.exists(path):
+        _index().touch(path)
+        return path
+    return None
+
+
+def _save_image(key: str, image_bytes: bytes) -> str:
+    """Decode and write the image as PNG; runs in a worker thread."""
+    if settings.image_cache_enabled:
+        path = _entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    else:
+        path = os.path.join(tempfile.gettempdir(), f"imagen_{str(uuid.uuid4())[:8]}.png")
+    # Write to a temp name first so readers never see a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    Image.open(io.BytesIO(image_bytes)).save(tmp_path, format="PNG")
+    os.replace(tmp_path, path)
+    if settings.image_cache_enabled:
+        _index().add(path)
+    return path
+
+
+# -----------------------
+# Imagen calls
+# -----------------------
+def _image_bytes(response) -> bytes:
+    if not response.generated_images:
+        raise RuntimeError("No images were generated by the model.")
+    gen_img = response.generated_images[0]
+    # Robust extraction of image bytes
+    if getattr(gen_img, 'image_bytes', None):
+        return gen_img.image_bytes
+    if getattr(getattr(gen_img, 'image', None), 'image_bytes', None):
+        return gen_img.image.image_bytes
+    raise RuntimeError("Could not find image bytes in the generated image object.")
+
+
+def _retry_delay(error: Exception, attempt: int) -> tuple[float, bool] | None:
+    """(seconds to wait, rate limited) for errors worth retrying, else None."""
+    code = getattr(error, "code", None)
+    text = str(error)
+    rate_limited = code == 429 or "RESOURCE_EXHAUSTED" in text
+    if not rate_limited and code not in TRANSIENT_CODES:
+        return None
+    delay = settings.image_retry_backoff * (2 ** attempt) * random.uniform(0.8, 1.2)
+    requested = _RETRY_DELAY_RE.search(text)
+    if requested:
+        delay = max(delay, float(requested.group(1)))
+    return delay, rate_limited
+
+
+async def _wait_for_cooldown():
+    while (wait := _cooldown_until - time.monotonic()) > 0:
+        await asyncio.sleep(wait)
+
+
+async def _request_image(prompt: str) -> bytes:
+    global _cooldown_until
+    client = get_genai_client()
+    for attempt in range(settings.image_max_retries + 1):
+        # A 429 anywhere holds back every caller, not just the one that got it
+        await _wait_for_cooldown()
+        try:
+            async with upstream("imagen").slot():
+                response = await client.aio.models.generate_images(
+                    model=IMAGEN_MODEL,
+                    prompt=PROMPT_TEMPLATE.format(prompt=prompt),
+                    config={
+                        'number_of_images': 1,
+                        'aspect_ratio': ASPECT_RATIO
+                    }
+                )
+            return _image_bytes(response)
+        except Exception as e:
+            retry = _retry_delay(e, attempt)
+            if retry is None or attempt == settings.image_max_retries:
+                raise
+            delay, rate_limited = retry
+            _stats["retries"] += 1
+            if rate_limited:
+                _stats["rate_limited"] += 1
+                _cooldown_until = max(_cooldown_until, time.monotonic() + delay)
+                logger.warning(f"[Imagen] Rate limited, pausing image requests for {delay:.1f}s")
+            else:
+                logger.warning(f"[Imagen] Transient error, retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+
+
+async def _generate(prompt: str, key: str) -> str:
+    logger.info(f"[Imagen] Generating image for: {prompt[:100]}...")
+    image_bytes = await _request_image(prompt)
+    path = await asyncio.to_thread(_save_image, key, image_bytes)
+    _stats["generated"] += 1
+    logger.info(f"[Imagen] Image successfully generated and saved at {path}")
+    return path
+
+
 async def generate_image(prompt: str) -> str:
     """
-    Generate an image using Google Gen AI SDK (v2).
-    Returns the absolute path to the generated image file.
+    Path to an image for `prompt`: from the disk cache, from a request already
+    in flight for the same prompt, or freshly generated. Falls back to a
+    transparent pixel if generation fails. The normalized prompt only keys
+    the cache; Imagen gets the text as written.
     """
-    try:
-        logger.info(f"[Imagen] Generating image for: {prompt[:100]}...")
-        
-        # Use separate Imagen key if provided, otherwise fallback to main Google key
-        api_key = settings.imagen_api_key or settings.google_api_key
-        client = genai.Client(api_key=api_key)
-        
-        # Call the generation (Imagen 4 is available in this environment)
-        response = client.models.generate_images(
-            model='imagen-4.0-fast-generate-001',
-            prompt=f"A high-quality, illustrative, educational vector-style image of: {prompt}",
-            config={
-                'number_of_images': 1,
-                'aspect_ratio': "1:1"
-            }
-        )
-        
-        # Save to temp location
-        temp_dir = tempfile.gettempdir()
-        image_id = str(uuid.uuid4())[:8]
-        image_path = os.path.join(temp_dir, f"imagen_{image_id}.png")
-        
-        # The response usually contains image objects
-        if response.generated_images:
-            gen_img = response.generated_images[0]
-            
-            # Robust extraction of image bytes
-            image_bytes = None
-            if hasattr(gen_img, 'image_bytes') and gen_img.image_bytes:
-                image_bytes = gen_img.image_bytes
-            elif hasattr(gen_img, 'image') and hasattr(gen_img.image, 'image_bytes'):
-                image_bytes = gen_img.image.image_bytes
-            
-            if image_bytes:
-                import io
-                img_data = io.BytesIO(image_bytes)
-                img = Image.open(img_data)
-                img.save(image_path)
-                logger.info(f"[Imagen] Image successfully generated and saved at {image_path}")
-                return image_path
-            else:
-                raise RuntimeError("Could not find image bytes in the generated image object.")
-        else:
-            raise RuntimeError("No images were generated by the model.")
+    prompt = prompt.strip()
+    key = cache_key(prompt)
+    _stats["requests"] += 1
+    if settings.image_cache_enabled:
+        path = await asyncio.to_thread(lookup, key)
+        if path:
+            _stats["cache_hits"] += 1
+            return path
 
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.create_task(_generate(prompt, key))
+        _in_flight[key] = task
+        task.add_done_callback(lambda _: _in_flight.pop(key, None))
+    else:
+        _stats["joined"] += 1
+    try:
+        # Shielded: one waiter giving up doesn't cancel the image for the others
+        return await asyncio.shield(task)
     except Exception as e:
+        _stats["failed"] += 1
         logger.error(f"[Imagen] Error generating image: {str(e)}")
         # CRITICAL: Return path to invisible pixel instead of empty string to avoid PermissionError in Manim
         return get_fallback_image()
+
+
+async def resolve_image_placeholders(script: str, task_id: str | None = None) -> str:
+    """
+    Replace every `{{IMAGE:...}}` in `script` with an image path. Each distinct
+    (normalized) prompt is generated once, all of them in parallel; with a
+    `task_id`, prompts the task already resolved are reused as they are.
+    """
+    placeholders = IMAGE_PLACEHOLDER_RE.findall(script)
+    if not placeholders:
+        return script
+    known = _task_images.setdefault(task_id, {}) if task_id else {}
+    # First wording seen for each normalized prompt is what Imagen gets
+    prompts: dict[str, str] = {}
+    for p in placeholders:
+        prompts.setdefault(normalize_prompt(p), p)
+    missing = [p for p in prompts if p not in known]
+    _stats["task_reuse"] += len(prompts) - len(missing)
+    resolved = dict(known)
+    if missing:
+        print(f"[{task_id}] Generating {len(missing)} unique images in parallel "
+              f"({len(prompts) - len(missing)} reused)...")
+        paths = await asyncio.gather(*(generate_image(prompts[p]) for p in missing))
+        resolved.update(zip(missing, paths))
+        # Fallback pixels stay out of the task's map so the next self-heal pass retries them
+        fallback = get_fallback_image()
+        known.update((p, path) for p, path in zip(missing, paths) if path != fallback)
+    return IMAGE_PLACEHOLDER_RE.sub(lambda m: resolved[normalize_prompt(m.group(1))].replace("\\", "/"), script)
+
+
+def forget_task(task_id: str):
+    """Drop the task's resolved images once it is done (the files stay cached)."""
+    _task_images.pop(task_id, None)
+
+
+def get_stats() -> dict:
+    stats = {**_stats, "in_flight": len(_in_flight), "tasks": len(_task_images)}
+    if settings.image_cache_enabled:
+        index = _index()
+        entries, size = index.totals()
+        stats.update(entries=entries, bytes=size, evictions=index.evictions,
+                     max_bytes=settings.image_cache_max_bytes)
+    return stats
@@ -0,0 +1,261 @@
+"""
+Bulk ingestion of examples into the RAG index.
+
+Examples are streamed from a directory (every .py file is one example, its
+module docstring or file name is the description; .jsonl files inside are
+read too) or from a JSONL file with one {"id", "description", "code",
+"source"} object per line. Unchanged examples are skipped by content hash,
+the rest are embedded in batches and upserted in chunks with bounded
+concurrency.
+
+A manifest of ingested ids and content hashes is saved after every chunk,
+so an interrupted run picks up where it stopped when started again:
+
+    python -m app.services.ingestion path/to/examples [more paths...]
+    python -m app.services.ingestion examples.jsonl --force
+"""
+import ast
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Iterable, Iterator
+
+from app.config import get_settings
+from app.services.vector_store import upsert_examples
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# In-memory progress for runs started through the API; finished runs are pruned
+_runs: dict[str, dict] = {}
+_run_tasks: set[asyncio.Task] = set()
+RUN_TTL = 3600       # seconds a finished run's progress stays queryable
+MAX_RUNS = 100       # finished runs kept at most, oldest dropped first
+
+
+def content_hash(description: str, code: str) -> str:
+    return hashlib.sha256(f"{description}\0{code}".encode("utf-8")).hexdigest()
+
+
+def _example_id(source: str, code: str) -> str:
+    return "ex-" + hashlib.sha1((source or code).encode("utf-8")).hexdigest()[:20]
+
+
+def _from_python_file(path: str, root: str) -> dict | None:
+    with open(path, encoding="utf-8") as f:
+        code = f.read()
+    if not code.strip():
+        return None
+    try:
+        description = ast.get_docstring(ast.parse(code))
+    except SyntaxError:
+        logger.warning(f"[Ingest] Skipping {path}: not valid Python")
+        return None
+    source = os.path.relpath(path, root)
+    if not description:
+        description = os.path.splitext(os.path.basename(path))[0].replace("_", " ")
+    return {"description": description.strip(), "code": code, "source": source}
+
+
+def _from_jsonl(path: str) -> Iterator[dict]:
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.warning(f"[Ingest] {path}:{line_no}: invalid JSON ({e})")
+
+
+def iter_examples(paths: Iterable[str]) -> Iterator[dict]:
+    """Stream normalized examples ({"id", "description", "code", "source", "hash"}) from files."""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    full = os.path.join(root, name)
+                    if name.endswith(".py"):
+                        raw = _from_python_file(full, path)
+                        items = [raw] if raw else []
+                    elif name.endswith(".jsonl"):
+                        items = _from_jsonl(full)
+                    else:
+                        continue
+                    for item in items:
+                        yield from normalize_example(item)
+        elif path.endswith(".jsonl"):
+            for item in _from_jsonl(path):
+                yield from normalize_example(item)
+        elif path.endswith(".py"):
+            raw = _from_python_file(path, os.path.dirname(path))
+            if raw:
+                yield from normalize_example(raw)
+        else:
+            logger.warning(f"[Ingest] Don't know how to read {path}")
+
+
+def normalize_example(item: dict) -> Iterator[dict]:
+    code = (item.get("code") or "").strip()
+    description = (item.get("description") or "").strip()
+    if not code or not description:
+        return
+    source = item.get("source") or ""
+    yield {
+        "id": item.get("id") or _example_id(source, code),
+        "description": description,
+        "code": code,
+        "source": source,
+        "hash": content_hash(description, code),
+    }
+
+
+class Manifest:
+    """id -> content hash of everything already in the index."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: dict[str, str] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def unchanged(self, example: dict) -> bool:
+        return self.entries.get(example["id"]) == example["hash"]
+
+    def mark(self, examples: list[dict]):
+        for ex in examples:
+            self.entries[ex["id"]] = ex["hash"]
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+
+
+def _manifest_path() -> str:
+    """
+    The manifest must live as long as the index it describes: next to the
+    local index by default, but Pinecone outlives any local directory, so it
+    needs `ingest_manifest_path` set to somewhere persistent.
+    """
+    if settings.ingest_manifest_path:
+        return settings.ingest_manifest_path
+    if settings.vector_backend == "local":
+        from app.services.local_index import index_dir
+        return os.path.join(index_dir(), "ingest_manifest.json")
+    raise RuntimeError(
+        f"Set INGEST_MANIFEST_PATH to a persistent file for the '{settings.vector_backend}' backend; "
+        "without it every restart would re-embed the whole corpus"
+    )
+
+
+async def ingest(examples: Iterable[dict], force: bool = False, progress: dict | None = None) -> dict:
+    """
+    Embed and upsert `examples`, skipping ones whose content hash is already
+    recorded in the manifest. Returns counters; failed chunks are left out of
+    the manifest so the next run retries them.
+    """
+    manifest = Manifest(_manifest_path())
+    stats = progress if progress is not None else {}
+    stats.update({"seen": 0, "skipped": 0, "upserted": 0, "failed": 0, "chunks": 0})
+    slots = asyncio.Semaphore(settings.ingest_concurrency)
+    save_lock = asyncio.Lock()
+    pending: set[asyncio.Task] = set()
+    start = time.perf_counter()
+
+    async def flush(chunk: list[dict]):
+        async with slots:
+            try:
+                await upsert_examples(chunk)
+            except Exception as e:
+                stats["failed"] += len(chunk)
+                logger.error(f"[Ingest] Chunk of {len(chunk)} failed: {e}")
+                return
+        async with save_lock:
+            manifest.mark(chunk)
+            manifest.save()
+        stats["upserted"] += len(chunk)
+        stats["chunks"] += 1
+        logger.info(f"[Ingest] {stats['upserted']} upserted, {stats['skipped']} unchanged so far")
+
+    chunk: list[dict] = []
+    seen_ids: set[str] = set()
+    for ex in examples:
+        stats["seen"] += 1
+        if ex["id"] in seen_ids or (not force and manifest.unchanged(ex)):
+            stats["skipped"] += 1
+            continue
+        seen_ids.add(ex["id"])
+        chunk.append(ex)
+        if len(chunk) >= settings.ingest_batch_size:
+            pending.add(asyncio.create_task(flush(chunk)))
+            chunk = []
+            # Keep the stream lazy: don't queue far more chunks than can run
+            if len(pending) >= settings.ingest_concurrency * 2:
+                _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+    if chunk:
+        pending.add(asyncio.create_task(flush(chunk)))
+    if pending:
+        await asyncio.gather(*pending)
+
+    stats["seconds"] = round(time.perf_counter() - start, 1)
+    return stats
+
+
+def start_run(examples: list[dict], force: bool = False) -> str:
+    """Start an ingestion in the background; poll its progress with get_run()."""
+    _manifest_path()  # fail the request, not the background run, if there is nowhere to keep it
+    _prune_runs()
+    run_id = str(uuid.uuid4())
+    progress = {"status": "running"}
+    _runs[run_id] = progress
+
+    async def run():
+        try:
+            await ingest(iter(examples), force=force, progress=progress)
+            progress["status"] = "completed" if not progress.get("failed") else "partial"
+        except Exception as e:
+            logger.error(f"[Ingest] Run {run_id} failed: {e}")
+            progress.update({"status": "failed", "error": str(e)})
+        finally:
+            progress["finished_at"] = time.time()
+
+    task = asyncio.create_task(run())
+    _run_tasks.add(task)
+    task.add_done_callback(_run_tasks.discard)
+    return run_id
+
+
+def _prune_runs():
+    finished = sorted((p["finished_at"], run_id) for run_id, p in _runs.items() if "finished_at" in p)
+    cutoff = time.time() - RUN_TTL
+    excess = len(finished) - MAX_RUNS
+    for i, (finished_at, run_id) in enumerate(finished):
+        if finished_at < cutoff or i < excess:
+            del _runs[run_id]
+
+
+def get_run(run_id: str) -> dict | None:
+    _prune_runs()
+    return _runs.get(run_id)
+
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Bulk-ingest Manim examples into the RAG index")
+    parser.add_argument("paths", nargs="+", help="directories, .py files or .jsonl files")
+    parser.add_argument("--force", action="store_true", help="re-embed examples even if unchanged")
+    args = parser.parse_args()
+    result = asyncio.run(ingest(iter_examples(args.paths), force=args.force))
+    print(f"[Ingest] Done: {json.dumps(result)}")
@@ -0,0 +1,236 @@
+"""
+Durable Redis-backed job queue for render jobs.
+
+Jobs survive API restarts and can be consumed by any number of worker
+processes (see app/worker.py). Keys for a queue named "render":
+
+- movinglines:queue:render:pending   LIST  job ids ready to run
+- movinglines:queue:render:inflight  ZSET  job id -> visibility deadline
+- movinglines:queue:render:delayed   ZSET  job id -> time it may be retried
+- movinglines:queue:render:jobs      HASH  job id -> job json
+- movinglines:queue:render:dead      LIST  job ids that exhausted retries
+
+A job is claimed atomically (only while the queue is under its concurrency
+limit), kept alive by heartbeats while it runs, and acked on success. If a
+worker dies, its job's deadline lapses and the reaper puts it back on the
+pending list.
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+
+import redis.asyncio as aioredis
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+KEY_PREFIX = "movinglines:queue"
+
+_redis: aioredis.Redis | None = None
+
+# Claim a job only if fewer than `limit` jobs are in flight for this queue.
+# KEYS: pending, inflight   ARGV: limit, deadline
+_CLAIM_SCRIPT = """
+if redis.call('ZCARD', KEYS[2]) >= tonumber(ARGV[1]) then
+    return nil
+end
+local job_id = redis.call('RPOP', KEYS[1])
+if job_id then
+    redis.call('ZADD', KEYS[2], ARGV[2], job_id)
+end
+return job_id
+"""
+
+# Move every id whose score is <= now from a zset back onto the pending list.
+# KEYS: zset, pending   ARGV: now
+_REQUEUE_SCRIPT = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+for _, job_id in ipairs(ids) do
+    redis.call('ZREM', KEYS[1], job_id)
+    redis.call('LPUSH', KEYS[2], job_id)
+end
+return #ids
+"""
+
+
+def get_redis() -> aioredis.Redis:
+    global _redis
+    if _redis is None:
+        _redis = aioredis.from_url(settings.redis_url, decode_responses=True)
+    return _redis
+
+
+class JobQueue:
+    """Producer/consumer handle for a single named queue."""
+
+    def __init__(self, name: str, redis: aioredis.Redis | None = None):
+        self.name = name
+        self.redis = redis or get_redis()
+        base = f"{KEY_PREFIX}:{name}"
+        self.pending_key = f"{base}:pending"
+        self.inflight_key = f"{base}:inflight"
+        self.delayed_key = f"{base}:delayed"
+        self.jobs_key = f"{base}:jobs"
+        self.dead_key = f"{base}:dead"
+        self._claim = self.redis.register_script(_CLAIM_SCRIPT)
+        self._requeue = self.redis.register_script(_REQUEUE_SCRIPT)
+
+    async def enqueue(self, payload: dict, job_id: str | None = None) -> str:
+        """Persist a job and make it available to workers."""
+        job_id = job_id or str(uuid.uuid4())
+        job = {
+            "id": job_id,
+            "payload": payload,
+            "attempts": 0,
+            "enqueued_at": time.time(),
+        }
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self.jobs_key, job_id, json.dumps(job))
+            pipe.lpush(self.pending_key, job_id)
+            await pipe.execute()
+        logger.info(f"[Queue:{self.name}] Enqueued job {job_id}")
+        return job_id
+
+    async def claim(self, limit: int, visibility_timeout: int) -> dict | None:
+        """Atomically claim the next job if the queue is under `limit` in-flight jobs."""
+        deadline = time.time() + visibility_timeout
+        job_id = await self._claim(keys=[self.pending_key, self.inflight_key], args=[limit, deadline])
+        if not job_id:
+            return None
+        raw = await self.redis.hget(self.jobs_key, job_id)
+        if raw is None:
+            # Job body vanished (e.g. acked by a worker whose lease had lapsed); drop the id.
+            await self.redis.zrem(self.inflight_key, job_id)
+            return None
+        job = json.loads(raw)
+        job["attempts"] += 1
+        await self.redis.hset(self.jobs_key, job_id, json.dumps(job))
+        return job
+
+    async def heartbeat(self, job_id: str, visibility_timeout: int):
+        """Push the job's visibility deadline forward while it is still running."""
+        await self.redis.zadd(self.inflight_key, {job_id: time.time() + visibility_timeout}, xx=True)
+
+    async def ack(self, job_id: str):
+        """Mark a job as done and forget it."""
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zrem(self.inflight_key, job_id)
+            pipe.hdel(self.jobs_key, job_id)
+            await pipe.execute()
+
+    async def fail(self, job: dict, error: str, max_attempts: int, backoff: float):
+        """Schedule a retry with exponential backoff, or dead-letter the job."""
+        job_id = job["id"]
+        job["last_error"] = error[:2000]
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zrem(self.inflight_key, job_id)
+            pipe.hset(self.jobs_key, job_id, json.dumps(job))
+            if job["attempts"] < max_attempts:
+                delay = backoff * (2 ** (job["attempts"] - 1))
+                pipe.zadd(self.delayed_key, {job_id: time.time() + delay})
+                logger.warning(f"[Queue:{self.name}] Job {job_id} failed (attempt {job['attempts']}), retrying in {delay:.0f}s")
+            else:
+                pipe.lpush(self.dead_key, job_id)
+                logger.error(f"[Queue:{self.name}] Job {job_id} exhausted {max_attempts} attempts, dead-lettered")
+            await pipe.execute()
+
+    async def requeue_expired(self) -> int:
+        """Return lapsed in-flight jobs and due retries to the pending list."""
+        now = time.time()
+        expired = await self._requeue(keys=[self.inflight_key, self.pending_key], args=[now])
+        due = await self._requeue(keys=[self.delayed_key, self.pending_key], args=[now])
+        if expired:
+            logger.warning(f"[Queue:{self.name}] Re-queued {expired} job(s) whose visibility timeout lapsed")
+        return expired + due
+
+    async def stats(self) -> dict:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.llen(self.pending_key)
+            pipe.zcard(self.inflight_key)
+            pipe.zcard(self.delayed_key)
+            pipe.llen(self.dead_key)
+            pending, inflight, delayed, dead = await pipe.execute()
+        return {"pending": pending, "inflight": inflight, "delayed": delayed, "dead": dead}
+
+
+class QueueWorker:
+    """
+    Pulls jobs from a JobQueue and runs them through `handler(payload, attempt)`.
+
+    A handler that returns acks the job; one that raises has it retried with
+    backoff until `settings.job_max_attempts`, then dead-lettered. `attempt`
+    (1-based) lets the handler tell whether a failure is final.
+
+    `concurrency` bounds jobs in this process; the queue-wide limit
+    (`settings.job_queue_concurrency`) bounds jobs across all workers.
+    """
+
+    def __init__(self, queue: JobQueue, handler, concurrency: int = 1):
+        self.queue = queue
+        self.handler = handler
+        self.concurrency = concurrency
+        self.visibility_timeout = settings.job_visibility_timeout
+        self.poll_interval = 1.0
+        self._slots = asyncio.Semaphore(concurrency)
+        self._running: set[asyncio.Task] = set()
+        self._stopping = False
+
+    async def run(self):
+        logger.info(f"[Worker] Consuming queue '{self.queue.name}' with concurrency={self.concurrency}")
+        reaper = asyncio.create_task(self._reap_forever())
+        try:
+            while not self._stopping:
+                await self._slots.acquire()
+                job = None
+                try:
+                    job = await self.queue.claim(settings.job_queue_concurrency, self.visibility_timeout)
+                except Exception as e:
+                    logger.error(f"[Worker] Claim failed: {e}")
+                if job is None:
+                    self._slots.release()
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                task = asyncio.create_task(self._run_job(job))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+        finally:
+            reaper.cancel()
+            if self._running:
+                await asyncio.gather(*self._running, return_exceptions=True)
+
+    def stop(self):
+        self._stopping = True
+
+    async def _run_job(self, job: dict):
+        job_id = job["id"]
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            logger.info(f"[Worker] Running job {job_id} (attempt {job['attempts']})")
+            await self.handler(job["payload"], job["attempts"])
+            await self.queue.ack(job_id)
+        except Exception as e:
+            await self.queue.fail(job, repr(e), settings.job_max_attempts, settings.job_retry_backoff)
+        finally:
+            heartbeat.cancel()
+            self._slots.release()
+
+    async def _heartbeat(self, job_id: str):
+        interval = max(1.0, self.visibility_timeout / 3)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.queue.heartbeat(job_id, self.visibility_timeout)
+            except Exception as e:
+                logger.warning(f"[Worker] Heartbeat for {job_id} failed: {e}")
+
+    async def _reap_forever(self):
+        while True:
+            try:
+                await self.queue.requeue_expired()
+            except Exception as e:
+                logger.error(f"[Worker] Reaper failed: {e}")
+            await asyncio.sleep(self.poll_interval * 5)
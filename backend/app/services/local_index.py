@@ -0,0 +1,479 @@
+"""
+Local embedded vector index for the Manim example corpus.
+
+The corpus is small and changes rarely, so instead of a network round trip
+to Pinecone per lookup the normalized embeddings can live in a memory-mapped
+NumPy matrix on local disk. Search is exact (one matrix-vector product) or,
+once the corpus is large, IVF: vectors are clustered with spherical k-means
+and only the `local_index_nprobe` closest clusters are scanned.
+
+The index mimics the subset of the Pinecone Index API that vector_store uses
+(`query`, `upsert` and `delete`), so it is a drop-in backend. Several
+processes (the API and every worker) write to the same directory, so writers
+hold an `flock` on a sidecar file and reload whatever another process wrote
+before merging their own changes. Upserts append rows to the vector file and
+lines to the metadata log in place; deletes and syncs rewrite the files
+atomically. Readers pick up new versions on their next query.
+
+IVF lists are not rebuilt on every write: new vectors join the nearest
+existing cluster, and k-means reruns only when the target list count changes
+or `local_index_ivf_rebuild_ratio` of the rows changed since the last build.
+
+    python -m app.services.local_index sync     # pull every vector from Pinecone
+    python -m app.services.local_index stats
+"""
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import numpy as np
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+VECTORS_FILE = "vectors.npy"
+META_FILE = "meta.jsonl"          # one {"row", "id", "metadata"} line per write; later lines win
+LEGACY_META_FILE = "meta.json"    # pre-append format, converted on first open
+CENTROIDS_FILE = "ivf_centroids.npy"
+ORDER_FILE = "ivf_order.npy"
+OFFSETS_FILE = "ivf_offsets.npy"
+IVF_STATE_FILE = "ivf_state.json"  # rows the lists were built for and rows changed since
+LOCK_FILE = "index.lock"
+
+# How often readers check whether another process rewrote the index
+RELOAD_CHECK_INTERVAL = 5.0
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+def _kmeans(vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """Spherical k-means: returns (unit centroids, assignment per vector)."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    assignments = np.zeros(len(vectors), dtype=np.int32)
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+        for c in range(k):
+            members = vectors[assignments == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+            else:
+                # Re-seed empty clusters so every list stays useful
+                centroids[c] = vectors[rng.integers(len(vectors))]
+        centroids = _normalize(centroids)
+    return centroids, assignments
+
+
+def _write_array(array: np.ndarray):
+    def write(path: str):
+        with open(path, "wb") as f:
+            np.save(f, array)
+    return write
+
+
+def _write_json(data):
+    def write(path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+    return write
+
+
+def _write_meta_lines(meta: list[dict]):
+    def write(path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            for row, entry in enumerate(meta):
+                f.write(json.dumps({"row": row, **entry}) + "\n")
+    return write
+
+
+def _read_meta(path: str) -> tuple[list[dict], int] | None:
+    """Replay the metadata log: (one entry per row, line count), or None if it has a gap."""
+    meta: list[dict] = []
+    lines = 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break  # another process is mid-append; the row count check catches it
+            record = json.loads(line)
+            row = record.pop("row")
+            if row == len(meta):
+                meta.append(record)
+            elif row < len(meta):
+                meta[row] = record
+            else:
+                return None
+            lines += 1
+    return meta, lines
+
+
+def _ivf_list_count(rows: int) -> int:
+    """About sqrt(rows) lists, rounded to a power of two so it only changes when the corpus quadruples."""
+    return max(1, 2 ** int(round(np.log2(max(1.0, np.sqrt(rows))))))
+
+
+def _patch_rows(path: str, rows: list[int], values: np.ndarray, total: int) -> bool:
+    """
+    Write `values` at `rows` of the float32 matrix saved in `path` and set its
+    row count to `total`, in place. Returns False if the file can't be patched
+    (other dtype or dimension, or no room to grow the header).
+    """
+    fmt = np.lib.format
+    with open(path, "r+b") as f:
+        version = fmt.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = fmt.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = fmt.read_array_header_2_0(f)
+        data_start = f.tell()
+        if fortran_order or dtype != np.dtype("<f4") or len(shape) != 2 or shape[1] != values.shape[1]:
+            return False
+        header_start = fmt.MAGIC_LEN + (2 if version == (1, 0) else 4)
+        header = "{'descr': '<f4', 'fortran_order': False, 'shape': (%d, %d), }" % (total, shape[1])
+        width = data_start - header_start
+        if len(header) + 1 > width:
+            return False
+        row_bytes = shape[1] * 4
+        for row, value in zip(rows, values):
+            f.seek(data_start + row * row_bytes)
+            f.write(value.astype("<f4").tobytes())
+        # Rows go in before the header grows, so a reader never sees a shape the data doesn't cover
+        f.flush()
+        f.seek(header_start)
+        f.write((header.ljust(width - 1) + "\n").encode("latin1"))
+    return True
+
+
+def _atomic_save(path: str, write):
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class LocalIndex:
+    """Memory-mapped matrix of unit vectors plus row-aligned metadata."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._meta: list[dict] = []
+        self._meta_lines = 0
+        self._rows: dict[str, int] = {}
+        self._ivf = None
+        self._ivf_state = {"built": 0, "stale": 0}
+        self._version = None
+        self._last_check = 0.0
+        if not os.path.exists(self._path(META_FILE)) and os.path.exists(self._path(LEGACY_META_FILE)):
+            with self._write_lock():
+                self._convert_legacy_meta()
+        self.load()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _disk_version(self):
+        # A rewrite replaces the file (new inode), an append grows it
+        try:
+            st = os.stat(self._path(META_FILE))
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    @contextmanager
+    def _write_lock(self):
+        """Exclusive across threads and processes; reloads first if another process wrote meanwhile."""
+        with self._lock, open(self._path(LOCK_FILE), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if self._disk_version() != self._version:
+                    self.load(allow_extra_rows=True)
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _convert_legacy_meta(self):
+        if os.path.exists(self._path(META_FILE)) or not os.path.exists(self._path(LEGACY_META_FILE)):
+            return  # another process converted it first
+        with open(self._path(LEGACY_META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        _atomic_save(self._path(META_FILE), _write_meta_lines(meta))
+        os.remove(self._path(LEGACY_META_FILE))
+
+    def load(self, allow_extra_rows: bool = False):
+        """
+        (Re)load the index files; vectors are memory-mapped, not read into RAM.
+
+        Writers pass `allow_extra_rows`: vector rows beyond the metadata are
+        left over from a write that died before its metadata landed and are
+        overwritten by the next append.
+        """
+        version = self._disk_version()
+        if version is None:
+            return
+        replayed = _read_meta(self._path(META_FILE))
+        if replayed is None:
+            return
+        meta, lines = replayed
+        try:
+            vectors = np.load(self._path(VECTORS_FILE), mmap_mode="r")
+        except (FileNotFoundError, ValueError):
+            return
+        if len(vectors) != len(meta):
+            if not allow_extra_rows or len(vectors) < len(meta):
+                # Caught another process mid-write; keep the current version and retry later
+                return
+            vectors = vectors[:len(meta)]
+        ivf = None
+        if os.path.exists(self._path(CENTROIDS_FILE)):
+            centroids = np.load(self._path(CENTROIDS_FILE))
+            order = np.load(self._path(ORDER_FILE))
+            if centroids.shape[1:] == vectors.shape[1:] and len(order) == len(meta):
+                ivf = (centroids, order, np.load(self._path(OFFSETS_FILE)))
+        ivf_state = {"built": 0, "stale": 0}
+        if ivf is not None and os.path.exists(self._path(IVF_STATE_FILE)):
+            with open(self._path(IVF_STATE_FILE), encoding="utf-8") as f:
+                ivf_state = json.load(f)
+        self._vectors, self._meta, self._ivf, self._version = vectors, meta, ivf, version
+        self._meta_lines, self._ivf_state = lines, ivf_state
+        self._rows = {m["id"]: i for i, m in enumerate(meta)}
+        logger.info(f"[LocalIndex] Loaded {len(meta)} vectors from {self.directory} (ivf={ivf is not None})")
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._last_check < RELOAD_CHECK_INTERVAL:
+            return
+        self._last_check = now
+        if self._disk_version() != self._version:
+            with self._lock:
+                self.load()
+
+    def __len__(self) -> int:
+        return len(self._meta)
+
+    def _candidate_rows(self, query: np.ndarray) -> np.ndarray | None:
+        use_ivf = settings.local_index_mode == "ivf" or (
+            settings.local_index_mode == "auto" and len(self) >= settings.local_index_ivf_min_vectors
+        )
+        if not use_ivf or self._ivf is None:
+            return None
+        centroids, order, offsets = self._ivf
+        probes = np.argsort(-(centroids @ query))[:settings.local_index_nprobe]
+        return np.concatenate([order[offsets[c]:offsets[c + 1]] for c in probes])
+
+    def query(self, vector, top_k: int = 5, include_metadata: bool = True, **_):
+        """Pinecone-compatible query: returns an object with `.matches` (id, score, metadata)."""
+        self._maybe_reload()
+        vectors, meta = self._vectors, self._meta
+        if not len(meta):
+            return SimpleNamespace(matches=[])
+        query = _normalize(np.asarray(vector, dtype=np.float32))
+        if query.shape[-1] != vectors.shape[1]:
+            raise ValueError(f"Query has dimension {query.shape[-1]}, index has {vectors.shape[1]}")
+
+        rows = self._candidate_rows(query)
+        scores = (vectors if rows is None else vectors[rows]) @ query
+        k = min(top_k, len(scores))
+        if k == 0:
+            return SimpleNamespace(matches=[])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return SimpleNamespace(matches=[
+            SimpleNamespace(
+                id=meta[int(i if rows is None else rows[i])]["id"],
+                score=float(scores[i]),
+                metadata=meta[int(i if rows is None else rows[i])].get("metadata") if include_metadata else None,
+            )
+            for i in top
+        ])
+
+    def upsert(self, vectors: list[dict], **_):
+        """Pinecone-compatible upsert of [{"id", "values", "metadata"}]; appends to the index files."""
+        if not vectors:
+            return SimpleNamespace(upserted_count=0)
+        new_values = _normalize(np.asarray([v["values"] for v in vectors], dtype=np.float32))
+        with self._write_lock():
+            meta = list(self._meta)
+            if len(meta) and new_values.shape[1] != self._vectors.shape[1]:
+                raise ValueError(f"Upsert has dimension {new_values.shape[1]}, index has {self._vectors.shape[1]}")
+
+            # Later duplicates of an id in the same batch win, as in Pinecone
+            changed: dict[int, np.ndarray] = {}
+            first_new = len(meta)
+            rows = dict(self._rows)
+            for item, values in zip(vectors, new_values):
+                row = rows.get(item["id"])
+                if row is None:
+                    row = rows[item["id"]] = len(meta)
+                    meta.append(None)
+                meta[row] = {"id": item["id"], "metadata": item.get("metadata") or {}}
+                changed[row] = values
+
+            if not len(self._meta):
+                self._save(np.asarray([changed[r] for r in range(len(meta))], dtype=np.float32), meta)
+                return SimpleNamespace(upserted_count=len(vectors))
+
+            changed_rows = sorted(changed)
+            changed_values = np.asarray([changed[r] for r in changed_rows], dtype=np.float32)
+            if not _patch_rows(self._path(VECTORS_FILE), changed_rows, changed_values, len(meta)):
+                matrix = np.vstack([np.asarray(self._vectors), np.zeros((len(meta) - len(self._meta), new_values.shape[1]), dtype=np.float32)])
+                matrix[changed_rows] = changed_values
+                self._save(matrix, meta)
+                return SimpleNamespace(upserted_count=len(vectors))
+            self._update_ivf(changed_rows, changed_values, len(meta))
+
+            log_rows = sorted(set(changed_rows) | set(range(first_new, len(meta))))
+            if self._meta_lines + len(log_rows) > 2 * len(meta) + 100:
+                # Mostly superseded lines: compact the log
+                _atomic_save(self._path(META_FILE), _write_meta_lines(meta))
+            else:
+                with open(self._path(META_FILE), "a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps({"row": row, **meta[row]}) + "\n" for row in log_rows))
+            self.load()
+        return SimpleNamespace(upserted_count=len(vectors))
+
+    def delete(self, ids: list[str], **_):
+        """Pinecone-compatible delete by id."""
+        with self._write_lock():
+            drop = {self._rows[i] for i in ids if i in self._rows}
+            if not drop:
+                return
+            keep = [row for row in range(len(self._meta)) if row not in drop]
+            matrix = np.asarray(self._vectors)[keep]
+            meta = [self._meta[row] for row in keep]
+            self._save(matrix, meta)
+
+    def replace_all(self, vectors: list[dict]):
+        """Swap in a complete new corpus (used by the sync job)."""
+        if not vectors:
+            return
+        matrix = _normalize(np.asarray([v["values"] for v in vectors], dtype=np.float32))
+        meta = [{"id": v["id"], "metadata": v.get("metadata") or {}} for v in vectors]
+        with self._write_lock():
+            self._save(matrix, meta)
+
+    def _drop_ivf(self):
+        for name in (CENTROIDS_FILE, ORDER_FILE, OFFSETS_FILE, IVF_STATE_FILE):
+            if os.path.exists(self._path(name)):
+                os.remove(self._path(name))
+
+    def _write_ivf(self, centroids: np.ndarray | None, assignments: np.ndarray, state: dict):
+        nlist = len(centroids) if centroids is not None else len(self._ivf[0])
+        order = np.argsort(assignments, kind="stable").astype(np.int64)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=nlist))]).astype(np.int64)
+        if centroids is not None:
+            _atomic_save(self._path(CENTROIDS_FILE), _write_array(centroids))
+        _atomic_save(self._path(ORDER_FILE), _write_array(order))
+        _atomic_save(self._path(OFFSETS_FILE), _write_array(offsets))
+        _atomic_save(self._path(IVF_STATE_FILE), _write_json(state))
+
+    def _build_ivf(self, matrix: np.ndarray):
+        """Cluster the whole matrix from scratch (or drop the lists below the IVF threshold)."""
+        if len(matrix) < settings.local_index_ivf_min_vectors:
+            self._drop_ivf()
+            return
+        centroids, assignments = _kmeans(np.asarray(matrix), _ivf_list_count(len(matrix)))
+        self._write_ivf(centroids, assignments, {"built": len(matrix), "stale": 0})
+
+    def _update_ivf(self, rows: list[int], values: np.ndarray, total: int):
+        """Fold appended/overwritten rows into the existing lists, rebuilding only when they have drifted."""
+        stale = self._ivf_state.get("stale", 0) + len(rows)
+        if (
+            total < settings.local_index_ivf_min_vectors
+            or self._ivf is None
+            or len(self._ivf[0]) != _ivf_list_count(total)
+            or stale > settings.local_index_ivf_rebuild_ratio * max(1, self._ivf_state.get("built", 0))
+        ):
+            self._build_ivf(np.load(self._path(VECTORS_FILE), mmap_mode="r")[:total])
+            return
+        centroids, order, offsets = self._ivf
+        assignments = np.zeros(total, dtype=np.int32)
+        for c in range(len(centroids)):
+            assignments[order[offsets[c]:offsets[c + 1]]] = c
+        assignments[rows] = np.argmax(values @ centroids.T, axis=1)
+        self._write_ivf(None, assignments, {"built": self._ivf_state.get("built", 0), "stale": stale})
+
+    def _save(self, matrix: np.ndarray, meta: list[dict]):
+        """Rewrite every file from scratch; the caller holds the write lock."""
+        _atomic_save(self._path(VECTORS_FILE), _write_array(matrix))
+        self._build_ivf(matrix)
+        # Metadata is written last: its inode/size/mtime is the version readers watch
+        _atomic_save(self._path(META_FILE), _write_meta_lines(meta))
+        self.load()
+
+    def stats(self) -> dict:
+        return {
+            "vectors": len(self),
+            "dimension": int(self._vectors.shape[1]) if len(self) else 0,
+            "ivf_lists": int(len(self._ivf[0])) if self._ivf is not None else 0,
+            "ivf_stale_rows": int(self._ivf_state.get("stale", 0)) if self._ivf is not None else 0,
+            "mode": settings.local_index_mode,
+            "directory": self.directory,
+        }
+
+
+_index: LocalIndex | None = None
+
+
+def index_dir() -> str:
+    return settings.local_index_dir or os.path.join(tempfile.gettempdir(), "movinglines_vector_index")
+
+
+def get_local_index() -> LocalIndex:
+    global _index
+    if _index is None:
+        _index = LocalIndex(index_dir())
+    return _index
+
+
+def sync_from_pinecone(batch_size: int = 100) -> int:
+    """Copy every vector and its metadata from the Pinecone index into the local index."""
+    from app.services.vector_store import get_pinecone_index
+    remote = get_pinecone_index()
+    if remote is None:
+        raise RuntimeError("Pinecone is not configured; nothing to sync from")
+
+    vectors = []
+    for ids in remote.list():
+        ids = list(ids)
+        for start in range(0, len(ids), batch_size):
+            fetched = remote.fetch(ids=ids[start:start + batch_size])
+            for vector_id, v in fetched.vectors.items():
+                vectors.append({"id": vector_id, "values": list(v.values), "metadata": dict(v.metadata or {})})
+    get_local_index().replace_all(vectors)
+    logger.info(f"[LocalIndex] Synced {len(vectors)} vectors from Pinecone")
+    return len(vectors)
+
+
+if __name__ == "__main__":
+    import sys
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    if command == "sync":
+        print(f"[LocalIndex] Synced {sync_from_pinecone()} vectors")
+    elif command == "stats":
+        print(json.dumps(get_local_index().stats(), indent=2))
+    else:
+        sys.exit(f"Unknown command '{command}' (expected sync or stats)")
@@ -0,0 +1,112 @@
+"""
+Introspected description of the installed manim API.
+
+Importing manim is slow and memory-hungry, so the API process never does it.
+The surface is built once per manim version by running this file as a
+script in a subprocess (it depends on nothing but the stdlib and manim) and
+cached as JSON next to the other temp caches.
+"""
+import inspect
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from functools import lru_cache
+from importlib import metadata
+
+
+def _params(fn) -> tuple[list[str], bool]:
+    """Named parameters of `fn` and whether it also takes **kwargs."""
+    try:
+        sig = inspect.signature(fn)
+    except (TypeError, ValueError):
+        return [], True
+    names = [
+        p.name for p in sig.parameters.values()
+        if p.kind in (p.POSITIONAL_OR_KEYWORD, p.KEYWORD_ONLY) and p.name != "self"
+    ]
+    open_kwargs = any(p.kind == p.VAR_KEYWORD for p in sig.parameters.values())
+    return names, open_kwargs
+
+
+def _class_info(cls, manim) -> dict:
+    # Keyword arguments are accepted along the __init__ chain for as long as each level forwards **kwargs
+    accepted: list[str] = []
+    open_kwargs = True
+    for klass in cls.__mro__:
+        if klass is object:
+            break
+        if "__init__" not in klass.__dict__:
+            continue
+        names, forwards = _params(klass.__dict__["__init__"])
+        accepted += [n for n in names if n not in accepted]
+        if not forwards:
+            open_kwargs = False
+            break
+
+    def subclass_of(name: str) -> bool:
+        base = getattr(manim, name, None)
+        return inspect.isclass(base) and issubclass(cls, base)
+
+    return {
+        "kwargs": accepted,
+        "open": open_kwargs,
+        "vmobject": subclass_of("VMobject"),
+        "image": subclass_of("AbstractImageMobject"),
+        "mobject": subclass_of("Mobject"),
+        "scene": subclass_of("Scene"),
+        "three_d_scene": subclass_of("ThreeDScene"),
+        "moving_camera_scene": subclass_of("MovingCameraScene"),
+    }
+
+
+def build_surface() -> dict:
+    import manim
+
+    names, classes, functions = {}, {}, {}
+    for name in dir(manim):
+        if name.startswith("_"):
+            continue
+        obj = getattr(manim, name)
+        if inspect.isclass(obj):
+            names[name] = "class"
+            classes[name] = _class_info(obj, manim)
+        elif inspect.ismodule(obj):
+            names[name] = "module"
+        elif callable(obj):
+            names[name] = "function"
+            kwargs, open_kwargs = _params(obj)
+            functions[name] = {"kwargs": kwargs, "open": open_kwargs}
+        else:
+            names[name] = "constant"
+    return {"version": getattr(manim, "__version__", "unknown"), "names": names, "classes": classes, "functions": functions}
+
+
+@lru_cache()
+def get_surface() -> dict | None:
+    """The cached API surface for the installed manim, or None if it can't be built."""
+    try:
+        version = metadata.version("manim")
+    except metadata.PackageNotFoundError:
+        return None
+    path = os.path.join(tempfile.gettempdir(), f"movinglines_manim_api_{version}.json")
+    if not os.path.exists(path):
+        result = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), path],
+            capture_output=True, text=True, timeout=180
+        )
+        if result.returncode != 0 or not os.path.exists(path):
+            print(f"[Validator] Could not introspect manim: {result.stderr[-500:]}")
+            return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    out_path = sys.argv[1]
+    surface = build_surface()
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(surface, f)
+    os.replace(tmp_path, out_path)
@@ -0,0 +1,676 @@
+"""
+Single-pass AST sanitizer for generated Manim scripts.
+
+Replaces the chain of regex passes (sanitize_manim_script, normalize_indentation,
+sanitize_updaters, sanitize_3d_camera, apply_anticrash_rules). The script is
+parsed once, and one walk over the tree hands each node to the rules
+registered for its type. Rules propose source edits, which are spliced into
+the original text, so comments and formatting survive. Rules only match real
+syntax, never strings or comments, and cost is linear in the script length.
+
+The output is a fixed point: sanitizing it again changes nothing. Recently
+seen scripts are remembered by hash, so repeat calls return immediately.
+Scripts that still don't parse after indentation repair go through the legacy
+regex chain instead.
+"""
+import ast
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Callable
+
+from app.services.manim.sanitizers import (
+    normalize_indentation,
+    sanitize_updaters,
+    sanitize_3d_camera,
+    apply_anticrash_rules,
+)
+
+logger = logging.getLogger(__name__)
+
+# Edits that overlap one already taken are applied by a follow-up pass over
+# the rewritten source; a clean pass ends the loop
+MAX_PASSES = 4
+_SEEN_MAX = 2048
+
+DEPRECATED_NAMES = {
+    "ShowCreation": "Create",
+    "TextMobject": "Text",
+    "ParametricSurface": "Surface",
+}
+HALLUCINATED_NAMES = {
+    "Rectangle3D": "Cube",
+    "BezierCurve": "CubicBezier",
+    "Gear": "Circle",
+    "Creat": "Create",
+    "Writet": "Write",
+    "FadeInn": "FadeIn",
+}
+METHOD_RENAMES = {
+    "height_to": "set_height",
+    "set_height_to": "set_height",
+    "set_width_to": "set_width",
+    "width_to": "set_width",
+    "move_to_point": "move_to",
+    "scale_to": "scale",
+    "get_graph": "plot",
+}
+CORNER_GETTERS = {
+    "get_top_left": "UL",
+    "get_top_right": "UR",
+    "get_bottom_left": "DL",
+    "get_bottom_right": "DR",
+}
+KWARG_RENAMES = {
+    "Square": {"length": "side_length", "opacity": "fill_opacity"},
+    "Cube": {"length": "side_length", "opacity": "fill_opacity"},
+    "Arrow3D": {"tube_radius": "thickness"},
+    "ArcBetweenPoints": {"start_point": "start", "end_point": "end"},
+    **{cls: {"opacity": "fill_opacity"} for cls in (
+        "Dot", "Circle", "Rectangle", "Ellipse", "Annulus", "Dot3D", "Sphere",
+    )},
+    **{cls: {"opacity": "stroke_opacity"} for cls in (
+        "Line", "Arrow", "DoubleArrow", "TracedPath", "Arc", "CubicBezier", "Polyline",
+    )},
+}
+# add_tip() and friends don't take these; LLMs pass them anyway
+INVALID_KWARGS = {"at_start", "at_end", "at_arg"}
+DT_ALIASES = {"alpha", "frame_dt", "dt_frame", "time_step", "dt_val", "dt_updater", "delta_t"}
+DIRECTIONS = {
+    "RIGHT": (1, 0, 0), "LEFT": (-1, 0, 0),
+    "UP": (0, 1, 0), "DOWN": (0, -1, 0),
+    "OUT": (0, 0, 1), "IN": (0, 0, -1),
+}
+THREE_D_FRAME_CONSTANTS = {"frame_width": "14.2", "frame_height": "8"}
+
+_rules: dict[type, list[tuple[str, Callable]]] = {}
+_hits: dict[str, int] = {}
+_stats = {"scripts": 0, "repeat": 0, "rewritten": 0, "passes": 0, "fallbacks": 0}
+_seen: OrderedDict[str, tuple[str, list[str]]] = OrderedDict()
+
+
+def rule(name: str, *node_types: type):
+    """Register `fn(node, script)` to run on every node of the given types."""
+    def register(fn):
+        for node_type in node_types:
+            _rules.setdefault(node_type, []).append((name, fn))
+        _hits.setdefault(name, 0)
+        return fn
+    return register
+
+
+def _dotted(node: ast.AST) -> str | None:
+    """'self.camera.frame' for a plain attribute chain, else None."""
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        base = _dotted(node.value)
+        return f"{base}.{node.attr}" if base else None
+    return None
+
+
+def _root_call_name(node: ast.AST) -> str | None:
+    """For `Cls(...)` or `Cls(...).scale(2).shift(UP)`, return 'Cls'."""
+    while isinstance(node, ast.Call):
+        func = node.func
+        if isinstance(func, ast.Name):
+            return func.id
+        if not isinstance(func, ast.Attribute):
+            return None
+        node = func.value
+    return None
+
+
+def _is_camera_animation(node: ast.AST) -> bool:
+    """`self.camera.animate...` or `self.camera.<x>.animate...`; the camera isn't a Mobject."""
+    while isinstance(node, (ast.Call, ast.Attribute)):
+        if isinstance(node, ast.Attribute) and node.attr == "animate":
+            base = node.value
+            return _dotted(base) == "self.camera" or (
+                isinstance(base, ast.Attribute) and _dotted(base.value) == "self.camera"
+            )
+        node = node.func if isinstance(node, ast.Call) else node.value
+    return False
+
+
+class EditableScript:
+    """
+    One parsed script: analysis facts the rules need, plus the edits they propose.
+    Also used by repair_rules for its traceback-driven patches.
+    """
+
+    def __init__(self, source: str, tree: ast.Module):
+        self.tree = tree
+        self.data = source.encode("utf-8")
+        self.line_starts = [0]
+        for line in self.data.splitlines(keepends=True):
+            self.line_starts.append(self.line_starts[-1] + len(line))
+        # (start, end, replacement, (rule name, node id))
+        self.edits: list[tuple[int, int, str, tuple]] = []
+        self.removals: dict[int, tuple[ast.stmt, tuple]] = {}
+        self._site: tuple = ("", 0)
+        self.applied: list[str] = []  # rule name per node rewritten by apply()
+
+        self.block_of: dict[int, list] = {}
+        self.bound: set[str] = set()
+        self.loaded: set[str] = set()
+        self.image_vars: set[str] = set()
+        self.manim_import: ast.ImportFrom | None = None
+        self.future_imports: list[ast.ImportFrom] = []
+        # call node id -> the expression statement it makes up on its own
+        self.call_stmts: dict[int, ast.Expr] = {}
+        for node in ast.walk(tree):
+            for value in ast.iter_fields(node):
+                if isinstance(value[1], list):
+                    for child in value[1]:
+                        if isinstance(child, ast.stmt):
+                            self.block_of[id(child)] = value[1]
+            if isinstance(node, ast.Name):
+                (self.loaded if isinstance(node.ctx, ast.Load) else self.bound).add(node.id)
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                self.bound.add(node.name)
+            elif isinstance(node, (ast.Import, ast.ImportFrom)):
+                for alias in node.names:
+                    self.bound.add(alias.asname or alias.name.split(".")[0])
+                if isinstance(node, ast.ImportFrom) and node.module == "manim" and self.manim_import is None:
+                    self.manim_import = node
+                if isinstance(node, ast.ImportFrom) and node.module == "__future__":
+                    self.future_imports.append(node)
+            elif isinstance(node, ast.Expr) and isinstance(node.value, ast.Call):
+                self.call_stmts[id(node.value)] = node
+            elif isinstance(node, ast.Assign) and _root_call_name(node.value) == "ImageMobject":
+                self.image_vars.update(t.id for t in node.targets if isinstance(t, ast.Name))
+        self.three_d = "ThreeDScene" in self.loaded
+
+    # Positions. ast columns are UTF-8 byte offsets, so all edits work on bytes.
+
+    def offset(self, lineno: int, col: int) -> int:
+        return self.line_starts[lineno - 1] + col
+
+    def line_start(self, lineno: int) -> int:
+        return self.line_starts[lineno - 1] if lineno <= len(self.line_starts) else len(self.data)
+
+    def span(self, node: ast.AST) -> tuple[int, int]:
+        return self.offset(node.lineno, node.col_offset), self.offset(node.end_lineno, node.end_col_offset)
+
+    def text(self, node: ast.AST) -> str:
+        start, end = self.span(node)
+        return self.data[start:end].decode("utf-8")
+
+    def indent_of(self, node: ast.stmt) -> str | None:
+        """Leading whitespace of the statement's line, or None if something precedes it."""
+        prefix = self.data[self.line_start(node.lineno):self.span(node)[0]]
+        return prefix.decode("utf-8") if not prefix.strip() else None
+
+    # Edits
+
+    def site(self, rule_name: str, key: int = 0):
+        """Tag the edits that follow as one rule's change to one node."""
+        self._site = (rule_name, key)
+
+    def replace(self, start: int, end: int, text: str):
+        self.edits.append((start, end, text, self._site))
+
+    def replace_node(self, node: ast.AST, text: str):
+        self.replace(*self.span(node), text)
+
+    def drop_call(self, call: ast.Call, receiver: ast.AST):
+        """Replace `receiver.method(...)` with `receiver`, or drop the statement if nothing would be left."""
+        stmt = self.call_stmts.get(id(call))
+        if stmt is not None and isinstance(receiver, ast.Name):
+            self.remove_stmt(stmt)
+        else:
+            self.replace_node(call, self.text(receiver))
+
+    def rename_attr(self, node: ast.Attribute, new: str):
+        end = self.span(node)[1]
+        self.replace(end - len(node.attr.encode("utf-8")), end, new)
+
+    def rename_keyword(self, kw: ast.keyword, new: str):
+        start = self.offset(kw.lineno, kw.col_offset)
+        self.replace(start, start + len(kw.arg.encode("utf-8")), new)
+
+    def rename_arg(self, arg: ast.arg, new: str):
+        start = self.offset(arg.lineno, arg.col_offset)
+        self.replace(start, start + len(arg.arg.encode("utf-8")), new)
+
+    def drop_args(self, call: ast.Call, drop: list[ast.AST]):
+        """Remove arguments from a call together with their separating commas."""
+        items = sorted(call.args + call.keywords, key=lambda n: (n.lineno, n.col_offset))
+        dropped = {id(n) for n in drop}
+        i = 0
+        while i < len(items):
+            if id(items[i]) not in dropped:
+                i += 1
+                continue
+            j = i
+            while j + 1 < len(items) and id(items[j + 1]) in dropped:
+                j += 1
+            if i > 0:
+                start, end = self.span(items[i - 1])[1], self.span(items[j])[1]
+            elif j + 1 < len(items):
+                start, end = self.span(items[i])[0], self.span(items[j + 1])[0]
+            else:
+                start, end = self.span(items[i])[0], self.span(items[j])[1]
+            self.replace(start, end, "")
+            i = j + 1
+
+    def remove_stmt(self, stmt: ast.stmt):
+        self.removals.setdefault(id(stmt), (stmt, self._site))
+
+    def _resolve_removals(self):
+        by_block: dict[int, list] = {}
+        for stmt, site in self.removals.values():
+            by_block.setdefault(id(self.block_of[id(stmt)]), []).append((stmt, site))
+        for items in by_block.values():
+            # Python blocks can't be empty
+            emptied = len(items) == len(self.block_of[id(items[0][0])])
+            for i, (stmt, site) in enumerate(items):
+                self._site = site
+                start, end = self.span(stmt)
+                line_start = self.line_start(stmt.lineno)
+                next_line = self.line_start(stmt.end_lineno + 1)
+                trailing = self.data[end:next_line].strip()
+                whole_lines = not self.data[line_start:start].strip() and (not trailing or trailing.startswith(b"#"))
+                if (emptied and i == 0) or not whole_lines:
+                    self.replace(start, end, "pass")
+                else:
+                    self.replace(line_start, next_line, "")
+
+    def walk(self):
+        for node in ast.walk(self.tree):
+            for rule_name, fn in _rules.get(type(node), ()):
+                self.site(rule_name, id(node))
+                fn(node, self)
+
+    def apply(self) -> str:
+        """
+        Splice the edits into the source. A rule's edits for one node go in all
+        together or not at all; ones that overlap an edit already taken wait
+        for the next pass, and ones that overlap themselves are dropped.
+        """
+        self._resolve_removals()
+        sites: dict[tuple, list] = {}
+        for edit in self.edits:
+            sites.setdefault(edit[3], []).append(edit)
+        taken = []
+        for site, edits in sorted(sites.items(), key=lambda kv: min((e[0], -e[1]) for e in kv[1])):
+            ordered = sorted(edits, key=lambda e: (e[0], e[1]))
+            if any(a[1] > b[0] for a, b in zip(ordered, ordered[1:])):
+                continue  # a rule that edits inside its own replacement
+            if any(s < e2 and s2 < e for s, e, *_ in edits for s2, e2, *_ in taken):
+                continue
+            taken += edits
+            self.applied.append(site[0])
+        out, last = [], 0
+        for start, end, text, _ in sorted(taken, key=lambda e: (e[0], e[1])):
+            out.append(self.data[last:start])
+            out.append(text.encode("utf-8"))
+            last = end
+        out.append(self.data[last:])
+        return b"".join(out).decode("utf-8")
+
+
+# -----------------------
+# Rules
+# -----------------------
+@rule("imports", ast.Module)
+def _imports(node: ast.Module, script: EditableScript):
+    header = ""
+    if script.manim_import is None:
+        header += "from manim import *\n"
+    if "np" in script.loaded and "np" not in script.bound:
+        header += "import numpy as np\n"
+    if not header:
+        return
+    # numpy goes right under the manim import; a new manim import goes at the top, after any __future__ imports
+    if script.manim_import is not None:
+        anchor = script.manim_import
+    else:
+        anchor = script.future_imports[-1] if script.future_imports else None
+    if anchor is None:
+        script.replace(0, 0, header)
+        return
+    at = script.line_start(anchor.end_lineno + 1)
+    if at == len(script.data) and not script.data.endswith(b"\n"):
+        header = "\n" + header
+    script.replace(at, at, header)
+
+
+@rule("deprecated-api", ast.Name)
+def _deprecated_names(node: ast.Name, script: EditableScript):
+    if isinstance(node.ctx, ast.Load) and node.id in DEPRECATED_NAMES and node.id not in script.bound:
+        script.replace_node(node, DEPRECATED_NAMES[node.id])
+
+
+@rule("hallucinated-name", ast.Name)
+def _hallucinated_names(node: ast.Name, script: EditableScript):
+    if isinstance(node.ctx, ast.Load) and node.id in HALLUCINATED_NAMES and node.id not in script.bound:
+        script.replace_node(node, HALLUCINATED_NAMES[node.id])
+
+
+@rule("renamed-method", ast.Call)
+def _renamed_methods(node: ast.Call, script: EditableScript):
+    func = node.func
+    if isinstance(func, ast.Attribute) and func.attr in METHOD_RENAMES:
+        script.rename_attr(func, METHOD_RENAMES[func.attr])
+
+
+@rule("set-stroke-width", ast.Call)
+def _set_stroke_width(node: ast.Call, script: EditableScript):
+    func = node.func
+    if not (isinstance(func, ast.Attribute) and func.attr == "set_stroke_width"):
+        return
+    script.rename_attr(func, "set_stroke")
+    if node.args:
+        start = script.span(node.args[0])[0]
+        script.replace(start, start, "width=")
+
+
+@rule("corner-getter", ast.Call)
+def _corner_getters(node: ast.Call, script: EditableScript):
+    func = node.func
+    if isinstance(func, ast.Attribute) and func.attr in CORNER_GETTERS and not node.args and not node.keywords:
+        end = script.span(node)[1]
+        start = script.span(func)[1] - len(func.attr)
+        script.replace(start, end, f"get_corner({CORNER_GETTERS[func.attr]})")
+
+
+@rule("to-center", ast.Call)
+def _to_center(node: ast.Call, script: EditableScript):
+    func = node.func
+    if isinstance(func, ast.Attribute) and func.attr == "to_center" and not node.args and not node.keywords:
+        script.replace(script.span(func)[1] - len(func.attr), script.span(node)[1], "move_to(ORIGIN)")
+
+
+@rule("coordinate-labels", ast.Call)
+def _coordinate_labels(node: ast.Call, script: EditableScript):
+    # Removed from Axes in CE; drop the call and keep the receiver
+    func = node.func
+    if isinstance(func, ast.Attribute) and func.attr == "add_coordinate_labels":
+        script.drop_call(node, func.value)
+
+
+@rule("image-set-stroke", ast.Call)
+def _image_set_stroke(node: ast.Call, script: EditableScript):
+    func = node.func
+    if not (isinstance(func, ast.Attribute) and func.attr == "set_stroke"):
+        return
+    receiver = func.value
+    if (isinstance(receiver, ast.Name) and receiver.id in script.image_vars) \
+            or _root_call_name(receiver) == "ImageMobject":
+        script.drop_call(node, receiver)
+
+
+@rule("image-in-vgroup", ast.Call)
+def _image_in_vgroup(node: ast.Call, script: EditableScript):
+    # ImageMobject is not a VMobject, so it needs a plain Group
+    if not (isinstance(node.func, ast.Name) and node.func.id == "VGroup"):
+        return
+    for arg in node.args:
+        arg = arg.value if isinstance(arg, ast.Starred) else arg
+        if (isinstance(arg, ast.Name) and arg.id in script.image_vars) or _root_call_name(arg) == "ImageMobject":
+            script.replace_node(node.func, "Group")
+            return
+
+
+@rule("vector-to-scalar", ast.Call)
+def _vector_to_scalar(node: ast.Call, script: EditableScript):
+    # set_x(RIGHT * 3) -> set_x(3): these setters take a coordinate, not a vector
+    func = node.func
+    if not (isinstance(func, ast.Attribute) and func.attr in ("set_x", "set_y", "set_z")
+            and len(node.args) == 1 and not node.keywords):
+        return
+    axis = "xyz".index(func.attr[-1])
+    arg = node.args[0]
+
+    def is_number(n: ast.AST) -> bool:
+        if isinstance(n, ast.UnaryOp) and isinstance(n.op, (ast.USub, ast.UAdd)):
+            n = n.operand
+        return isinstance(n, ast.Constant) and isinstance(n.value, (int, float)) and not isinstance(n.value, bool)
+
+    replacement = None
+    if isinstance(arg, ast.Name) and arg.id in DIRECTIONS:
+        replacement = str(DIRECTIONS[arg.id][axis])
+    elif isinstance(arg, ast.BinOp) and isinstance(arg.op, ast.Mult):
+        for vec, num in ((arg.left, arg.right), (arg.right, arg.left)):
+            if isinstance(vec, ast.Name) and vec.id in DIRECTIONS and is_number(num):
+                component = DIRECTIONS[vec.id][axis]
+                value = script.text(num)
+                if component == -1:
+                    value = f"-{value}" if isinstance(num, ast.Constant) else f"-({value})"
+                replacement = value if component else "0"
+                break
+    if replacement is None and any(isinstance(n, ast.Name) and n.id in DIRECTIONS for n in ast.walk(arg)):
+        # Can't evaluate the vector statically; any scalar beats crashing the render
+        replacement = "1.0"
+    if replacement is not None:
+        script.replace_node(arg, replacement)
+
+
+@rule("renamed-kwarg", ast.Call)
+def _renamed_kwargs(node: ast.Call, script: EditableScript):
+    if not isinstance(node.func, ast.Name):
+        return
+    renames = KWARG_RENAMES.get(node.func.id)
+    if not renames:
+        return
+    present = {kw.arg for kw in node.keywords}
+    for kw in node.keywords:
+        new = renames.get(kw.arg)
+        if new and new not in present:
+            script.rename_keyword(kw, new)
+
+
+@rule("invalid-kwarg", ast.Call)
+def _invalid_kwargs(node: ast.Call, script: EditableScript):
+    drop = [kw for kw in node.keywords if kw.arg in INVALID_KWARGS and isinstance(kw.value, ast.Constant)]
+    if drop:
+        script.drop_args(node, drop)
+
+
+@rule("cube-dimensions", ast.Call)
+def _cube_dimensions(node: ast.Call, script: EditableScript):
+    # Cube only has side_length; use the largest of the requested dimensions
+    if not (isinstance(node.func, ast.Name) and node.func.id == "Cube"):
+        return
+    dims = {kw.arg: kw for kw in node.keywords if kw.arg in ("x_length", "y_length", "z_length")}
+    if not dims or any(kw.arg == "side_length" for kw in node.keywords):
+        return
+    values = [script.text(dims[d].value) if d in dims else "0" for d in ("x_length", "y_length", "z_length")]
+    first, *rest = sorted(dims.values(), key=lambda kw: (kw.lineno, kw.col_offset))
+    script.replace_node(first, f"side_length=max({', '.join(values)})")
+    if rest:
+        script.drop_args(node, rest)
+
+
+@rule("play-move-camera", ast.Expr)
+def _play_move_camera(node: ast.Expr, script: EditableScript):
+    # self.play(self.move_camera(...)): move_camera animates by itself and returns None
+    call = node.value
+    if not (isinstance(call, ast.Call) and _dotted(call.func) == "self.play"
+            and len(call.args) == 1 and not call.keywords):
+        return
+    inner = call.args[0]
+    if not (isinstance(inner, ast.Call) and _dotted(inner.func) == "self.move_camera"):
+        return
+    indent = script.indent_of(node)
+    separator = f"\n{indent}" if indent is not None else "; "
+    script.replace_node(node, f"{script.text(inner)}{separator}self.wait(0.5)")
+
+
+@rule("camera-animate-3d", ast.Expr)
+def _camera_animate_3d(node: ast.Expr, script: EditableScript):
+    if not script.three_d:
+        return
+    call = node.value
+    if _is_camera_animation(call):
+        script.remove_stmt(node)
+    elif isinstance(call, ast.Call) and _dotted(call.func) == "self.play":
+        drop = [a for a in call.args if _is_camera_animation(a)]
+        if drop and len(drop) == len(call.args):
+            script.remove_stmt(node)
+        elif drop:
+            script.drop_args(call, drop)
+
+
+@rule("camera-project-3d", ast.Call)
+def _camera_project_3d(node: ast.Call, script: EditableScript):
+    if script.three_d and _dotted(node.func) == "self.camera.project_to_frame":
+        script.replace_node(node, "ORIGIN")
+
+
+@rule("config-frame-3d", ast.Attribute)
+def _config_frame_3d(node: ast.Attribute, script: EditableScript):
+    if script.three_d and isinstance(node.ctx, ast.Load) and isinstance(node.value, ast.Name) \
+            and node.value.id == "config" and node.attr in THREE_D_FRAME_CONSTANTS:
+        script.replace_node(node, THREE_D_FRAME_CONSTANTS[node.attr])
+
+
+@rule("stale-import", ast.ImportFrom)
+def _stale_imports(node: ast.ImportFrom, script: EditableScript):
+    # Everything it could provide is already in `from manim import *`
+    if (node.module or "").startswith("manim.mobject.types.vectorized_mobject"):
+        script.remove_stmt(node)
+
+
+def _rename_in(body: list[ast.AST], names: dict[str, str], script: EditableScript):
+    for stmt in body:
+        for n in ast.walk(stmt):
+            if isinstance(n, ast.Name) and n.id in names:
+                script.replace_node(n, names[n.id])
+
+
+def _local_names(fn: ast.AST) -> set[str]:
+    names = set()
+    for n in ast.walk(fn):
+        if isinstance(n, ast.Name) and not isinstance(n.ctx, ast.Load):
+            names.add(n.id)
+        elif isinstance(n, ast.arg):
+            names.add(n.arg)
+    return names
+
+
+@rule("updater-signature", ast.FunctionDef)
+def _updater_signature(node: ast.FunctionDef, script: EditableScript):
+    """Updater functions take (mobject, dt); bodies often use a different name for dt."""
+    args = node.args
+    params = args.args
+    if not node.name.startswith("update") or args.vararg or args.kwarg or args.kwonlyargs or args.posonlyargs:
+        return
+    if params and params[0].arg == "self":
+        return
+    body_names = set().union(*(_local_names(stmt) for stmt in node.body))
+    if "dt" in body_names:
+        return
+    renames = {alias: "dt" for alias in DT_ALIASES if alias not in body_names | {p.arg for p in params}}
+    if len(params) == 0:
+        paren = script.data.index(b"(", script.offset(node.lineno, node.col_offset)) + 1
+        script.replace(paren, paren, "mobject, dt=0")
+    elif len(params) == 1:
+        end = script.span(args.defaults[-1] if args.defaults else params[0])[1]
+        script.replace(end, end, ", dt=0")
+    elif params[1].arg != "dt":
+        script.rename_arg(params[1], "dt")
+        renames[params[1].arg] = "dt"
+    _rename_in(node.body, renames, script)
+
+
+@rule("updater-lambda", ast.Call)
+def _updater_lambda(node: ast.Call, script: EditableScript):
+    func = node.func
+    if not (isinstance(func, ast.Attribute) and func.attr == "add_updater" and node.args):
+        return
+    fn = node.args[0]
+    if not isinstance(fn, ast.Lambda) or len(fn.args.args) != 2:
+        return
+    dt_param = fn.args.args[1]
+    if dt_param.arg == "dt" or "dt" in _local_names(fn):
+        return
+    script.rename_arg(dt_param, "dt")
+    _rename_in([fn.body], {dt_param.arg: "dt"}, script)
+
+
+# -----------------------
+# Entry point
+# -----------------------
+def _legacy_sanitize(code: str) -> str:
+    from app.services.video_renderer import sanitize_manim_script
+
+    code = sanitize_manim_script(code)
+    code = normalize_indentation(code)
+    code = sanitize_updaters(code)
+    code = sanitize_3d_camera(code)
+    return apply_anticrash_rules(code)
+
+
+def _remember(key: str, result: str, rules: list[str]):
+    # The output is a fixed point, so it maps to itself with nothing applied
+    for k, v in ((key, (result, rules)), (_digest(result), (result, []))):
+        _seen[k] = v
+        _seen.move_to_end(k)
+    while len(_seen) > _SEEN_MAX:
+        _seen.popitem(last=False)
+
+
+def _digest(code: str) -> str:
+    return hashlib.sha1(code.encode("utf-8")).hexdigest()
+
+
+def sanitize_script(code: str) -> str:
+    """Apply every registered rule to `code` and return the fixed-up script."""
+    return sanitize_with_report(code)[0]
+
+
+def sanitize_with_report(code: str) -> tuple[str, list[str]]:
+    """Like sanitize_script, but also return the names of the rules that changed something."""
+    code = (code or "").replace("\r\n", "\n")
+    _stats["scripts"] += 1
+    key = _digest(code)
+    cached = _seen.get(key)
+    if cached is not None:
+        _stats["repeat"] += 1
+        _seen.move_to_end(key)
+        return cached
+
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        repaired = normalize_indentation(code)
+        try:
+            tree = ast.parse(repaired)
+            code = repaired
+        except SyntaxError:
+            _stats["fallbacks"] += 1
+            result = _legacy_sanitize(code)
+            _remember(key, result, ["legacy-regex"])
+            return result, ["legacy-regex"]
+
+    result, applied = code, []
+    for _ in range(MAX_PASSES):
+        _stats["passes"] += 1
+        script = EditableScript(result, tree)
+        script.walk()
+        if not script.edits and not script.removals:
+            break
+        rewritten = script.apply()
+        try:
+            tree = ast.parse(rewritten)
+        except SyntaxError as e:
+            logger.warning(f"[Sanitizer] Rewrite produced invalid code, keeping the last valid version: {e}")
+            break
+        result = rewritten
+        applied += script.applied
+        for name in script.applied:
+            _hits[name] += 1
+    else:
+        logger.warning(f"[Sanitizer] Still rewriting after {MAX_PASSES} passes")
+
+    if result != code:
+        _stats["rewritten"] += 1
+    _remember(key, result, applied)
+    return result, applied
+
+
+def get_stats() -> dict:
+    return {**_stats, "cached": len(_seen), "rule_hits": {k: v for k, v in _hits.items() if v}}
@@ -42,3 +42,47 @@ def strip_markdown_fences(code: str) -> str:
     code = re.sub(r"```+\w*", "", code)
     code = code.replace("```", "")
     return code.strip()
+
+
+class StreamingExtractor:
+    """
+    Incremental version of extract_code for streamed responses.
+
+    Feed chunks as they arrive; `code` is the script so far and `closed` turns
+    true once the code fence has been closed, after which the rest of the
+    response is just prose and can be skipped.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._fence: int | None = None  # opening ``` position
+        self._start: int | None = None  # where the fenced code begins
+        self._end: int | None = None
+        self.closed = False
+
+    def feed(self, chunk: str):
+        scan_from = max(0, len(self.text) - 2)  # a fence may straddle two chunks
+        self.text += chunk
+        if self._fence is None:
+            fence = self.text.find("```", scan_from)
+            if fence == -1:
+                return
+            self._fence = fence
+        if self._start is None:
+            newline = self.text.find("\n", self._fence)
+            if newline == -1:
+                return  # language hint not finished yet
+            self._start = scan_from = newline + 1
+        if not self.closed:
+            end = self.text.find("```", max(scan_from, self._start))
+            if end != -1:
+                self._end = end
+                self.closed = True
+
+    @property
+    def code(self) -> str:
+        if self._start is None:
+            # No fence (yet): same fallback as extract_code, code starts at the imports or the scene
+            match = re.search(r"^(?:from |class GeneratedScene)", self.text, re.MULTILINE)
+            return self.text[match.start():] if match else ""
+        return self.text[self._start:self._end]
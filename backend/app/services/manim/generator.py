@@ -1,36 +1,87 @@
 """
 Manim script generation with RAG context from Pinecone.
 """
-import re
+import asyncio
+import codeop
 import logging
+import time
+import warnings
+from contextlib import aclosing
+from typing import Awaitable, Callable
+
 from langchain_core.messages import SystemMessage, HumanMessage
 
 from app.prompts.manim_prompt import MANIM_SYSTEM_PROMPT, MANIM_USER_PROMPT
+from app.config import get_settings
 from app.services.manim.llm import get_llm
+from app.services.client_registry import get_chat_model
+from app.services.manim.planner import plan_video_narrative
+from app.services.manim.pipeline import Stage, run_stages, format_timings
 from app.services.vector_store import get_relevant_examples, format_examples_for_context
-from app.services.video_renderer import sanitize_manim_script
-from app.services.manim.extractor import extract_code, strip_markdown_fences
-from app.services.manim.sanitizers import (
-    normalize_indentation,
-    sanitize_updaters,
-    sanitize_3d_camera,
-    apply_anticrash_rules,
-)
+from app.services.manim.extractor import extract_code, strip_markdown_fences, StreamingExtractor
+from app.services.manim.ast_sanitizer import sanitize_script
 from app.services.manim.self_healer import generate_improved_code
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
+
+_stream_stats = {"streams": 0, "stopped_at_fence": 0, "aborted": 0, "retried": 0}
+_speculative_stats = {"runs": 0, "won": 0, "all_failed": 0, "cancelled": 0}
+
+
+class GenerationAbortedError(RuntimeError):
+    """The streamed script was clearly malformed, so generation stopped early."""
+
 
+class CandidatesFailedError(RuntimeError):
+    """Every speculative candidate was rejected; carries the first one and why."""
+
+    def __init__(self, script: str, error: Exception):
+        self.script = script
+        super().__init__(str(error))
+
+
+def _stream_problem(code: str) -> str | None:
+    """Why a partial script can't turn into a usable one, or None if it still can."""
+    if len(code) > settings.generation_max_chars:
+        return f"script passed {settings.generation_max_chars} characters"
+    if len(code) > settings.generation_scene_deadline and "class GeneratedScene" not in code:
+        return f"no GeneratedScene class in the first {settings.generation_scene_deadline} characters"
+    # Only complete lines; an error before the last one can't be fixed by more tokens
+    complete = code[:code.rfind("\n") + 1]
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            codeop.compile_command(complete, symbol="exec")
+    except SyntaxError as e:
+        if e.lineno is not None and e.lineno < complete.count("\n"):
+            return f"syntax error on line {e.lineno}: {e.msg}"
+    return None
 
-async def generate_manim_script(user_prompt: str, duration: int = 15, force_image: bool = False) -> str:
+
+def get_stream_stats() -> dict:
+    return {**_stream_stats, "speculative": dict(_speculative_stats)}
+
+
+async def generate_manim_script(user_prompt: str, duration: int = 15, force_image: bool = False,
+                                on_partial: Callable[[str], Awaitable[None]] | None = None,
+                                candidates: int = 1, vet: Callable[[str], Awaitable[None]] | None = None) -> str:
     """
     Generate Manim script from user prompt using RAG.
     
     Pipeline:
     1. [DISABLED] Enhance the raw prompt into a structured animation spec
-    2. Retrieve relevant examples from Pinecone
-    3. Generate code using LLM
+    2. Plan the storyboard and retrieve relevant examples from Pinecone (concurrently)
+    3. Stream code from the LLM, passing the partial script to `on_partial`
+       and stopping early if it is clearly malformed
     4. Apply sanitizers and anti-crash rules
     5. Validate syntax, attempt self-healing if needed
+
+    With `candidates` > 1 and a `vet` coroutine, that many scripts are
+    generated concurrently (at settings.speculative_temperatures) and each
+    finished one is passed to `vet`, which raises RuntimeError to reject it.
+    The first accepted script is returned and the rest are cancelled. If all
+    are rejected, CandidatesFailedError carries the first rejected script.
     """
     # Step 0: Enhancement DISABLED for quality improvement
     # user_prompt = await enhance_user_prompt(user_prompt)
@@ -39,30 +90,23 @@ async def generate_manim_script(user_prompt: str, duration: int = 15, force_imag
     logger.info(f"[LLM] Generating script for: {user_prompt[:100]}... (force_image={force_image})")
     
     # Step 1: Research & Storyboarding (The "3b1b" Phase)
-    from app.services.manim.planner import plan_video_narrative
-    storyboard = await plan_video_narrative(user_prompt)
-    
-    # Log only the summary to keep logs clean
-    story_preview = storyboard.split('\n')[0][:100] + "..." if '\n' in storyboard else storyboard[:100]
-    logger.info(f"[Planner] Storyboard designed: {story_preview}")
-    print(f"[Planner] Storyboard designed: {story_preview}")
+    async def storyboard_stage() -> str:
+        storyboard = await plan_video_narrative(user_prompt)
+        # Log only the summary to keep logs clean
+        story_preview = storyboard.split('\n')[0][:100] + "..." if '\n' in storyboard else storyboard[:100]
+        logger.info(f"[Planner] Storyboard designed: {story_preview}")
+        print(f"[Planner] Storyboard designed: {story_preview}")
+        return storyboard
 
     # Step 2: Retrieve relevant examples from Pinecone
-    logger.info("[LLM] Querying Pinecone for relevant examples...")
-    print("[LLM] Querying Pinecone for relevant examples...")
-    examples = await get_relevant_examples(user_prompt, top_k=5)
-    context = format_examples_for_context(examples)
-    
-    if examples:
-        print(f"[LLM] RAG Success: Retrieved {len(examples)} examples (Top Score: {examples[0].get('score', 0):.2f})")
-    else:
-        print("[LLM] RAG: No relevant examples found in Pinecone. Proceeding with base knowledge.")
-    
-    # Step 3: Build the prompt with Storyboard + RAG Context
-    llm = get_llm()
-    
-    # Fill in both storyboard and RAG context
-    system_prompt_with_context = MANIM_SYSTEM_PROMPT.replace("{storyboard}", storyboard).replace("{context}", context)
+    async def examples_stage() -> list[dict]:
+        print("[LLM] Querying Pinecone for relevant examples...")
+        examples = await get_relevant_examples(user_prompt, top_k=5)
+        if examples:
+            print(f"[LLM] RAG Success: Retrieved {len(examples)} examples (Top Score: {examples[0].get('score', 0):.2f})")
+        else:
+            print("[LLM] RAG: No relevant examples found in Pinecone. Proceeding with base knowledge.")
+        return examples
     
     # Calculate duration constraints
     min_dur = max(5, duration - 2)
@@ -109,98 +153,179 @@ This is a VALIDATION REQUIREMENT. Code without ImageMobject will be REJECTED.
 """
         user_prompt_formatted += image_instruction
     
-    # Step 3: Create messages
-    messages = [
-        SystemMessage(content=system_prompt_with_context),
-        HumanMessage(content=user_prompt_formatted)
-    ]
-    
-    # Step 4: Generate the script
-    logger.info("[LLM] Calling Gemini...")
-    result = await llm.ainvoke(messages)
+    # Step 3: Create messages and generate the script
+    def build_messages(storyboard: str, examples: list[dict]) -> list:
+        context = format_examples_for_context(examples)
+        # Fill in both storyboard and RAG context
+        system_prompt_with_context = MANIM_SYSTEM_PROMPT.replace("{storyboard}", storyboard).replace("{context}", context)
+        return [
+            SystemMessage(content=system_prompt_with_context),
+            HumanMessage(content=user_prompt_formatted)
+        ]
 
-    code = extract_code(result.content)
-    code = strip_markdown_fences(code)
+    async def generate_raw(messages: list, llm, partial_cb) -> str:
+        for attempt in range(settings.generation_retries + 1):
+            try:
+                return await stream_script(messages, llm, partial_cb)
+            except GenerationAbortedError as e:
+                _stream_stats["aborted"] += 1
+                print(f"[LLM] Generation aborted early: {e}")
+                if attempt == settings.generation_retries:
+                    raise
+                _stream_stats["retried"] += 1
 
-    # Sanitize API compatibility
-    code = sanitize_manim_script(code)
+    async def stream_script(messages: list, llm, partial_cb) -> str:
+        logger.info("[LLM] Streaming from Gemini...")
+        _stream_stats["streams"] += 1
+        stream = StreamingExtractor()
+        last_check = 0.0
+        async with aclosing(llm.astream(messages)) as chunks:
+            async for chunk in chunks:
+                stream.feed(chunk.content)
+                now = time.monotonic()
+                if now - last_check >= settings.generation_stream_interval or stream.closed:
+                    last_check = now
+                    code = stream.code
+                    problem = _stream_problem(code)
+                    if problem:
+                        raise GenerationAbortedError(problem)
+                    if partial_cb and code:
+                        await partial_cb(code)
+                if stream.closed:
+                    # Whatever follows the closing fence is commentary we'd throw away
+                    _stream_stats["stopped_at_fence"] += 1
+                    break
+        return stream.text
 
-    # Normalize indentation
-    code = normalize_indentation(code)
-    
-    # Sanitize updaters
-    code = sanitize_updaters(code)
-    
-    # Sanitize 3D camera
-    code = sanitize_3d_camera(code)
-    
-    # Master anti-crash engine
-    code = apply_anticrash_rules(code)
+    # Step 4-5: Sanitize, inject a required image, check syntax
+    async def finish(raw: str) -> str:
+        code = extract_code(raw)
+        code = strip_markdown_fences(code)
 
-    # HALLUCINATION FALLBACKS
-    # Gear is not a built-in Manim CE class
-    code = re.sub(r"\bGear\b", "Circle", code)
-    
-    # IMAGE VALIDATION & AUTO-INJECTION
-    if force_image and 'ImageMobject' not in code:
-        logger.warning("[LLM] Image required but ImageMobject not found in generated code. Auto-injecting...")
-        print("[LLM] ⚠️  Auto-injecting ImageMobject placeholder")
-        
-        # Insert ImageMobject after title creation
-        lines = code.split('\n')
-        inject_index = None
+        # API compatibility, updater and 3D camera fixes, anti-crash rules
+        code = sanitize_script(code)
+
+        # IMAGE VALIDATION & AUTO-INJECTION
+        if force_image and 'ImageMobject' not in code:
+            logger.warning("[LLM] Image required but ImageMobject not found in generated code. Auto-injecting...")
+            print("[LLM] ⚠️  Auto-injecting ImageMobject placeholder")
         
-        # Find where to inject (after first self.play or after color definitions)
-        for i, line in enumerate(lines):
-            if 'self.play(Write(title' in line or 'self.play(FadeIn(title' in line:
-                inject_index = i + 1
-                break
+            # Insert ImageMobject after title creation
+            lines = code.split('\n')
+            inject_index = None
         
-        # Fallback: inject after construct def
-        if inject_index is None:
+            # Find where to inject (after first self.play or after color definitions)
             for i, line in enumerate(lines):
-                if 'def construct(self):' in line:
-                    inject_index = i + 2  # Skip def and likely a background line
+                if 'self.play(Write(title' in line or 'self.play(FadeIn(title' in line:
+                    inject_index = i + 1
                     break
         
-        if inject_index:
-            # Detect existing indentation level of the anchor line (or the line above it)
-            anchor_line = lines[inject_index - 1]
-            base_indent = len(anchor_line) - len(anchor_line.lstrip())
-            indent_prefix = ' ' * base_indent
+            # Fallback: inject after construct def
+            if inject_index is None:
+                for i, line in enumerate(lines):
+                    if 'def construct(self):' in line:
+                        inject_index = i + 2  # Skip def and likely a background line
+                        break
+        
+            if inject_index:
+                # Detect existing indentation level of the anchor line (or the line above it)
+                anchor_line = lines[inject_index - 1]
+                base_indent = len(anchor_line) - len(anchor_line.lstrip())
+                indent_prefix = ' ' * base_indent
             
-            # Auto-inject ImageMobject with smart prompt extraction and correct indentation
-            prompt_snippet = user_prompt[:60] if len(user_prompt) < 60 else user_prompt[:57] + "..."
+                # Auto-inject ImageMobject with smart prompt extraction and correct indentation
+                prompt_snippet = user_prompt[:60] if len(user_prompt) < 60 else user_prompt[:57] + "..."
             
-            image_code_lines = [
-                f"{indent_prefix}# Auto-injected ImageMobject",
-                f"{indent_prefix}main_img = ImageMobject(\"{{{{IMAGE:{prompt_snippet}}}}}\")",
-                f"{indent_prefix}main_img.scale_to_fit_height(5)",
-                f"{indent_prefix}main_img.move_to(ORIGIN)",
-                f"{indent_prefix}self.play(FadeIn(main_img, run_time=1))",
-                f"{indent_prefix}self.wait(1)"
-            ]
+                image_code_lines = [
+                    f"{indent_prefix}# Auto-injected ImageMobject",
+                    f"{indent_prefix}main_img = ImageMobject(\"{{{{IMAGE:{prompt_snippet}}}}}\")",
+                    f"{indent_prefix}main_img.scale_to_fit_height(5)",
+                    f"{indent_prefix}main_img.move_to(ORIGIN)",
+                    f"{indent_prefix}self.play(FadeIn(main_img, run_time=1))",
+                    f"{indent_prefix}self.wait(1)"
+                ]
             
-            # Insert lines in reverse to maintain correct insertion point
-            for line in reversed(image_code_lines):
-                lines.insert(inject_index, line)
+                # Insert lines in reverse to maintain correct insertion point
+                for line in reversed(image_code_lines):
+                    lines.insert(inject_index, line)
                 
-            code = '\n'.join(lines)
-            logger.info("[LLM] ImageMobject successfully auto-injected with context-aware indentation")
+                code = '\n'.join(lines)
+                logger.info("[LLM] ImageMobject successfully auto-injected with context-aware indentation")
 
-    # Pre-render syntax validation
-    try:
-        compile(code, "<string>", "exec")
-        logger.info(f"[LLM] Generated {len(code)} characters of valid code")
-    except SyntaxError as e:
-        logger.warning(f"[LLM] Initial generation produced invalid syntax: {e}. Triggering early self-healing...")
-        error_context = {
-            'prompt': user_prompt,
-            'code': code,
-            'error': f"Syntax Error during pre-validation: {str(e)}",
-            'use_image': force_image
-        }
-        code = await generate_improved_code(error_context)
-        logger.info(f"[LLM] Healed code generated ({len(code)} chars)")
-
-    return code
+        # Pre-render syntax validation
+        try:
+            compile(code, "<string>", "exec")
+            logger.info(f"[LLM] Generated {len(code)} characters of valid code")
+        except SyntaxError as e:
+            logger.warning(f"[LLM] Initial generation produced invalid syntax: {e}. Triggering early self-healing...")
+            error_context = {
+                'prompt': user_prompt,
+                'code': code,
+                'error': f"Syntax Error during pre-validation: {str(e)}",
+                'use_image': force_image
+            }
+            code = await generate_improved_code(error_context)
+            logger.info(f"[LLM] Healed code generated ({len(code)} chars)")
+
+        return code
+
+    async def generate(storyboard: str, examples: list[dict]) -> str:
+        return await finish(await generate_raw(build_messages(storyboard, examples), get_llm(), on_partial))
+
+    async def speculate(storyboard: str, examples: list[dict]) -> str:
+        messages = build_messages(storyboard, examples)
+        temperatures = settings.speculative_temperatures or [0.6]
+
+        async def candidate(index: int) -> tuple[str, Exception | None]:
+            llm = get_chat_model(temperatures[index % len(temperatures)])
+            code = await finish(await generate_raw(messages, llm, on_partial if index == 0 else None))
+            try:
+                await vet(code)
+            except RuntimeError as e:
+                return code, e
+            return code, None
+
+        _speculative_stats["runs"] += 1
+        tasks = [asyncio.create_task(candidate(i)) for i in range(candidates)]
+        failed: list[tuple[str, Exception]] = []
+        last_error: Exception | None = None
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    code, error = await next_done
+                except Exception as e:
+                    last_error = e
+                    logger.warning(f"[LLM] Speculative candidate failed to generate: {e}")
+                    continue
+                if error is None:
+                    _speculative_stats["won"] += 1
+                    print("[LLM] Speculative candidate passed vetting; cancelling the rest")
+                    return code
+                failed.append((code, error))
+                print(f"[LLM] Speculative candidate failed vetting: {str(error)[:200]}")
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                    _speculative_stats["cancelled"] += 1
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        _speculative_stats["all_failed"] += 1
+        if failed:
+            raise CandidatesFailedError(*failed[0])
+        raise last_error
+
+    # Storyboard and retrieval are independent, so they run side by side;
+    # either one degrading to its fallback still lets generation go ahead
+    if candidates > 1 and vet is not None:
+        generate_stage = Stage("generate", speculate, deps=("storyboard", "examples"),
+                               timeout=settings.llm_timeout + settings.preflight_timeout)
+    else:
+        generate_stage = Stage("generate", generate, deps=("storyboard", "examples"), timeout=settings.llm_timeout)
+    results, timings = await run_stages([
+        Stage("storyboard", storyboard_stage, timeout=settings.planner_timeout, fallback=""),
+        Stage("examples", examples_stage, timeout=settings.rag_timeout, fallback=list),
+        generate_stage,
+    ])
+    print(f"[Pipeline] Stage timings: {format_timings(timings)}")
+    return results["generate"]
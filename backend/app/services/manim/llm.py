@@ -1,16 +1,9 @@
 """
 LLM initialization for Manim code generation.
 """
-from langchain_google_genai import ChatGoogleGenerativeAI
-from app.config import get_settings
-
-settings = get_settings()
+from app.services.client_registry import get_chat_model
 
 
 def get_llm():
-    """Get the configured LLM instance."""
-    return ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash",
-        google_api_key=settings.google_api_key,
-        temperature=0.6  # Balanced for creativity and reliability
-    )
+    """Get the shared LLM instance (one client per process, concurrency-bounded)."""
+    return get_chat_model(temperature=0.6)  # Balanced for creativity and reliability
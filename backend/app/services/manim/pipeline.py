@@ -0,0 +1,121 @@
+"""
+Dependency-aware stage runner for the generation pipeline.
+
+Each stage declares the stages it needs; everything whose dependencies are
+satisfied runs concurrently. A stage with a fallback degrades to that value on
+timeout or error instead of failing the whole pipeline, and every run records
+per-stage timings.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+_NO_FALLBACK = object()
+
+# Aggregate timings across runs for /system/stats
+_stats: dict[str, dict] = {}
+
+
+class Stage:
+    """A named async step. `fn` receives the results of its dependencies as keyword arguments."""
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[..., Awaitable[Any]],
+        deps: tuple[str, ...] = (),
+        timeout: float | None = None,
+        fallback: Any = _NO_FALLBACK,
+    ):
+        self.name = name
+        self.fn = fn
+        self.deps = deps
+        self.timeout = timeout
+        self.fallback = fallback
+
+
+def _record(name: str, status: str, elapsed_ms: float):
+    entry = _stats.setdefault(name, {"runs": 0, "total_ms": 0.0, "max_ms": 0.0, "fallbacks": 0})
+    entry["runs"] += 1
+    entry["total_ms"] += elapsed_ms
+    entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+    if status != "ok":
+        entry["fallbacks"] += 1
+
+
+async def run_stages(stages: list[Stage]) -> tuple[dict[str, Any], dict[str, dict]]:
+    """
+    Run `stages` respecting their dependencies.
+
+    Returns (results, timings) where timings maps stage name to
+    {"ms": elapsed, "status": "ok" | "timeout" | "error"}. A stage without a
+    fallback re-raises its error and cancels everything still running.
+    """
+    by_name = {s.name: s for s in stages}
+    for stage in stages:
+        missing = [d for d in stage.deps if d not in by_name]
+        if missing:
+            raise ValueError(f"Stage '{stage.name}' depends on unknown stages {missing}")
+
+    tasks: dict[str, asyncio.Task] = {}
+    timings: dict[str, dict] = {}
+
+    async def run(stage: Stage):
+        inputs = {}
+        for dep in stage.deps:
+            inputs[dep] = await tasks[dep]
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            return await asyncio.wait_for(stage.fn(**inputs), timeout=stage.timeout)
+        except asyncio.TimeoutError as e:
+            status = "timeout"
+            error = e
+        except Exception as e:
+            status = "error"
+            error = e
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            timings[stage.name] = {"ms": round(elapsed_ms, 1), "status": status}
+            _record(stage.name, status, elapsed_ms)
+
+        if stage.fallback is _NO_FALLBACK:
+            raise error
+        logger.warning(f"[Pipeline] Stage '{stage.name}' {status} ({error!r}), using fallback")
+        return stage.fallback() if callable(stage.fallback) else stage.fallback
+
+    # Tasks are created up front; each one waits on its dependencies itself
+    for stage in stages:
+        tasks[stage.name] = asyncio.create_task(run(stage), name=f"stage:{stage.name}")
+
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        raise
+
+    return {name: task.result() for name, task in tasks.items()}, timings
+
+
+def format_timings(timings: dict[str, dict]) -> str:
+    return ", ".join(
+        f"{name}={t['ms']:.0f}ms" + ("" if t["status"] == "ok" else f" ({t['status']})")
+        for name, t in timings.items()
+    )
+
+
+def get_stats() -> dict:
+    return {
+        name: {
+            "runs": e["runs"],
+            "avg_ms": round(e["total_ms"] / e["runs"], 1) if e["runs"] else 0.0,
+            "max_ms": round(e["max_ms"], 1),
+            "fallbacks": e["fallbacks"],
+        }
+        for name, e in _stats.items()
+    }
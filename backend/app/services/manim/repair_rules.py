@@ -0,0 +1,481 @@
+"""
+Deterministic repairs for common render failures.
+
+Most Manim crashes are mechanical: a keyword argument the class doesn't take,
+a method that doesn't exist, LaTeX that won't compile, an ImageMobject in a
+VGroup. classify_error() turns a traceback (or the static validator's report)
+into failures that carry the line of the generated script they point at, and
+repair_script() patches the syntax tree around that line with the rules
+registered for each kind of failure. Only failures no rule can fix go to the
+LLM, so the common repairs take milliseconds instead of a model call.
+"""
+import ast
+import logging
+import re
+from typing import Callable
+
+from app.services.manim.ast_sanitizer import EditableScript
+from app.services.manim.validator import THREE_D_CAMERA_METHODS
+
+logger = logging.getLogger(__name__)
+
+# Frames in the rendered script (scene.py, scene_<id>.py), from plain Python
+# tracebacks and from manim's rich ones (`│ /tmp/x/scene.py:12 in construct`)
+_FRAME_RES = [
+    re.compile(r'File "(?P<path>[^"]*)", line (?P<line>\d+)'),
+    re.compile(r'(?P<path>[^\s"│]+\.py):(?P<line>\d+) in '),
+]
+_SCRIPT_NAME_RE = re.compile(r"(?:^|[/\\])scene(?:_[0-9a-f]{8})?\.py$")
+# ...but not manim/scene/scene.py itself
+_LIBRARY_PATH_RE = re.compile(r"[/\\](?:manim|site-packages)[/\\]")
+_EXCEPTION_RE = re.compile(r"^\s*(?P<type>\w+(?:Error|Exception)): (?P<message>.+)$", re.MULTILINE)
+# How ScriptValidationError (and format_diagnostics) lists problems
+_DIAGNOSTIC_RE = re.compile(r"^Line (?P<line>\d+): \[(?P<rule>[\w-]+)\] (?P<message>.+)$", re.MULTILINE)
+
+# kind -> (exception types, message pattern); named groups become fields of the failure
+ERROR_PATTERNS = {
+    "unexpected-kwarg": (
+        {"TypeError"}, re.compile(r"(?P<owner>[\w.]+)\(\) got an unexpected keyword argument '(?P<name>\w+)'")
+    ),
+    "unknown-attribute": (
+        {"AttributeError"}, re.compile(r"'?(?P<owner>\w+)'? object has no attribute '(?P<name>\w+)'")
+    ),
+    "vgroup-non-vmobject": (
+        {"TypeError"}, re.compile(r"VMobject.*VGroup|VGroup.*VMobject")
+    ),
+    "latex": (
+        {"ValueError", "RuntimeError", "OSError", "FileNotFoundError"},
+        re.compile(r"latex error|latex compilation|No such file or directory: '(?:latex|dvisvgm)'", re.IGNORECASE)
+    ),
+    "undefined-name": (
+        {"NameError"}, re.compile(r"[Nn]ame '(?P<name>\w+)' is not defined")
+    ),
+}
+# Static validator rule -> failure kind
+DIAGNOSTIC_KINDS = {
+    "unknown-kwarg": "unexpected-kwarg",
+    "vgroup-image": "vgroup-non-vmobject",
+    "undefined-name": "undefined-name",
+    "camera-3d-in-2d": "camera-3d-in-2d",
+    "camera-frame": "camera-frame",
+    "camera-animate": "camera-animate",
+}
+
+# Methods that were renamed in manim CE, with compatible signatures
+ATTRIBUTE_RENAMES = {
+    "get_parametric_curve": "plot_parametric_curve",
+    "get_implicit_curve": "plot_implicit_curve",
+    "get_derivative_graph": "plot_derivative_graph",
+    "get_antiderivative_graph": "plot_antiderivative_graph",
+    "scale_in_place": "scale",
+    "rotate_in_place": "rotate",
+}
+# Old (manimlib) or misspelled names with a drop-in CE replacement
+NAME_FIXES = {
+    "TexMobject": "MathTex",
+    "TexText": "Tex",
+    "SurroundingRect": "SurroundingRectangle",
+    "BackgroundRect": "BackgroundRectangle",
+    "RoundedRect": "RoundedRectangle",
+    "CircleIndicate": "Circumscribe",
+    "Arrow3d": "Arrow3D",
+    "Dot3d": "Dot3D",
+    "pi": "PI",
+    "tau": "TAU",
+}
+# Bare math functions the script meant to take from numpy; the sanitizer adds the import
+NUMPY_FUNCTIONS = {
+    "sin", "cos", "tan", "arcsin", "arccos", "arctan", "arctan2",
+    "sqrt", "exp", "log", "floor", "ceil", "linspace", "arange",
+}
+STDLIB_MODULES = {"math", "random", "itertools", "functools"}
+CAMERA_TYPES = {"Camera", "MovingCamera"}
+
+TEX_CLASSES = {"MathTex", "Tex"}
+# MathTex keywords Text doesn't take
+TEX_ONLY_KWARGS = {
+    "tex_to_color_map", "substrings_to_isolate", "tex_template", "arg_separator",
+    "tex_environment", "organize_left_to_right",
+}
+# Axes helpers that turn plain string labels into MathTex
+AXIS_LABEL_METHODS = {"get_axis_labels", "get_x_axis_label", "get_y_axis_label", "get_graph_label"}
+LATEX_SYMBOLS = {
+    "alpha": "α", "beta": "β", "gamma": "γ", "delta": "δ", "Delta": "Δ", "epsilon": "ε",
+    "theta": "θ", "lambda": "λ", "mu": "μ", "pi": "π", "rho": "ρ", "sigma": "σ", "Sigma": "Σ",
+    "tau": "τ", "phi": "φ", "omega": "ω", "Omega": "Ω", "infty": "∞", "cdot": "·", "times": "×",
+    "div": "÷", "pm": "±", "leq": "≤", "le": "≤", "geq": "≥", "ge": "≥", "neq": "≠", "ne": "≠",
+    "approx": "≈", "to": "→", "rightarrow": "→", "leftarrow": "←", "Rightarrow": "⇒",
+    "int": "∫", "sum": "Σ", "partial": "∂", "nabla": "∇", "circ": "°", "degree": "°", "in": "∈",
+}
+_SUPERSCRIPTS = dict(zip("0123456789+-=()n", "⁰¹²³⁴⁵⁶⁷⁸⁹⁺⁻⁼⁽⁾ⁿ"))
+_SUBSCRIPTS = dict(zip("0123456789+-=()aeioxn", "₀₁₂₃₄₅₆₇₈₉₊₋₌₍₎ₐₑᵢₒₓₙ"))
+
+_rules: dict[str, list[tuple[str, Callable]]] = {}
+_hits: dict[str, int] = {}
+_kinds: dict[str, int] = {}
+_stats = {"errors": 0, "patched": 0, "no_rule": 0}
+
+
+def repair(name: str, *kinds: str):
+    """Register `fn(failure, script)` for the given failure kinds; tried in registration order."""
+    def register(fn):
+        for kind in kinds:
+            _rules.setdefault(kind, []).append((name, fn))
+        _hits.setdefault(name, 0)
+        return fn
+    return register
+
+
+# -----------------------
+# Classification
+# -----------------------
+def failing_line(text: str) -> int | None:
+    """Line of the generated script in the innermost traceback frame that points into it."""
+    frames = [
+        (m.start(), int(m["line"])) for regex in _FRAME_RES for m in regex.finditer(text)
+        if _SCRIPT_NAME_RE.search(m["path"]) and not _LIBRARY_PATH_RE.search(m["path"])
+    ]
+    return max(frames)[1] if frames else None
+
+
+def _fields(kind: str | None, message: str) -> dict:
+    if kind not in ERROR_PATTERNS:
+        return {}
+    match = ERROR_PATTERNS[kind][1].search(message)
+    return {k: v for k, v in match.groupdict().items() if v} if match else {}
+
+
+def classify_error(error: BaseException | str) -> list[dict]:
+    """
+    The failures a render error describes, as [{kind, line, ...}]. `kind` is
+    None when nothing recognizes the error; `line` is None when the traceback
+    doesn't point into the script.
+    """
+    text = str(error)
+    diagnostics = list(_DIAGNOSTIC_RE.finditer(text))
+    if diagnostics:
+        failures = []
+        for m in diagnostics:
+            kind = DIAGNOSTIC_KINDS.get(m["rule"])
+            failures.append({"kind": kind, "line": int(m["line"]), **_fields(kind, m["message"])})
+        return failures
+
+    line = failing_line(text)
+    exceptions = list(_EXCEPTION_RE.finditer(text))
+    if not exceptions:
+        return [{"kind": None, "line": line}]
+    # The exception that ended the run is the last one printed
+    exc_type, message = exceptions[-1]["type"], exceptions[-1]["message"]
+    for kind, (types, pattern) in ERROR_PATTERNS.items():
+        if exc_type in types and pattern.search(message):
+            return [{"kind": kind, "line": line, "error": exc_type, **_fields(kind, message)}]
+    return [{"kind": None, "line": line, "error": exc_type}]
+
+
+# -----------------------
+# Helpers
+# -----------------------
+def _dotted(node: ast.AST) -> str | None:
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        base = _dotted(node.value)
+        return f"{base}.{node.attr}" if base else None
+    return None
+
+
+def _call_name(call: ast.Call) -> str | None:
+    func = call.func
+    if isinstance(func, ast.Name):
+        return func.id
+    return func.attr if isinstance(func, ast.Attribute) else None
+
+
+def _spanning(script: EditableScript, line: int | None, node_type: type) -> list:
+    """Nodes of `node_type` that cover `line`, innermost first."""
+    if line is None:
+        return []
+    nodes = [n for n in ast.walk(script.tree)
+             if isinstance(n, node_type) and n.lineno <= line <= n.end_lineno]
+    return sorted(nodes, key=lambda n: (n.end_lineno - n.lineno, n.end_col_offset - n.col_offset))
+
+
+def _calls(script: EditableScript) -> list[ast.Call]:
+    return [n for n in ast.walk(script.tree) if isinstance(n, ast.Call)]
+
+
+def _scene_class(script: EditableScript, line: int | None) -> ast.ClassDef | None:
+    classes = [n for n in script.tree.body if isinstance(n, ast.ClassDef)]
+    for cls in classes:
+        if line is not None and cls.lineno <= line <= cls.end_lineno:
+            return cls
+    return next((c for c in classes if c.name == "GeneratedScene"), None)
+
+
+def _scene_base(cls: ast.ClassDef, *names: str) -> ast.Name | None:
+    return next((b for b in cls.bases if isinstance(b, ast.Name) and b.id in names), None)
+
+
+def _uses_camera_frame(cls: ast.ClassDef) -> bool:
+    return any(isinstance(n, ast.Attribute) and _dotted(n) == "self.camera.frame" for n in ast.walk(cls))
+
+
+def _latex_to_text(tex: str) -> str:
+    """Rough plain-text rendering of a LaTeX snippet, for Text()."""
+    text = tex
+    for _ in range(3):  # unwraps a few levels of nesting
+        text = re.sub(r"\\(?:text\w*|math\w+|operatorname)\{([^{}]*)\}", r"\1", text)
+        text = re.sub(r"\\[dt]?frac\{([^{}]*)\}\{([^{}]*)\}", r"(\1)/(\2)", text)
+        text = re.sub(r"\\sqrt\{([^{}]*)\}", r"√(\1)", text)
+
+    def script_chars(table: dict, marker: str):
+        def convert(m: re.Match) -> str:
+            body = m.group(1) or m.group(2)
+            return "".join(table[c] for c in body) if all(c in table for c in body) else f"{marker}{body}"
+        return convert
+
+    text = re.sub(r"\^(?:\{([^{}]*)\}|(\w))", script_chars(_SUPERSCRIPTS, "^"), text)
+    text = re.sub(r"_(?:\{([^{}]*)\}|(\w))", script_chars(_SUBSCRIPTS, "_"), text)
+    text = re.sub(r"\\\\", "\n", text)
+    text = re.sub(r"\\[,;:! ]", " ", text)
+    text = re.sub(r"\\(?:left|right)\b", "", text)
+    text = re.sub(r"\\([A-Za-z]+)", lambda m: LATEX_SYMBOLS.get(m.group(1), m.group(1)), text)
+    text = re.sub(r"[{}$&]", "", text)
+    return re.sub(r"[ \t]+", " ", text).strip() or tex
+
+
+def _string_args(call: ast.Call) -> list[str] | None:
+    if not call.args or not all(isinstance(a, ast.Constant) and isinstance(a.value, str) for a in call.args):
+        return None
+    return [a.value for a in call.args]
+
+
+def _tex_to_text(calls: list[ast.Call], script: EditableScript) -> bool:
+    changed = False
+    converted: list[ast.Call] = []
+    for call in calls:
+        if any(c.lineno <= call.lineno and call.end_lineno <= c.end_lineno and c is not call for c in converted):
+            continue
+        name = _call_name(call)
+        if isinstance(call.func, ast.Name) and name in TEX_CLASSES:
+            parts = _string_args(call)
+            if parts is None:
+                continue
+            kwargs = [script.text(kw) for kw in call.keywords if kw.arg not in TEX_ONLY_KWARGS]
+            script.replace_node(call, f"Text({', '.join([repr(_latex_to_text(''.join(parts)))] + kwargs)})")
+            converted.append(call)
+            changed = True
+        elif isinstance(call.func, ast.Attribute) and name in AXIS_LABEL_METHODS:
+            for arg in call.args + [kw.value for kw in call.keywords]:
+                if isinstance(arg, ast.Constant) and isinstance(arg.value, str):
+                    script.replace_node(arg, f"Text({_latex_to_text(arg.value)!r})")
+                    changed = True
+        elif isinstance(call.func, ast.Attribute) and name == "add_coordinates":
+            # Axis numbers are MathTex too
+            script.drop_call(call, call.func.value)
+            converted.append(call)
+            changed = True
+        else:
+            for kw in call.keywords:
+                if kw.arg == "include_numbers" and isinstance(kw.value, ast.Constant) and kw.value.value is True:
+                    script.replace_node(kw.value, "False")
+                    changed = True
+                elif isinstance(kw.value, ast.Dict):
+                    for key, value in zip(kw.value.keys, kw.value.values):
+                        if isinstance(key, ast.Constant) and key.value == "include_numbers" \
+                                and isinstance(value, ast.Constant) and value.value is True:
+                            script.replace_node(value, "False")
+                            changed = True
+    return changed
+
+
+# -----------------------
+# Rules
+# -----------------------
+@repair("drop-kwarg", "unexpected-kwarg")
+def _drop_kwarg(failure: dict, script: EditableScript):
+    name = failure.get("name")
+    calls = [c for c in _spanning(script, failure["line"], ast.Call) if any(kw.arg == name for kw in c.keywords)]
+    if calls:
+        calls = calls[:1]
+    else:
+        # No frame in the script; drop it wherever the class named in the message gets it
+        owner = failure.get("owner", "").split(".")[0]
+        calls = [c for c in _calls(script) if _call_name(c) == owner and any(kw.arg == name for kw in c.keywords)]
+    for call in calls:
+        script.drop_args(call, [kw for kw in call.keywords if kw.arg == name])
+
+
+@repair("three-d-scene", "camera-3d-in-2d", "unknown-attribute")
+def _three_d_scene(failure: dict, script: EditableScript):
+    # move_camera() and friends only exist on ThreeDScene
+    if failure["kind"] == "unknown-attribute" and failure.get("name") not in THREE_D_CAMERA_METHODS:
+        return
+    cls = _scene_class(script, failure["line"])
+    base = _scene_base(cls, "Scene") if cls is not None else None
+    if base is not None and not _uses_camera_frame(cls):
+        script.replace_node(base, "ThreeDScene")
+
+
+@repair("moving-camera-scene", "camera-frame", "camera-animate", "unknown-attribute")
+def _moving_camera_scene(failure: dict, script: EditableScript):
+    # self.camera.frame only exists on MovingCameraScene; the camera can't be animated, its frame can
+    if failure["kind"] == "unknown-attribute" and not (
+            failure.get("owner") in CAMERA_TYPES and failure.get("name") in ("frame", "animate")):
+        return
+    cls = _scene_class(script, failure["line"])
+    if cls is None:
+        return
+    base = _scene_base(cls, "Scene")
+    if base is None and _scene_base(cls, "MovingCameraScene") is None:
+        return
+    if base is not None:
+        script.replace_node(base, "MovingCameraScene")
+    if failure["kind"] == "camera-animate" or failure.get("name") == "animate":
+        for node in ast.walk(cls):
+            if isinstance(node, ast.Attribute) and node.attr == "animate" and _dotted(node.value) == "self.camera":
+                script.replace_node(node, "self.camera.frame.animate")
+
+
+@repair("rename-attribute", "unknown-attribute")
+def _rename_attribute(failure: dict, script: EditableScript):
+    new = ATTRIBUTE_RENAMES.get(failure.get("name"))
+    if new is None:
+        return
+    for node in ast.walk(script.tree):
+        if isinstance(node, ast.Attribute) and node.attr == failure["name"]:
+            script.rename_attr(node, new)
+
+
+@repair("drop-call", "unknown-attribute", "camera-animate")
+def _drop_call(failure: dict, script: EditableScript):
+    # The method doesn't exist: losing one effect beats losing the render
+    spanning = _spanning(script, failure["line"], ast.Call)
+    if failure["kind"] == "camera-animate":
+        calls = [c for c in spanning if "self.camera.animate" in (_dotted(c.func) or "")]
+    else:
+        calls = [c for c in spanning if isinstance(c.func, ast.Attribute) and c.func.attr == failure.get("name")]
+    if not calls:
+        return
+    call = calls[0]
+    for play in spanning:
+        if _dotted(play.func) != "self.play":
+            continue
+        arg = next((a for a in play.args if any(n is call for n in ast.walk(a))), None)
+        if arg is None:
+            continue
+        if len(play.args) > 1:
+            script.drop_args(play, [arg])
+        elif id(play) in script.call_stmts:
+            script.remove_stmt(script.call_stmts[id(play)])
+        return
+    if isinstance(call.func, ast.Attribute):
+        script.drop_call(call, call.func.value)
+
+
+@repair("latex-to-text", "latex")
+def _latex(failure: dict, script: EditableScript):
+    # Plain Text for what the failing line sets in LaTeX; the whole script if the line is unknown
+    if not _tex_to_text(_spanning(script, failure["line"], ast.Call), script):
+        _tex_to_text(_calls(script), script)
+
+
+@repair("vgroup-to-group", "vgroup-non-vmobject")
+def _vgroup_to_group(failure: dict, script: EditableScript):
+    spanning = _spanning(script, failure["line"], ast.Call)
+    groups = [c for c in spanning if isinstance(c.func, ast.Name) and c.func.id == "VGroup"]
+    if not groups:
+        # `group.add(image)`: make the group it was built as a plain Group
+        receivers = {
+            c.func.value.id for c in spanning
+            if isinstance(c.func, ast.Attribute) and c.func.attr in ("add", "add_to_back")
+            and isinstance(c.func.value, ast.Name)
+        }
+        receivers |= {
+            n.target.id for n in _spanning(script, failure["line"], ast.AugAssign) if isinstance(n.target, ast.Name)
+        }
+        groups = [
+            n.value for n in ast.walk(script.tree)
+            if isinstance(n, ast.Assign) and isinstance(n.value, ast.Call) and isinstance(n.value.func, ast.Name)
+            and n.value.func.id == "VGroup" and any(isinstance(t, ast.Name) and t.id in receivers for t in n.targets)
+        ]
+    for call in groups:
+        script.replace_node(call.func, "Group")
+
+
+@repair("rename-name", "undefined-name")
+def _rename_name(failure: dict, script: EditableScript):
+    name = failure.get("name")
+    new = NAME_FIXES.get(name) or (f"np.{name}" if name in NUMPY_FUNCTIONS else None)
+    if new is None or name in script.bound:
+        return
+    for node in ast.walk(script.tree):
+        if isinstance(node, ast.Name) and node.id == name and isinstance(node.ctx, ast.Load):
+            script.replace_node(node, new)
+
+
+@repair("add-import", "undefined-name")
+def _add_import(failure: dict, script: EditableScript):
+    name = failure.get("name")
+    if name not in STDLIB_MODULES or name in script.bound:
+        return
+    anchor = script.manim_import or (script.future_imports[-1] if script.future_imports else None)
+    at = script.line_start(anchor.end_lineno + 1) if anchor is not None else 0
+    prefix = "\n" if at == len(script.data) and at and not script.data.endswith(b"\n") else ""
+    script.replace(at, at, f"{prefix}import {name}\n")
+
+
+# -----------------------
+# Entry point
+# -----------------------
+def repair_script(script: str, error: BaseException | str) -> tuple[str, list[str]] | None:
+    """
+    Patch `script` for the failures in `error` without the LLM. Returns the
+    patched script and the rules that changed it, or None unless a rule
+    handled every failure.
+    """
+    _stats["errors"] += 1
+    failures = classify_error(error)
+    for failure in failures:
+        kind = failure["kind"] or "unclassified"
+        _kinds[kind] = _kinds.get(kind, 0) + 1
+    try:
+        tree = ast.parse(script)
+    except SyntaxError:
+        tree = None
+    if tree is None or any(f["kind"] not in _rules for f in failures):
+        _stats["no_rule"] += 1
+        return None
+
+    edits = EditableScript(script, tree)
+    for i, failure in enumerate(failures):
+        for name, fn in _rules[failure["kind"]]:
+            before = len(edits.edits) + len(edits.removals)
+            edits.site(name, i)
+            fn(failure, edits)
+            if len(edits.edits) + len(edits.removals) > before:
+                break
+        else:
+            _stats["no_rule"] += 1
+            return None
+
+    patched = edits.apply()
+    try:
+        ast.parse(patched)
+    except SyntaxError as e:
+        logger.warning(f"[Repair] Rule patch produced invalid code, leaving it to the LLM: {e}")
+        _stats["no_rule"] += 1
+        return None
+    if patched == script:
+        _stats["no_rule"] += 1
+        return None
+
+    rules = list(dict.fromkeys(edits.applied))
+    for name in rules:
+        _hits[name] += 1
+    _stats["patched"] += 1
+    return patched, rules
+
+
+def get_stats() -> dict:
+    return {**_stats, "kinds": dict(_kinds), "rule_hits": {k: v for k, v in _hits.items() if v}}
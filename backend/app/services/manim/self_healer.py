@@ -5,15 +5,10 @@ Attempts to fix broken Manim code based on error messages.
 import logging
 from langchain_core.messages import SystemMessage, HumanMessage
 
+from app.prompts.repair_prompt import REPAIR_SYSTEM_PROMPT
 from app.services.manim.llm import get_llm
 from app.services.manim.extractor import extract_code, strip_markdown_fences
-from app.services.manim.sanitizers import (
-    normalize_indentation,
-    sanitize_updaters,
-    sanitize_3d_camera,
-)
-from app.services.video_renderer import sanitize_manim_script
-from app.services.vector_store import get_relevant_examples, format_examples_for_context
+from app.services.vector_store import get_relevant_examples_batch, merge_examples, format_examples_for_context
 
 logger = logging.getLogger(__name__)
 
@@ -21,55 +16,74 @@ logger = logging.getLogger(__name__)
 async def generate_improved_code(error_context: dict) -> str:
     """
     Generate improved Manim code based on error feedback.
-    This is the self-healing mechanism that runs when initial generation fails.
+    This is the self-healing mechanism for failures repair_rules has no rule for.
+
+    `error_context` may carry the failing `line` of the code and a `history`
+    of earlier failed repairs ({"attempt", "error"}) so the model doesn't
+    repeat a fix that already failed. The result is not sanitized; callers
+    run sanitize_script on it.
     """
     prompt = error_context.get('prompt', '')
     previous_code = error_context.get('code', '')
     error_message = error_context.get('error', '')
     use_image = error_context.get('use_image', False)
+    history = error_context.get('history') or []
     
     logger.info(f"[LLM] Generating improved code (use_image={use_image})...")
     print(f"[LLM] Attempting self-healing for: {error_message[:100]}...")
     
-    examples = await get_relevant_examples(prompt, top_k=5)
+    # Look up examples for both the request and the failure in one round trip
+    batches = await get_relevant_examples_batch([prompt, error_message[-500:]], top_k=5)
+    examples = merge_examples(batches, top_k=5)
     context = format_examples_for_context(examples)
     
+    location_section = ""
+    failing_line = error_context.get('line')
+    code_lines = previous_code.splitlines()
+    if failing_line and 0 < failing_line <= len(code_lines):
+        location_section = f"""
+
+The traceback points at line {failing_line}:
+{code_lines[failing_line - 1].strip()}"""
+
+    history_section = ""
+    if history:
+        earlier = "\n".join(f"- Attempt {h['attempt']}: {h['error'][-300:]}" for h in history)
+        history_section = f"""
+
+Earlier repair attempts already failed; do not repeat those fixes:
+{earlier}"""
+
     image_instruction = ""
     if use_image:
-        image_instruction = "\n7. CRITICAL: You MUST include at least one `ImageMobject` using the `{{IMAGE:vivid description}}` syntax."
+        image_instruction = "\n- You MUST keep at least one `ImageMobject` using the `{{IMAGE:vivid description}}` syntax."
 
-    system_template = f"""You are a Manim debugging expert. Fix the broken code.
-    
-Original request: {prompt}
+    system_prompt = f"""{REPAIR_SYSTEM_PROMPT}
+====================================================
+PROJECT CONSTRAINTS
+====================================================
 
-Previous code that failed:
+- Import from manim
+- The scene class is named GeneratedScene and inherits from Scene, MovingCameraScene or ThreeDScene
+- ThreeDScene: use move_camera(), NOT self.camera.frame or self.camera.animate
+- NEVER use f-strings in MathTex or Tex{image_instruction}
+"""
+
+    user_msg = f"""Original request: {prompt}
+
+Broken code:
 ```python
 {previous_code}
 ```
 
-Error encountered:
-{error_message}
-
-Rules:
-1. Import from manim
-2. Class name: GeneratedScene
-3. Inherit from Scene or ThreeDScene
-4. ThreeDScene: use move_camera(), NOT self.camera.frame or self.camera.animate
-5. Fix the specific error mentioned
-6. Return ONLY code, no explanations or comments{image_instruction}
-7. DO NOT include any comments inside the Python code (# comments).
-9. **NO F-STRINGS IN LATEX**: NEVER use f-strings for MathTex or Tex.
-10. Formatting and syntax must be perfect.
+Error:
+{error_message}{location_section}{history_section}
 
 Relevant examples:
-{context}
-
-Generate corrected code:"""
-    
-    user_msg = "Generate fixed Manim code addressing the error."
+{context}"""
     
     messages = [
-        SystemMessage(content=system_template),
+        SystemMessage(content=system_prompt),
         HumanMessage(content=user_msg)
     ]
     
@@ -78,10 +92,6 @@ Generate corrected code:"""
     
     code = extract_code(result.content)
     code = strip_markdown_fences(code)
-    code = sanitize_manim_script(code)
-    code = normalize_indentation(code)
-    code = sanitize_updaters(code)
-    code = sanitize_3d_camera(code)
     
     # IMAGE VALIDATION & AUTO-INJECTION (same as main generator)
     if use_image and 'ImageMobject' not in code:
@@ -0,0 +1,249 @@
+"""
+Static validation of generated scripts against the manim API.
+
+Catches, without rendering, the failures that otherwise only show up after
+Manim has started a render:
+- names that are never defined or imported
+- keyword arguments the target class or function doesn't accept
+- ImageMobjects placed in a VGroup (they are not VMobjects)
+- 3D camera calls in non-3D scenes and `self.camera.frame` outside MovingCameraScene
+
+Checks are flow-insensitive and only flag what is certain to fail, so a clean
+result doesn't guarantee the render will succeed.
+"""
+import ast
+import builtins
+
+from app.services.manim.api_surface import get_surface
+
+THREE_D_CAMERA_METHODS = {
+    "move_camera", "set_camera_orientation",
+    "begin_ambient_camera_rotation", "stop_ambient_camera_rotation",
+    "begin_3dillusion_camera_rotation", "stop_3dillusion_camera_rotation",
+    "add_fixed_in_frame_mobjects", "add_fixed_orientation_mobjects",
+}
+
+_BUILTINS = set(dir(builtins)) | {"__name__", "__file__"}
+
+
+class ScriptValidationError(RuntimeError):
+    """Raised instead of rendering when static validation finds certain failures."""
+
+    def __init__(self, diagnostics: list[dict]):
+        self.diagnostics = diagnostics
+        super().__init__(f"Static validation failed:\n{format_diagnostics(diagnostics)}")
+
+
+def _diag(rule: str, node: ast.AST | None, message: str, severity: str = "error") -> dict:
+    return {
+        "rule": rule,
+        "severity": severity,
+        "line": getattr(node, "lineno", None),
+        "col": getattr(node, "col_offset", None),
+        "message": message,
+    }
+
+
+def _bound_names(tree: ast.AST) -> tuple[set[str], list[str]]:
+    """Every name the script binds anywhere, plus the modules it star-imports."""
+    bound, star_imports = set(), []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            bound.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            bound.add(node.name)
+        elif isinstance(node, ast.arguments):
+            for arg in node.posonlyargs + node.args + node.kwonlyargs:
+                bound.add(arg.arg)
+            for arg in (node.vararg, node.kwarg):
+                if arg:
+                    bound.add(arg.arg)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                if alias.name == "*":
+                    star_imports.append(node.module or "")
+                else:
+                    bound.add(alias.asname or alias.name.split(".")[0])
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            bound.update(node.names)
+        elif isinstance(node, (ast.MatchAs, ast.MatchStar)) and node.name:
+            bound.add(node.name)
+    return bound, star_imports
+
+
+def _root_call_name(node: ast.AST) -> str | None:
+    """For `Cls(...)` or `Cls(...).scale(2).shift(UP)`, return 'Cls'."""
+    while isinstance(node, ast.Call):
+        func = node.func
+        if isinstance(func, ast.Name):
+            return func.id
+        if isinstance(func, ast.Attribute):
+            node = func.value
+        else:
+            return None
+    return None
+
+
+def _is_self_attr(node: ast.AST, *attrs: str) -> bool:
+    """True for `self.<attrs[0]>.<attrs[1]>...`."""
+    for attr in reversed(attrs):
+        if not (isinstance(node, ast.Attribute) and node.attr == attr):
+            return False
+        node = node.value
+    return isinstance(node, ast.Name) and node.id == "self"
+
+
+class _Checker:
+    def __init__(self, tree: ast.Module, surface: dict):
+        self.tree = tree
+        self.surface = surface
+        self.classes = surface["classes"]
+        self.functions = surface["functions"]
+        self.diagnostics: list[dict] = []
+        self.bound, star_imports = _bound_names(tree)
+        self.manim_star = "manim" in star_imports
+        self.manim_imports = {
+            alias.asname or alias.name
+            for node in ast.walk(tree) if isinstance(node, ast.ImportFrom) and node.module == "manim"
+            for alias in node.names if alias.name != "*"
+        }
+        # Can't know what other star imports provide
+        self.names_known = all(m == "manim" for m in star_imports)
+
+    def _from_manim(self, name: str) -> bool:
+        """True if `name` refers to manim's object rather than something the script defines."""
+        return name in self.manim_imports or (self.manim_star and name not in self.bound)
+
+    def _api_class(self, name: str) -> dict | None:
+        return self.classes.get(name) if self._from_manim(name) else None
+
+    def check_undefined(self):
+        if not self.names_known:
+            return
+        available = self.bound | _BUILTINS
+        if self.manim_star:
+            available |= set(self.surface["names"])
+        reported = set()
+        for node in ast.walk(self.tree):
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) \
+                    and node.id not in available and node.id not in reported:
+                reported.add(node.id)
+                self.diagnostics.append(_diag("undefined-name", node, f"Name '{node.id}' is not defined"))
+
+    def check_kwargs(self):
+        for node in ast.walk(self.tree):
+            if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Name)):
+                continue
+            name = node.func.id
+            info = self._api_class(name)
+            if info is None and self._from_manim(name):
+                info = self.functions.get(name)
+            if info is None or info["open"]:
+                continue
+            for kw in node.keywords:
+                if kw.arg is not None and kw.arg not in info["kwargs"]:
+                    self.diagnostics.append(_diag(
+                        "unknown-kwarg", kw,
+                        f"{name}() got an unexpected keyword argument '{kw.arg}'"
+                    ))
+
+    def check_vgroup_images(self):
+        image_vars, vgroup_vars = set(), set()
+        for node in ast.walk(self.tree):
+            if isinstance(node, ast.Assign):
+                root = _root_call_name(node.value)
+                info = self._api_class(root) if root else None
+                for target in node.targets:
+                    if isinstance(target, ast.Name) and info:
+                        if info["image"]:
+                            image_vars.add(target.id)
+                        elif info["vmobject"] and root in ("VGroup", "VDict"):
+                            vgroup_vars.add(target.id)
+
+        def is_image(arg: ast.AST) -> bool:
+            if isinstance(arg, ast.Starred):
+                arg = arg.value
+            if isinstance(arg, ast.Name):
+                return arg.id in image_vars
+            root = _root_call_name(arg)
+            info = self._api_class(root) if root else None
+            return bool(info and info["image"])
+
+        for node in ast.walk(self.tree):
+            if not isinstance(node, ast.Call):
+                continue
+            func = node.func
+            in_vgroup = isinstance(func, ast.Name) and func.id == "VGroup"
+            added_to_vgroup = (
+                isinstance(func, ast.Attribute) and func.attr == "add"
+                and isinstance(func.value, ast.Name) and func.value.id in vgroup_vars
+            )
+            if (in_vgroup or added_to_vgroup) and any(is_image(a) for a in node.args):
+                self.diagnostics.append(_diag(
+                    "vgroup-image", node,
+                    "ImageMobject can't be added to a VGroup (it is not a VMobject); use Group instead"
+                ))
+
+    def _scene_flags(self, cls: ast.ClassDef, seen: set[str] | None = None) -> dict | None:
+        seen = seen or set()
+        local = {n.name: n for n in self.tree.body if isinstance(n, ast.ClassDef)}
+        for base in cls.bases:
+            if not isinstance(base, ast.Name):
+                continue
+            if base.id in local and base.id not in seen:
+                seen.add(base.id)
+                flags = self._scene_flags(local[base.id], seen)
+                if flags:
+                    return flags
+            info = self._api_class(base.id)
+            if info and info["scene"]:
+                return info
+        return None
+
+    def check_camera(self):
+        for cls in (n for n in self.tree.body if isinstance(n, ast.ClassDef)):
+            flags = self._scene_flags(cls)
+            if flags is None:
+                continue
+            for node in ast.walk(cls):
+                if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) \
+                        and node.func.attr in THREE_D_CAMERA_METHODS \
+                        and _is_self_attr(node.func, node.func.attr) and not flags["three_d_scene"]:
+                    self.diagnostics.append(_diag(
+                        "camera-3d-in-2d", node,
+                        f"self.{node.func.attr}() only exists on ThreeDScene, but {cls.name} is not a ThreeDScene"
+                    ))
+                elif isinstance(node, ast.Attribute) and _is_self_attr(node, "camera", "frame") \
+                        and not flags["moving_camera_scene"]:
+                    hint = "use self.move_camera()" if flags["three_d_scene"] else "inherit from MovingCameraScene"
+                    self.diagnostics.append(_diag(
+                        "camera-frame", node, f"self.camera.frame is only available in MovingCameraScene; {hint}"
+                    ))
+                elif isinstance(node, ast.Attribute) and _is_self_attr(node, "camera", "animate"):
+                    self.diagnostics.append(_diag(
+                        "camera-animate", node, "self.camera is not a Mobject and has no .animate"
+                    ))
+
+
+def validate_script(script: str) -> list[dict]:
+    """Return structured diagnostics ({rule, severity, line, col, message}) for `script`."""
+    try:
+        tree = ast.parse(script)
+    except SyntaxError as e:
+        return [{"rule": "syntax", "severity": "error", "line": e.lineno, "col": e.offset, "message": str(e)}]
+    surface = get_surface()
+    if surface is None:
+        return []
+    checker = _Checker(tree, surface)
+    checker.check_undefined()
+    checker.check_kwargs()
+    checker.check_vgroup_images()
+    checker.check_camera()
+    return sorted(checker.diagnostics, key=lambda d: (d["line"] or 0, d["col"] or 0))
+
+
+def format_diagnostics(diagnostics: list[dict]) -> str:
+    """Readable summary used as error context for the self-healer."""
+    return "\n".join(f"Line {d['line']}: [{d['rule']}] {d['message']}" for d in diagnostics)
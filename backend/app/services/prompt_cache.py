@@ -0,0 +1,201 @@
+"""
+Prompt-level cache that short-circuits the whole generate + render pipeline.
+
+Completed tasks are remembered under their normalized prompt (plus quality
+and duration). A new request first tries an exact hash match, then an
+embedding similarity match above `settings.prompt_cache_similarity` using the
+same embedding model as the RAG layer. Entries expire after their TTL.
+
+The `tasks` table is the shared store: `remember()` returns the columns the
+completed row should carry (normalized prompt, duration, embedding), and
+every process pulls newly completed rows into its in-memory entries at most
+every `settings.prompt_cache_sync_interval` seconds. Lookups therefore match
+tasks finished by other processes (e.g. queue workers) and survive restarts.
+"""
+import asyncio
+import hashlib
+import logging
+import re
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from app.config import get_settings
+from app.services import embedding_cache
+from app.services.database_service import get_async_supabase
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+_entries: dict[str, dict] = {}
+_dead_videos: set[str] = set()
+_synced_until: str | None = None  # updated_at of the newest completed row pulled in
+_last_sync = 0.0
+_sync_lock = asyncio.Lock()
+_stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "skipped": 0, "stores": 0, "synced": 0, "sync_errors": 0}
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    text = re.sub(r"\s+", " ", (prompt or "").lower()).strip()
+    return text.rstrip(".!?;, ")
+
+
+def _key(norm_prompt: str, quality: str, duration: int) -> str:
+    return hashlib.sha256(f"{norm_prompt}\0{quality}\0{duration}".encode("utf-8")).hexdigest()
+
+
+def _embed_sync(norm_prompt: str) -> np.ndarray:
+    vector = np.asarray(embedding_cache.embed_one(norm_prompt), dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+async def _embed(norm_prompt: str) -> np.ndarray:
+    return await asyncio.to_thread(_embed_sync, norm_prompt)
+
+
+def _purge_expired():
+    now = time.time()
+    for key in [k for k, e in _entries.items() if e["expires_at"] <= now]:
+        del _entries[key]
+
+
+def _store(norm: str, quality: str, duration: int, script: str, video_url: str,
+           embedding: np.ndarray | None, expires_at: float):
+    if video_url in _dead_videos or expires_at <= time.time():
+        return
+    _purge_expired()
+    key = _key(norm, quality, duration)
+    if key not in _entries and len(_entries) >= settings.prompt_cache_max_entries:
+        oldest = min(_entries, key=lambda k: _entries[k]["expires_at"])
+        del _entries[oldest]
+
+    entry = {
+        "prompt": norm,
+        "quality": quality,
+        "duration": duration,
+        "script": script,
+        "video_url": video_url,
+        "expires_at": expires_at,
+    }
+    if embedding is not None:
+        entry["embedding"] = embedding
+    _entries[key] = entry
+
+
+def _row_expiry(updated_at: str) -> float:
+    stamp = datetime.fromisoformat(updated_at)
+    if stamp.tzinfo is None:
+        stamp = stamp.replace(tzinfo=timezone.utc)
+    return stamp.timestamp() + settings.prompt_cache_ttl
+
+
+async def _sync():
+    """Pull tasks completed since the last sync (by any process) into the in-memory entries."""
+    global _synced_until, _last_sync
+    if time.monotonic() - _last_sync < settings.prompt_cache_sync_interval:
+        return
+    async with _sync_lock:
+        if time.monotonic() - _last_sync < settings.prompt_cache_sync_interval:
+            return
+        _last_sync = time.monotonic()
+        since = _synced_until or (datetime.utcnow() - timedelta(seconds=settings.prompt_cache_ttl)).isoformat()
+        try:
+            result = await get_async_supabase().table("tasks") \
+                .select("prompt_norm, quality, duration, generated_script, video_url, prompt_embedding, updated_at") \
+                .eq("status", "completed").not_.is_("prompt_norm", "null").not_.is_("video_url", "null") \
+                .gt("updated_at", since).order("updated_at").limit(settings.prompt_cache_max_entries).execute()
+        except Exception as e:
+            _stats["sync_errors"] += 1
+            logger.warning(f"[PromptCache] Could not sync completed tasks: {e}")
+            return
+        for row in result.data or []:
+            embedding = row.get("prompt_embedding")
+            _store(
+                row["prompt_norm"], row["quality"], row["duration"], row.get("generated_script") or "",
+                row["video_url"], np.asarray(embedding, dtype=np.float32) if embedding else None,
+                _row_expiry(row["updated_at"]),
+            )
+            _synced_until = row["updated_at"]
+        _stats["synced"] += len(result.data or [])
+
+
+async def lookup(prompt: str, quality: str, duration: int, use_image: bool = False) -> dict | None:
+    """Return {'script', 'video_url', 'match', 'similarity'} for a cached result, or None."""
+    if not settings.prompt_cache_enabled:
+        return None
+    if use_image:
+        # Image prompts get freshly generated artwork every time
+        _stats["skipped"] += 1
+        return None
+
+    await _sync()
+    _purge_expired()
+    norm = normalize_prompt(prompt)
+    entry = _entries.get(_key(norm, quality, duration))
+    if entry:
+        _stats["exact_hits"] += 1
+        return {"script": entry["script"], "video_url": entry["video_url"], "match": "exact", "similarity": 1.0}
+
+    candidates = [
+        e for e in _entries.values()
+        if e["quality"] == quality and e["duration"] == duration and "embedding" in e
+    ]
+    if candidates:
+        try:
+            query = await _embed(norm)
+            matrix = np.stack([e["embedding"] for e in candidates])
+            scores = matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] >= settings.prompt_cache_similarity:
+                _stats["semantic_hits"] += 1
+                hit = candidates[best]
+                logger.info(f"[PromptCache] Semantic hit ({scores[best]:.3f}): '{norm[:50]}' ~ '{hit['prompt'][:50]}'")
+                return {"script": hit["script"], "video_url": hit["video_url"], "match": "semantic", "similarity": float(scores[best])}
+        except Exception as e:
+            logger.warning(f"[PromptCache] Semantic lookup failed: {e}")
+
+    _stats["misses"] += 1
+    return None
+
+
+async def remember(prompt: str, quality: str, duration: int, script: str, video_url: str, ttl: int | None = None) -> dict:
+    """
+    Record a completed task so later identical or near-identical prompts can
+    reuse it. Returns the columns to write onto the task's completed row so
+    other processes pick it up on their next sync.
+    """
+    if not settings.prompt_cache_enabled:
+        return {}
+    norm = normalize_prompt(prompt)
+    try:
+        embedding = await _embed(norm)
+    except Exception as e:
+        logger.warning(f"[PromptCache] Could not embed prompt, caching for exact matches only: {e}")
+        embedding = None
+
+    _store(norm, quality, duration, script, video_url, embedding,
+           time.time() + (ttl if ttl is not None else settings.prompt_cache_ttl))
+    _stats["stores"] += 1
+    return {
+        "prompt_norm": norm,
+        "duration": duration,
+        "prompt_embedding": embedding.tolist() if embedding is not None else None,
+    }
+
+
+def forget(prompt: str, quality: str, duration: int):
+    _entries.pop(_key(normalize_prompt(prompt), quality, duration), None)
+
+
+def forget_video(video_url: str):
+    """Drop every entry pointing at a video that no longer exists."""
+    _dead_videos.add(video_url)
+    for key in [k for k, e in _entries.items() if e["video_url"] == video_url]:
+        del _entries[key]
+
+
+def get_stats() -> dict:
+    return {**_stats, "entries": len(_entries)}
@@ -0,0 +1,176 @@
+"""
+Content-addressed cache of rendered videos.
+
+A render is fully determined by the sanitized script, the quality flag and
+the Manim/ffmpeg toolchain, so identical inputs can reuse an earlier MP4
+instead of re-running Manim. Entries live on local disk under
+`settings.render_cache_dir` with LRU eviction by total size (tracked in a
+DiskLRU index, so stores don't walk the directory), and can be mirrored to
+the Supabase storage bucket so other hosts share them.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from functools import lru_cache
+from importlib import metadata
+
+from app.config import get_settings
+from app.services.disk_lru import DiskLRU
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+MIRROR_PREFIX = "render-cache"
+
+_stats = {"hits": 0, "misses": 0, "mirror_hits": 0, "stores": 0}
+_lru: DiskLRU | None = None
+
+
+@lru_cache()
+def toolchain_fingerprint() -> str:
+    """Versions of everything that affects the rendered bytes."""
+    try:
+        manim_version = metadata.version("manim")
+    except metadata.PackageNotFoundError:
+        manim_version = "unknown"
+    try:
+        out = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True, timeout=10).stdout
+        ffmpeg_version = out.splitlines()[0] if out else "unknown"
+    except Exception:
+        ffmpeg_version = "unknown"
+    return f"manim={manim_version};ffmpeg={ffmpeg_version}"
+
+
+def normalize_script(script: str) -> str:
+    """Canonical form so whitespace-only differences map to the same entry."""
+    lines = script.replace("\r\n", "\n").replace("\t", "    ").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip() + "\n"
+
+
+def cache_key(script: str, quality: str) -> str:
+    h = hashlib.sha256()
+    h.update(normalize_script(script).encode("utf-8"))
+    h.update(f"\0quality={quality}\0".encode("utf-8"))
+    h.update(toolchain_fingerprint().encode("utf-8"))
+    return h.hexdigest()
+
+
+def _cache_dir() -> str:
+    path = settings.render_cache_dir or os.path.join(tempfile.gettempdir(), "movinglines_render_cache")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _index() -> DiskLRU:
+    global _lru
+    if _lru is None:
+        _lru = DiskLRU(_cache_dir(), ".mp4", settings.render_cache_max_bytes)
+    return _lru
+
+
+def _entry_path(key: str) -> str:
+    return os.path.join(_cache_dir(), key[:2], f"{key}.mp4")
+
+
+def lookup(key: str) -> str | None:
+    """Return the cached video path for `key`, bumping its LRU position."""
+    path = _entry_path(key)
+    if os.path.exists(path):
+        _index().touch(path)
+        _stats["hits"] += 1
+        return path
+    return None
+
+
+def store(key: str, video_path: str) -> str:
+    """Copy a finished render into the cache and evict old entries if over budget."""
+    path = _entry_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write to a temp name first so readers never see a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    shutil.copy2(video_path, tmp_path)
+    os.replace(tmp_path, path)
+    _stats["stores"] += 1
+    _index().add(path)
+    return path
+
+
+async def _mirror_upload(key: str, path: str):
+    from app.services.database_service import get_async_supabase
+    bucket = os.getenv("SUPABASE_BUCKET", "manim-videos")
+    with open(path, "rb") as f:
+        data = f.read()
+    await get_async_supabase().storage.from_(bucket).upload(
+        path=f"{MIRROR_PREFIX}/{key}.mp4",
+        file=data,
+        file_options={"content-type": "video/mp4", "upsert": "true"}
+    )
+
+
+def _write_entry(key: str, data: bytes) -> str:
+    path = _entry_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    _index().add(path)
+    return path
+
+
+async def _mirror_download(key: str) -> str | None:
+    from app.services.database_service import get_async_supabase
+    bucket = os.getenv("SUPABASE_BUCKET", "manim-videos")
+    try:
+        data = await get_async_supabase().storage.from_(bucket).download(f"{MIRROR_PREFIX}/{key}.mp4")
+    except Exception:
+        return None
+    if not data:
+        return None
+    return await asyncio.to_thread(_write_entry, key, data)
+
+
+async def get_cached_render(script: str, quality: str) -> str | None:
+    """Local lookup first, then the storage mirror if enabled."""
+    if not settings.render_cache_enabled:
+        return None
+    key = cache_key(script, quality)
+    path = await asyncio.to_thread(lookup, key)
+    if path:
+        return path
+    if settings.render_cache_mirror:
+        path = await _mirror_download(key)
+        if path:
+            _stats["mirror_hits"] += 1
+            return path
+    _stats["misses"] += 1
+    return None
+
+
+async def put_cached_render(script: str, quality: str, video_path: str):
+    """Store a successful render; failures here never fail the render itself."""
+    if not settings.render_cache_enabled:
+        return
+    key = cache_key(script, quality)
+    try:
+        path = await asyncio.to_thread(store, key, video_path)
+        if settings.render_cache_mirror:
+            await _mirror_upload(key, path)
+    except Exception as e:
+        logger.warning(f"[RenderCache] Failed to store {key[:12]}: {e}")
+
+
+def get_stats() -> dict:
+    index = _index()
+    entries, size = index.totals()
+    return {
+        **_stats,
+        "evictions": index.evictions,
+        "entries": entries,
+        "bytes": size,
+        "max_bytes": settings.render_cache_max_bytes,
+    }
@@ -0,0 +1,193 @@
+"""
+Render worker pool for Manim subprocesses.
+
+Each render takes one of `settings.render_workers` slots. A slot owns a fixed
+CPU set (when `render_cpus_per_worker` > 0), and every child process is exec'd
+directly (no shell) in its own process group with optional memory, niceness
+and wall-clock limits, so one runaway render can't starve the others.
+
+Limits are applied by a tiny Python shim that sets them and then execs the
+real command, not by `preexec_fn`: this process runs thread pool executors,
+and code between fork and exec is not safe when other threads exist.
+"""
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+import time
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class RenderTimeout(Exception):
+    """The render hit its wall-clock limit. Not a RuntimeError: it says nothing about the script."""
+
+
+def _plan_cpu_sets(workers: int, cpus_per_worker: int) -> list[list[int] | None]:
+    """Split the CPUs this process may use into one set per worker slot."""
+    if cpus_per_worker <= 0 or not hasattr(os, "sched_getaffinity"):
+        return [None] * workers
+    available = sorted(os.sched_getaffinity(0))
+    sets = []
+    for slot in range(workers):
+        start = (slot * cpus_per_worker) % len(available)
+        sets.append([available[(start + i) % len(available)] for i in range(min(cpus_per_worker, len(available)))])
+    return sets
+
+
+def apply_limits(cpus: list[int] | None, memory_mb: int, nice: int):
+    """Limit the calling process. Only for freshly spawned children (warm workers), never this one."""
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    if memory_mb and resource is not None:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    if nice:
+        os.nice(nice)
+
+
+# Same as apply_limits, standalone so the exec'd child doesn't import the app.
+# argv: limits json, then the command to exec
+_LIMITS_SHIM = """\
+import json, os, sys
+limits = json.loads(sys.argv[1])
+if limits.get("cpus"):
+    os.sched_setaffinity(0, limits["cpus"])
+if limits.get("memory_mb"):
+    import resource
+    limit = limits["memory_mb"] * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+if limits.get("nice"):
+    os.nice(limits["nice"])
+os.execvp(sys.argv[2], sys.argv[2:])
+"""
+
+
+def _with_limits(argv: list[str], cpus: list[int] | None, memory_mb: int, nice: int) -> list[str]:
+    """Prefix `argv` with the shim that applies CPU affinity, memory and niceness limits before exec."""
+    limits = {}
+    if cpus and hasattr(os, "sched_setaffinity"):
+        limits["cpus"] = cpus
+    if memory_mb and resource is not None:
+        limits["memory_mb"] = memory_mb
+    if nice:
+        limits["nice"] = nice
+    if not limits:
+        return argv
+    return [sys.executable, "-c", _LIMITS_SHIM, json.dumps(limits), *argv]
+
+
+def _kill_group(proc: asyncio.subprocess.Process):
+    try:
+        if os.name == "posix":
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except ProcessLookupError:
+        pass
+
+
+class RenderPool:
+    def __init__(self, workers: int, cpus_per_worker: int = 0, memory_limit_mb: int = 0,
+                 timeout: int = 600, nice: int = 0):
+        self.workers = max(1, workers)
+        self.memory_limit_mb = memory_limit_mb
+        self.timeout = timeout
+        self.nice = nice
+        self.cpu_sets = _plan_cpu_sets(self.workers, cpus_per_worker)
+        self._free_slots: asyncio.Queue | None = None
+        self._waiting = 0
+        self._in_flight: dict[int, dict] = {}
+
+    def _slots(self) -> asyncio.Queue:
+        if self._free_slots is None:
+            self._free_slots = asyncio.Queue()
+            for slot in range(self.workers):
+                self._free_slots.put_nowait(slot)
+        return self._free_slots
+
+    async def run(self, argv: list[str], cwd: str, job_id: str | None = None,
+                  timeout: int | None = None) -> tuple[int, str, str]:
+        """Run `argv` in a free slot and return (returncode, stdout, stderr).
+
+        Cancelling the awaiting task kills the whole process group.
+        """
+        slots = self._slots()
+        self._waiting += 1
+        try:
+            slot = await slots.get()
+        finally:
+            self._waiting -= 1
+
+        cpus = self.cpu_sets[slot]
+        timeout = timeout or self.timeout
+        try:
+            kwargs = {}
+            if os.name == "posix":
+                kwargs["start_new_session"] = True
+                argv = _with_limits(argv, cpus, self.memory_limit_mb, self.nice)
+            proc = await asyncio.create_subprocess_exec(
+                *argv,
+                cwd=cwd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                **kwargs
+            )
+            self._in_flight[slot] = {
+                "job_id": job_id,
+                "pid": proc.pid,
+                "cpus": cpus,
+                "started_at": time.time(),
+            }
+            try:
+                stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=timeout)
+            except asyncio.TimeoutError:
+                _kill_group(proc)
+                await proc.wait()
+                raise RenderTimeout(f"Manim rendering timed out after {timeout}s")
+            except asyncio.CancelledError:
+                _kill_group(proc)
+                await proc.wait()
+                raise
+            return proc.returncode, stdout.decode(errors="replace"), stderr.decode(errors="replace")
+        finally:
+            self._in_flight.pop(slot, None)
+            slots.put_nowait(slot)
+
+    def stats(self) -> dict:
+        now = time.time()
+        return {
+            "workers": self.workers,
+            "queue_depth": self._waiting,
+            "in_flight": [
+                {**job, "slot": slot, "elapsed": round(now - job["started_at"], 1)}
+                for slot, job in self._in_flight.items()
+            ],
+        }
+
+
+_pool: RenderPool | None = None
+
+
+def get_render_pool() -> RenderPool:
+    global _pool
+    if _pool is None:
+        _pool = RenderPool(
+            workers=settings.render_workers,
+            cpus_per_worker=settings.render_cpus_per_worker,
+            memory_limit_mb=settings.render_memory_limit_mb,
+            timeout=settings.render_timeout,
+            nice=settings.render_nice,
+        )
+        logger.info(f"[RenderPool] {_pool.workers} workers, cpu sets: {_pool.cpu_sets}")
+    return _pool
@@ -0,0 +1,150 @@
+"""
+Segment planning and stitching for parallel scene rendering.
+
+A scene is split into contiguous ranges of animations. Each range is rendered
+by its own Manim process using manim's animation-number window (`-n a,b`):
+earlier animations are still executed with skip_animations, so every segment
+starts from exactly the mobject state the single-process render would have,
+but only its own animations are drawn and encoded. The segment videos are
+then joined with a stream-copy ffmpeg concat.
+
+Splitting only happens when the number and order of animations is known
+statically (no play/wait inside loops, branches or helper methods).
+"""
+import ast
+import asyncio
+import os
+
+# Scene methods that advance manim's animation counter (wait and move_camera go through play)
+ANIMATION_METHODS = {"play", "wait", "pause", "wait_until", "move_camera"}
+
+_DYNAMIC_NODES = (
+    ast.For, ast.AsyncFor, ast.While, ast.If, ast.IfExp, ast.Try, ast.Match,
+    ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp,
+    ast.Lambda, ast.FunctionDef, ast.AsyncFunctionDef,
+)
+
+
+def _self_call(node: ast.AST) -> str | None:
+    """Return the method name for `self.<name>(...)` calls."""
+    if (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Attribute)
+        and isinstance(node.func.value, ast.Name)
+        and node.func.value.id == "self"
+    ):
+        return node.func.attr
+    return None
+
+
+def _contains_animation(node: ast.AST, helper_methods: set[str]) -> bool:
+    for child in ast.walk(node):
+        name = _self_call(child)
+        if name in ANIMATION_METHODS or name in helper_methods:
+            return True
+    return False
+
+
+def analyze_animations(script: str) -> dict | None:
+    """
+    Statically count the animations in GeneratedScene.construct.
+
+    Returns {"count": n, "sections": [animation index where each next_section starts]}
+    or None if the sequence depends on runtime control flow.
+    """
+    try:
+        tree = ast.parse(script)
+    except SyntaxError:
+        return None
+
+    scene = next((n for n in tree.body if isinstance(n, ast.ClassDef)), None)
+    if scene is None:
+        return None
+    methods = {n.name: n for n in scene.body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef))}
+    construct = methods.get("construct")
+    if construct is None:
+        return None
+    # Helper methods that animate make the count depend on how often they are called
+    helper_methods = {
+        name for name, fn in methods.items()
+        if name != "construct" and _contains_animation(fn, set())
+    }
+
+    count = 0
+    sections = []
+
+    def visit(stmts: list[ast.stmt]) -> bool:
+        nonlocal count
+        for stmt in stmts:
+            for node in ast.walk(stmt):
+                if isinstance(node, _DYNAMIC_NODES) and _contains_animation(node, helper_methods):
+                    return False
+            calls = [n for n in ast.walk(stmt) if _self_call(n)]
+            # Order calls by source position; ast.walk is breadth-first
+            calls.sort(key=lambda n: (n.lineno, n.col_offset))
+            for call in calls:
+                name = _self_call(call)
+                if name in helper_methods:
+                    return False
+                if name == "next_section":
+                    sections.append(count)
+                elif name in ANIMATION_METHODS:
+                    count += 1
+        return True
+
+    if not visit(construct.body):
+        return None
+    return {"count": count, "sections": sections}
+
+
+def plan_segments(analysis: dict, max_segments: int, min_animations: int) -> list[tuple[int, int | None]]:
+    """
+    Split animations [0, count) into contiguous (start, end_inclusive) windows.
+
+    next_section boundaries are preferred when the script declares them; the
+    last window is open-ended so trailing frames are never lost.
+    """
+    count = analysis["count"]
+    if max_segments < 2 or count < min_animations:
+        return []
+
+    starts = sorted({s for s in analysis["sections"] if 0 < s < count})
+    if starts:
+        # Merge tiny sections until at most max_segments remain
+        while len(starts) + 1 > max_segments:
+            bounds = [0] + starts + [count]
+            sizes = [bounds[i + 1] - bounds[i] for i in range(len(bounds) - 1)]
+            smallest = min(range(len(starts)), key=lambda i: sizes[i] + sizes[i + 1])
+            starts.pop(smallest)
+    else:
+        segments = min(max_segments, count // max(1, min_animations // 2))
+        if segments < 2:
+            return []
+        step = count / segments
+        starts = [round(step * i) for i in range(1, segments)]
+
+    bounds = [0] + starts
+    windows = []
+    for i, start in enumerate(bounds):
+        end = bounds[i + 1] - 1 if i + 1 < len(bounds) else None
+        windows.append((start, end))
+    return windows
+
+
+async def concat_videos(paths: list[str], output_path: str):
+    """Join segment videos without re-encoding."""
+    list_path = f"{output_path}.txt"
+    with open(list_path, "w", encoding="utf-8") as f:
+        for path in paths:
+            escaped = path.replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    proc = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+        "-i", list_path, "-c", "copy", output_path,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    _, stderr = await proc.communicate()
+    os.remove(list_path)
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg concat failed: {stderr.decode(errors='replace')}")
@@ -0,0 +1,116 @@
+"""
+Coalesced task progress writes.
+
+`process_animation` reports every step both over Socket.IO and to the `tasks`
+table. The socket emit is what the client watches live; the row only has to
+catch up. Intermediate updates are therefore merged per task (later values
+win) and written in one batch every `settings.task_progress_flush_interval`
+seconds. Terminal states are written immediately together with anything
+still pending for that task.
+"""
+import asyncio
+import logging
+from datetime import datetime
+
+from app.config import get_settings
+from app.services.database_service import get_async_supabase
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+_pending: dict[str, dict] = {}
+_flusher: asyncio.Task | None = None
+_stats = {"queued": 0, "coalesced": 0, "batches": 0, "rows_written": 0, "sync_writes": 0, "errors": 0}
+
+
+def _stamp(updates: dict) -> dict:
+    return {**updates, "updated_at": datetime.utcnow().isoformat()}
+
+
+async def _write_batch(batch: dict[str, dict]):
+    client = get_async_supabase()
+    rows = [{"id": task_id, **updates} for task_id, updates in batch.items()]
+    try:
+        await client.rpc("batch_update_tasks", {"p_updates": rows}).execute()
+    except Exception as e:
+        # RPC missing (migration 004 not applied): fall back to one PATCH per task
+        logger.debug(f"[Progress] batch_update_tasks failed, falling back: {e}")
+        await asyncio.gather(*(
+            client.table("tasks").update(updates).eq("id", task_id)
+            .not_.in_("status", list(TERMINAL_STATUSES)).execute()
+            for task_id, updates in batch.items()
+        ))
+    _stats["batches"] += 1
+    _stats["rows_written"] += len(rows)
+
+
+async def flush():
+    """Write everything pending now."""
+    if not _pending:
+        return
+    batch = dict(_pending)
+    _pending.clear()
+    try:
+        await _write_batch(batch)
+    except Exception as e:
+        _stats["errors"] += 1
+        logger.warning(f"[Progress] Failed to flush {len(batch)} task updates: {e}")
+        # Keep the values for the next tick unless newer ones arrived meanwhile
+        for task_id, updates in batch.items():
+            _pending[task_id] = {**updates, **_pending.get(task_id, {})}
+
+
+async def _flush_loop():
+    global _flusher
+    try:
+        while _pending:
+            await asyncio.sleep(settings.task_progress_flush_interval)
+            await flush()
+    finally:
+        _flusher = None
+
+
+def queue_update(task_id: str, updates: dict):
+    """Buffer a non-terminal update; it reaches the database on the next flush."""
+    _stats["queued"] += 1
+    if task_id in _pending:
+        _stats["coalesced"] += 1
+    _pending[task_id] = {**_pending.get(task_id, {}), **_stamp(updates)}
+
+    global _flusher
+    if _flusher is None:
+        _flusher = asyncio.create_task(_flush_loop())
+
+
+async def write_now(task_id: str, updates: dict):
+    """
+    Write a (terminal) update synchronously, folding in any pending values for the task.
+
+    Like the batched path, rows already in a terminal state are left alone: a
+    worker's late "completed" must not replace a cancel recorded by the API.
+    """
+    merged = {**_pending.pop(task_id, {}), **_stamp(updates)}
+    _stats["sync_writes"] += 1
+    await (
+        get_async_supabase().table("tasks").update(merged).eq("id", task_id)
+        .not_.in_("status", list(TERMINAL_STATUSES)).execute()
+    )
+
+
+async def update(task_id: str, updates: dict):
+    """Route an update: terminal statuses are written now, everything else is coalesced."""
+    if settings.task_progress_flush_interval <= 0 or updates.get("status") in TERMINAL_STATUSES:
+        await write_now(task_id, updates)
+    else:
+        queue_update(task_id, updates)
+
+
+def pending(task_id: str) -> dict:
+    """Values buffered in this process that the database row doesn't have yet."""
+    return dict(_pending.get(task_id, {}))
+
+
+def get_stats() -> dict:
+    return {**_stats, "pending": len(_pending)}
@@ -1,9 +1,20 @@
+import asyncio
 import os
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pinecone import Pinecone
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+from app.config import get_settings
+from app.services import embedding_cache
+from app.services.client_registry import get_embeddings_client
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# The embedding and Pinecone SDKs are blocking; they run here so retrieval never
+# stalls the event loop and can't take over the default executor
+_executor = ThreadPoolExecutor(max_workers=settings.retrieval_threads, thread_name_prefix="retrieval")
 
 pc = None
 index = None
@@ -25,52 +36,97 @@ def get_pinecone_index():
             return None
     return index
 
+def get_vector_index():
+    """Index used for retrieval: the local memory-mapped index or Pinecone."""
+    if settings.vector_backend == "local":
+        from app.services.local_index import get_local_index
+        return get_local_index()
+    return get_pinecone_index()
+
 def get_embeddings():
-    return GoogleGenerativeAIEmbeddings(
-        model="models/gemini-embedding-001",
-        google_api_key=os.getenv("GOOGLE_API_KEY")
+    return get_embeddings_client()
+
+def _run_blocking(fn, *args):
+    """Run a blocking SDK call on the bounded retrieval executor."""
+    return asyncio.get_running_loop().run_in_executor(_executor, partial(fn, *args))
+
+
+def _embed_queries(queries: list[str]) -> list[list[float]]:
+    # Cached vectors are reused; the rest go out in a single batch request
+    return embedding_cache.embed(queries, task_type="retrieval_query")
+
+
+def _query_vector(idx, vector: list[float], top_k: int) -> list[dict]:
+    results = idx.query(
+        vector=vector,
+        top_k=top_k,
+        include_metadata=True
     )
+    
+    examples = []
+    for match in results.matches:
+        if match.metadata:
+            example = {
+                "code": match.metadata.get("code", ""),
+                "description": match.metadata.get("description", ""),
+                "score": match.score,
+                "source": match.metadata.get("source", "unknown")
+            }
+            if example["code"]:
+                examples.append(example)
+                logger.info(f"[Pinecone] Found match (score={match.score:.3f}): {example['description'][:50]}...")
+    return examples
 
-async def get_relevant_examples(query: str, top_k: int = 5) -> list[dict]:
+
+async def get_relevant_examples_batch(queries: list[str], top_k: int = 5) -> list[list[dict]]:
     """
-    Retrieve relevant Manim code examples from Pinecone.
-    Returns list of dicts with 'code' and 'description' keys.
+    Retrieve examples for several queries at once (e.g. prompt, storyboard
+    summary, error text). All queries are embedded in one request and the
+    index lookups run concurrently. Returns one example list per query.
     """
+    queries = [q for q in queries if q and q.strip()]
+    if not queries:
+        return []
     try:
-        embeddings = get_embeddings()
-        query_embedding = embeddings.embed_query(query)
-        
-        idx = get_pinecone_index()
+        idx = await _run_blocking(get_vector_index)
         if idx is None:
             logger.info("[Pinecone] No index available. Returning empty examples.")
-            return []
-        results = idx.query(
-            vector=query_embedding,
-            top_k=top_k,
-            include_metadata=True
-        )
+            return [[] for _ in queries]
+        vectors = await _run_blocking(_embed_queries, queries)
+        batches = await asyncio.gather(*(
+            _run_blocking(_query_vector, idx, vector, top_k) for vector in vectors
+        ))
         
-        examples = []
-        for match in results.matches:
-            if match.metadata:
-                example = {
-                    "code": match.metadata.get("code", ""),
-                    "description": match.metadata.get("description", ""),
-                    "score": match.score,
-                    "source": match.metadata.get("source", "unknown")
-                }
-                if example["code"]:
-                    examples.append(example)
-                    logger.info(f"[Pinecone] Found match (score={match.score:.3f}): {example['description'][:50]}...")
-        
-        logger.info(f"[Pinecone] Retrieved {len(examples)} relevant examples for query: {query[:50]}...")
-        if examples:
-            logger.info(f"[Pinecone] Top example desc: {examples[0]['description'][:80]}...")
-        return examples
+        for query, examples in zip(queries, batches):
+            logger.info(f"[Pinecone] Retrieved {len(examples)} relevant examples for query: {query[:50]}...")
+        return list(batches)
         
     except Exception as e:
         logger.error(f"[Pinecone] Query error: {e}")
-        return []
+        return [[] for _ in queries]
+
+
+def merge_examples(batches: list[list[dict]], top_k: int = 5) -> list[dict]:
+    """Union of several result lists, deduplicated by code and ranked by best score."""
+    best: dict[str, dict] = {}
+    for examples in batches:
+        for ex in examples:
+            current = best.get(ex["code"])
+            if current is None or ex.get("score", 0) > current.get("score", 0):
+                best[ex["code"]] = ex
+    return sorted(best.values(), key=lambda ex: ex.get("score", 0), reverse=True)[:top_k]
+
+
+async def get_relevant_examples(query: str, top_k: int = 5) -> list[dict]:
+    """
+    Retrieve relevant Manim code examples from Pinecone.
+    Returns list of dicts with 'code' and 'description' keys.
+    """
+    batches = await get_relevant_examples_batch([query], top_k=top_k)
+    examples = batches[0] if batches else []
+    if examples:
+        logger.info(f"[Pinecone] Top example desc: {examples[0]['description'][:80]}...")
+    return examples
 
 
 def format_examples_for_context(examples: list[dict]) -> str:
@@ -92,16 +148,55 @@ Description: {ex['description'][:300]}
     return "\n".join(context_parts)
 
 
+def example_text(description: str, code: str) -> str:
+    """Text that gets embedded for a stored example."""
+    return f"{description}\n\nCode:\n{code[:500]}"
+
+
+def _embed_examples(examples: list[dict]) -> list[list[float]]:
+    texts = [example_text(ex["description"], ex["code"]) for ex in examples]
+    # Same task type as embed_query so batched and single upserts produce comparable vectors
+    return get_embeddings().embed_documents(texts, task_type="retrieval_query")
+
+
+async def upsert_examples(examples: list[dict]) -> int:
+    """
+    Embed and upsert several examples ({"id", "description", "code", optional "source"})
+    with one embedding request and one index write.
+    """
+    if not examples:
+        return 0
+    vectors = await _run_blocking(_embed_examples, examples)
+    idx = await _run_blocking(get_vector_index)
+    if idx is None:
+        raise RuntimeError("No vector index configured")
+    await _run_blocking(partial(idx.upsert, vectors=[
+        {
+            "id": ex["id"],
+            "values": vector,
+            "metadata": {
+                "description": ex["description"],
+                "code": ex["code"],
+                **({"source": ex["source"]} if ex.get("source") else {}),
+            },
+        }
+        for ex, vector in zip(examples, vectors)
+    ]))
+    return len(examples)
+
+
 async def upsert_example(id: str, description: str, code: str):
     """Add a single example to Pinecone."""
-    embeddings = get_embeddings()
-    vector = embeddings.embed_query(f"{description}\n\nCode:\n{code[:500]}")
-    
-    idx = get_pinecone_index()
-    idx.upsert(vectors=[{
-        "id": id,
-        "values": vector,
-        "metadata": {"description": description, "code": code}
-    }])
+    await upsert_examples([{"id": id, "description": description, "code": code}])
     logger.info(f"[Pinecone] Upserted example: {id}")
 
+
+async def delete_examples(ids: list[str]):
+    """Remove examples from the index by id."""
+    if not ids:
+        return
+    idx = await _run_blocking(get_vector_index)
+    if idx is None:
+        return
+    await _run_blocking(partial(idx.delete, ids=ids))
+    logger.info(f"[Pinecone] Deleted {len(ids)} examples")
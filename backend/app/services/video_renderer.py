@@ -1,11 +1,17 @@
 import os
 import uuid
-import subprocess
 import tempfile
 import shutil
 import sys
 import re
-from concurrent.futures import ThreadPoolExecutor
+
+from app.services.render_cache import get_cached_render, put_cached_render
+from app.services.render_pool import get_render_pool, RenderTimeout
+from app.services.warm_renderer import get_warm_pool, get_preflight_pool
+from app.services.segmented_renderer import analyze_animations, plan_segments, concat_videos
+from app.config import get_settings
+
+settings = get_settings()
 
 QUALITY_FLAGS = {
     "l": "-ql",   # 420p15
@@ -14,36 +20,33 @@ QUALITY_FLAGS = {
     "k": "-qk",   # 4K60
 }
 
-executor = ThreadPoolExecutor(max_workers=2)
-
-def _run_manim_sync(cmd: str, work_dir: str) -> tuple:
-    """Run manim command synchronously."""
-    result = subprocess.run(
-        cmd,
-        shell=True,
-        cwd=work_dir,
-        capture_output=True,
-        text=True
-    )
-    return result.returncode, result.stdout, result.stderr
-
-async def render_animation(script: str, quality: str = "m") -> str:
+async def render_animation(script: str, quality: str = "m", job_id: str | None = None,
+                           work_dir: str | None = None) -> str:
     """
     Render a Manim script and return the path to the output video.
+
+    With `work_dir`, the script and manim's media directory persist there
+    between calls (the caller removes it). Manim then reuses its cached
+    partial movie files, so re-rendering a repaired script only renders the
+    animations whose inputs changed.
     """
-    import asyncio
-    
-    # Use a proper temp directory
-    work_dir = tempfile.mkdtemp(prefix="manim_")
     script_id = str(uuid.uuid4())[:8]
-    script_path = os.path.join(work_dir, f"scene_{script_id}.py")
+    keep_work_dir = work_dir is not None
+    if keep_work_dir:
+        os.makedirs(work_dir, exist_ok=True)
+        # Same module name every time, or manim looks for cached partials elsewhere
+        script_path = os.path.join(work_dir, "scene.py")
+    else:
+        work_dir = tempfile.mkdtemp(prefix="manim_")
+        script_path = os.path.join(work_dir, f"scene_{script_id}.py")
     
     print(f"[Manim] Work dir: {work_dir}")
     print(f"[Manim] Script path: {script_path}")
     
     try:
-        # Sanitize common LLM mistakes to match Manim CE 0.18 API
-        script = sanitize_manim_script(script)
+        # Sanitize common LLM mistakes to match Manim CE 0.18 API (free if already sanitized)
+        from app.services.manim.ast_sanitizer import sanitize_script
+        script = sanitize_script(script)
         # Normalize indentation
         import ast, textwrap
         script_norm = script.replace("\t", "    ")
@@ -58,31 +61,23 @@ async def render_animation(script: str, quality: str = "m") -> str:
         scene_name = extract_scene_name(script_norm)
         print(f"[Manim] Scene name: {scene_name}")
         
-        quality_flag = QUALITY_FLAGS.get(quality, "-qm")
-        
-        # Run manim command - use python -m manim for better compatibility
-        if sys.platform == "win32":
-            cmd = f'python -m manim {quality_flag} "{script_path}" {scene_name}'
-        else:
-            cmd = f'manim {quality_flag} "{script_path}" {scene_name}'
-        
-        print(f"[Manim] Running command: {cmd}")
-        
-        # Run in thread pool to avoid blocking
-        loop = asyncio.get_event_loop()
-        returncode, stdout_str, stderr_str = await loop.run_in_executor(
-            executor, _run_manim_sync, cmd, work_dir
-        )
-        
-        print(f"[Manim] stdout: {stdout_str}")
-        print(f"[Manim] stderr: {stderr_str}")
-        print(f"[Manim] Return code: {returncode}")
+        # Move to a storage location outside the project root to avoid uvicorn --reload loops
+        storage_dir = os.path.join(tempfile.gettempdir(), "movinglines_renders")
+        os.makedirs(storage_dir, exist_ok=True)
+        final_path = os.path.join(storage_dir, f"{script_id}_{scene_name}.mp4")
         
-        if returncode != 0:
-            raise RuntimeError(f"Manim rendering failed: {stderr_str or stdout_str}")
+        # Identical script + quality + toolchain: reuse the earlier render
+        cached_path = await get_cached_render(script_norm, quality)
+        if cached_path:
+            shutil.copy2(cached_path, final_path)
+            print(f"[Manim] Render cache hit, reusing: {cached_path}")
+            return final_path
         
-        # Find the output video
-        video_path = find_output_video(work_dir, scene_name, quality)
+        video_path = None
+        if settings.render_segments > 1:
+            video_path = await _render_segmented(script_norm, scene_name, quality, work_dir, job_id)
+        if not video_path:
+            video_path = await _render_single(script_path, scene_name, quality, work_dir, job_id)
         
         if not video_path:
             # List all files for debugging
@@ -94,11 +89,8 @@ async def render_animation(script: str, quality: str = "m") -> str:
         
         print(f"[Manim] Found video at: {video_path}")
         
-        # Move to a storage location outside the project root to avoid uvicorn --reload loops
-        storage_dir = os.path.join(tempfile.gettempdir(), "movinglines_renders")
-        os.makedirs(storage_dir, exist_ok=True)
-        final_path = os.path.join(storage_dir, f"{script_id}_{scene_name}.mp4")
         shutil.copy2(video_path, final_path)
+        await put_cached_render(script_norm, quality, final_path)
         
         print(f"[Manim] Saved for upload at: {final_path}")
         
@@ -109,8 +101,160 @@ async def render_animation(script: str, quality: str = "m") -> str:
         raise
     finally:
         # Cleanup temp directory
+        if not keep_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+async def _render_single(script_path: str, scene_name: str, quality: str, work_dir: str, job_id: str | None,
+                         animation_range: tuple[int, int | None] | None = None) -> str | None:
+    if settings.render_mode == "warm":
+        return await _render_warm(script_path, scene_name, quality, work_dir, job_id, animation_range)
+    return await _render_cli(script_path, scene_name, quality, work_dir, job_id, animation_range)
+
+async def _render_segmented(script: str, scene_name: str, quality: str, work_dir: str, job_id: str | None) -> str | None:
+    """
+    Render independent animation windows in parallel and stitch them together.
+    Returns None when the script can't be split, so the caller renders it whole.
+    """
+    import asyncio
+    
+    analysis = analyze_animations(script)
+    if analysis is None:
+        return None
+    windows = plan_segments(analysis, settings.render_segments, settings.segment_min_animations)
+    if not windows:
+        return None
+    
+    print(f"[Manim] Segmented render: {len(windows)} segments over {analysis['count']} animations {windows}")
+    
+    async def render_window(index: int, window: tuple[int, int | None]) -> str:
+        segment_dir = os.path.join(work_dir, f"segment_{index}")
+        os.makedirs(segment_dir, exist_ok=True)
+        segment_script = os.path.join(segment_dir, "scene.py")
+        with open(segment_script, "w", encoding="utf-8") as f:
+            f.write(script)
+        path = await _render_single(segment_script, scene_name, quality, segment_dir, f"{job_id}:seg{index}", window)
+        if not path:
+            raise RuntimeError(f"Could not find rendered video for segment {index}")
+        return path
+    
+    tasks = [asyncio.create_task(render_window(i, w)) for i, w in enumerate(windows)]
+    try:
+        segment_paths = await asyncio.gather(*tasks)
+    except BaseException:
+        # One segment failing means the whole render fails; stop the others now
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    
+    output_path = os.path.join(work_dir, f"{scene_name}_stitched.mp4")
+    await concat_videos(segment_paths, output_path)
+    return output_path
+
+async def _render_cli(script_path: str, scene_name: str, quality: str, work_dir: str, job_id: str | None,
+                      animation_range: tuple[int, int | None] | None = None) -> str | None:
+    """Render by spawning the manim CLI in a render pool slot."""
+    quality_flag = QUALITY_FLAGS.get(quality, "-qm")
+    
+    # Exec manim directly (no shell) with the interpreter we are running under
+    argv = [sys.executable, "-m", "manim", quality_flag, script_path, scene_name]
+    if animation_range:
+        start, end = animation_range
+        argv += ["-n", f"{start},{end}" if end is not None else str(start)]
+    
+    print(f"[Manim] Running command: {' '.join(argv)}")
+    
+    # Runs in a render pool slot with CPU pinning and resource limits
+    returncode, stdout_str, stderr_str = await get_render_pool().run(argv, work_dir, job_id=job_id)
+    
+    print(f"[Manim] stdout: {stdout_str}")
+    print(f"[Manim] stderr: {stderr_str}")
+    print(f"[Manim] Return code: {returncode}")
+    
+    if returncode != 0:
+        raise RuntimeError(f"Manim rendering failed: {stderr_str or stdout_str}")
+    
+    return find_output_video(work_dir, scene_name, quality)
+
+async def _render_warm(script_path: str, scene_name: str, quality: str, work_dir: str, job_id: str | None,
+                       animation_range: tuple[int, int | None] | None = None) -> str | None:
+    """Render in a warm worker that already has manim imported."""
+    print(f"[Manim] Rendering {scene_name} in warm worker")
+    config = {}
+    if animation_range:
+        start, end = animation_range
+        config["from_animation_number"] = start
+        if end is not None:
+            config["upto_animation_number"] = end
+    result = await get_warm_pool().render({
+        "script_path": script_path,
+        "scene_name": scene_name,
+        "quality": quality,
+        "work_dir": work_dir,
+        "config": config,
+    }, job_id=job_id)
+    
+    print(f"[Manim] Warm render finished in {result.get('elapsed', 0):.1f}s (ok={result['ok']})")
+    
+    if result.get("timeout"):
+        raise RenderTimeout(result["error"])
+    if not result["ok"]:
+        raise RuntimeError(f"Manim rendering failed: {result['error']}")
+    
+    video_path = result.get("video_path")
+    if video_path and os.path.exists(video_path):
+        return video_path
+    return find_output_video(work_dir, scene_name, quality)
+
+# Skip every animation (like `manim -s`) and write no movie: construct() still
+# runs, so mobjects are built, LaTeX compiles and updaters fire once per play
+PREFLIGHT_CONFIG = {
+    "save_last_frame": True,
+    "write_to_movie": False,
+    "disable_caching": True,
+}
+
+_preflight_stats = {"passed": 0, "failed": 0, "inconclusive": 0}
+
+
+async def preflight_script(script: str, job_id: str | None = None) -> str | None:
+    """
+    Dry-run the scene in a warm worker and return the error traceback, or None
+    if it ran cleanly. Timeouts and worker crashes are inconclusive and also
+    return None, so they never block the real render.
+    """
+    from app.services.manim.ast_sanitizer import sanitize_script
+
+    work_dir = tempfile.mkdtemp(prefix="manim_preflight_")
+    try:
+        script_norm = sanitize_script(script).replace("\t", "    ")
+        script_path = os.path.join(work_dir, "scene.py")
+        with open(script_path, "w", encoding="utf-8") as f:
+            f.write(script_norm)
+        result = await get_preflight_pool().render({
+            "script_path": script_path,
+            "scene_name": extract_scene_name(script_norm),
+            "quality": "l",
+            "work_dir": work_dir,
+            "config": PREFLIGHT_CONFIG,
+        }, timeout=settings.preflight_timeout, job_id=f"{job_id}:preflight" if job_id else None)
+    finally:
         shutil.rmtree(work_dir, ignore_errors=True)
 
+    print(f"[Manim] Preflight finished in {result.get('elapsed', 0):.1f}s (ok={result['ok']})")
+    if result["ok"]:
+        _preflight_stats["passed"] += 1
+        return None
+    if result.get("timeout") or result.get("crashed"):
+        _preflight_stats["inconclusive"] += 1
+        return None
+    _preflight_stats["failed"] += 1
+    return result["error"]
+
+
+def get_preflight_stats() -> dict:
+    return {**_preflight_stats, "pool": get_preflight_pool().stats()}
+
 def extract_scene_name(script: str) -> str:
     """Extract the Scene class name from the script."""
     import re
@@ -132,15 +276,21 @@ def find_output_video(work_dir: str, scene_name: str, quality: str) -> str | Non
     
     quality_dir = quality_dirs.get(quality, "720p30")
     
-    # Search recursively for any .mp4 file (most reliable)
+    # Search recursively for the finished .mp4, preferring the quality's own
+    # directory (scripts can change the frame rate, which renames it).
+    # Partial movie files, kept for reuse in persistent work dirs, don't count.
     media_dir = os.path.join(work_dir, "media")
+    found = []
     if os.path.exists(media_dir):
         for root, dirs, files in os.walk(media_dir):
+            dirs[:] = [d for d in dirs if d != "partial_movie_files"]
             for file in files:
                 if file.endswith(".mp4"):
-                    return os.path.join(root, file)
+                    if os.path.basename(root) == quality_dir:
+                        return os.path.join(root, file)
+                    found.append(os.path.join(root, file))
     
-    return None
+    return found[0] if found else None
 
 
 # -----------------------
@@ -149,6 +299,8 @@ def find_output_video(work_dir: str, scene_name: str, quality: str) -> str | Non
 def sanitize_manim_script(script: str) -> str:
     """Apply safe, deterministic fixes for common LLM-generated Manim issues.
 
+    Regex-based; only used by ast_sanitizer for scripts that don't parse.
+
     Rules:
     - Ensure required imports exist
     - Replace deprecated/unknown APIs with CE 0.18 equivalents
@@ -0,0 +1,225 @@
+"""
+Warm in-process Manim renderer.
+
+Spawning the `manim` CLI costs a fresh interpreter plus the manim/numpy/
+cairo/pango imports on every render, which dominates `-ql` previews. This
+pool keeps long-lived worker processes with manim already imported. Each job
+execs the script in a fresh namespace and renders the scene through manim's
+Python API; a worker is recycled after `warm_max_jobs_per_worker` jobs or once
+its peak RSS passes `warm_max_rss_mb`.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+import traceback
+
+from app.config import get_settings
+from app.services.render_pool import apply_limits, _plan_cpu_sets
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+MANIM_QUALITY_NAMES = {
+    "l": "low_quality",
+    "m": "medium_quality",
+    "h": "high_quality",
+    "k": "fourk_quality",
+}
+
+
+def _peak_rss_mb() -> float:
+    try:
+        import resource
+        # ru_maxrss is KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        return 0.0
+
+
+def _render_job(job: dict) -> dict:
+    """Runs inside a warm worker: exec the script and render its scene."""
+    from manim import tempconfig
+
+    os.chdir(job["work_dir"])
+    with open(job["script_path"], encoding="utf-8") as f:
+        source = f.read()
+
+    overrides = {
+        "quality": MANIM_QUALITY_NAMES.get(job["quality"], "medium_quality"),
+        "media_dir": os.path.join(job["work_dir"], "media"),
+        "input_file": job["script_path"],
+        "scene_names": [job["scene_name"]],
+    }
+    overrides.update(job.get("config", {}))
+    # The script runs inside tempconfig too: module-level `config.x = ...` lines
+    # must be undone afterwards or they leak into every later job on this worker
+    with tempconfig(overrides):
+        namespace = {"__name__": "__manim_scene__", "__file__": job["script_path"]}
+        exec(compile(source, job["script_path"], "exec"), namespace)
+        scene_cls = namespace.get(job["scene_name"])
+        if scene_cls is None:
+            raise NameError(f"Scene class '{job['scene_name']}' not found in script")
+        scene = scene_cls()
+        scene.render()
+        # Not set when movie writing is disabled (preflight runs)
+        movie_path = getattr(scene.renderer.file_writer, "movie_file_path", None)
+    return {"video_path": str(movie_path) if movie_path else None}
+
+
+def _worker_main(conn, cpus, memory_mb, nice):
+    # Runs in the spawned child before anything else, so limiting itself is safe
+    apply_limits(cpus, memory_mb, nice)
+    import manim  # noqa: F401  -- the whole point: pay the import once
+    conn.send({"ready": True})
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        started = time.time()
+        try:
+            result = {"ok": True, **_render_job(job)}
+        except BaseException as e:
+            result = {"ok": False, "error": f"{type(e).__name__}: {e}\n{traceback.format_exc()}"}
+        result["elapsed"] = time.time() - started
+        result["rss_mb"] = _peak_rss_mb()
+        conn.send(result)
+
+
+class WarmWorker:
+    def __init__(self, slot: int, cpus: list[int] | None):
+        self.slot = slot
+        self.cpus = cpus
+        self.jobs_done = 0
+        self.process = None
+        self.conn = None
+
+    def start(self):
+        ctx = multiprocessing.get_context("spawn")
+        parent_conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(child_conn, self.cpus, settings.render_memory_limit_mb, settings.render_nice),
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.jobs_done = 0
+        self.conn.recv()  # wait until manim is imported
+
+    def call(self, job: dict) -> dict:
+        self.conn.send(job)
+        return self.conn.recv()
+
+    def kill(self):
+        if self.process and self.process.is_alive():
+            self.process.kill()
+        if self.process:
+            self.process.join(timeout=5)
+        if self.conn:
+            self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+            self.process.join(timeout=5)
+        except Exception:
+            pass
+        self.kill()
+
+
+class WarmRendererPool:
+    def __init__(self, workers: int):
+        self.workers = [WarmWorker(slot, cpus) for slot, cpus in
+                        enumerate(_plan_cpu_sets(max(1, workers), settings.render_cpus_per_worker))]
+        self._idle: asyncio.Queue | None = None
+        self._waiting = 0
+        self._busy: dict[int, dict] = {}
+        self.recycled = 0
+
+    async def _ensure_started(self) -> asyncio.Queue:
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+            await asyncio.gather(*(asyncio.to_thread(w.start) for w in self.workers))
+            for w in self.workers:
+                self._idle.put_nowait(w)
+            logger.info(f"[WarmRenderer] Started {len(self.workers)} warm workers")
+        return self._idle
+
+    async def _recycle(self, worker: WarmWorker, reason: str):
+        logger.info(f"[WarmRenderer] Recycling worker {worker.slot}: {reason}")
+        self.recycled += 1
+        await asyncio.to_thread(worker.kill)
+        await asyncio.to_thread(worker.start)
+
+    async def render(self, job: dict, timeout: int | None = None, job_id: str | None = None) -> dict:
+        """Run a job on an idle warm worker; kills and respawns it on timeout or cancellation."""
+        idle = await self._ensure_started()
+        self._waiting += 1
+        try:
+            worker = await idle.get()
+        finally:
+            self._waiting -= 1
+
+        timeout = timeout or settings.render_timeout
+        self._busy[worker.slot] = {"job_id": job_id, "started_at": time.time()}
+        try:
+            try:
+                result = await asyncio.wait_for(asyncio.to_thread(worker.call, job), timeout=timeout)
+            except asyncio.TimeoutError:
+                await self._recycle(worker, "timeout")
+                return {"ok": False, "timeout": True, "error": f"Manim rendering timed out after {timeout}s"}
+            except asyncio.CancelledError:
+                await asyncio.shield(self._recycle(worker, "cancelled"))
+                raise
+            except (EOFError, OSError) as e:
+                await self._recycle(worker, f"crashed ({e!r})")
+                return {"ok": False, "crashed": True,
+                        "error": "Warm render worker crashed (likely out of memory or a native fault)"}
+
+            worker.jobs_done += 1
+            if worker.jobs_done >= settings.warm_max_jobs_per_worker:
+                await self._recycle(worker, f"served {worker.jobs_done} jobs")
+            elif result.get("rss_mb", 0) > settings.warm_max_rss_mb:
+                await self._recycle(worker, f"peak RSS {result['rss_mb']:.0f} MB")
+            return result
+        finally:
+            self._busy.pop(worker.slot, None)
+            idle.put_nowait(worker)
+
+    def stats(self) -> dict:
+        now = time.time()
+        return {
+            "workers": len(self.workers),
+            "queue_depth": self._waiting,
+            "recycled": self.recycled,
+            "jobs_per_worker": [w.jobs_done for w in self.workers],
+            "in_flight": [
+                {**job, "slot": slot, "elapsed": round(now - job["started_at"], 1)}
+                for slot, job in self._busy.items()
+            ],
+        }
+
+
+_pool: WarmRendererPool | None = None
+_preflight_pool: WarmRendererPool | None = None
+
+
+def get_warm_pool() -> WarmRendererPool:
+    global _pool
+    if _pool is None:
+        _pool = WarmRendererPool(settings.render_workers)
+    return _pool
+
+
+def get_preflight_pool() -> WarmRendererPool:
+    """Small separate pool for dry runs, so they never queue behind full renders."""
+    global _preflight_pool
+    if _preflight_pool is None:
+        _preflight_pool = WarmRendererPool(settings.preflight_workers)
+    return _preflight_pool
@@ -0,0 +1,53 @@
+"""
+Render worker process.
+
+Consumes animation jobs from the Redis job queue and runs the same
+generation/render pipeline as the API. Start as many of these as the render
+hosts can take:
+
+    python -m app.worker
+"""
+import asyncio
+import logging
+import signal
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import socketio
+
+from app.config import get_settings
+from app.routers.animations import manager, run_animation_job
+from app.services.job_queue import JobQueue, QueueWorker
+from app.services.cancellation import listen_for_cancellations
+from app.services import task_progress, harvester
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+async def main():
+    # Status updates are published through Redis and fanned out to clients by the API's Socket.IO server
+    manager.set_sio(socketio.AsyncRedisManager(settings.redis_url, write_only=True))
+
+    worker = QueueWorker(JobQueue(settings.job_queue_name), run_animation_job, concurrency=settings.worker_concurrency)
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+
+    cancel_listener = asyncio.create_task(listen_for_cancellations())
+    harvester.start(revalidate=True)
+    try:
+        await worker.run()
+    finally:
+        cancel_listener.cancel()
+        await harvester.stop()
+        await task_progress.flush()
+    logger.info("[Worker] Shut down cleanly")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
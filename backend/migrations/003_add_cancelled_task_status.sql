@@ -0,0 +1,3 @@
+ALTER TABLE tasks DROP CONSTRAINT IF EXISTS tasks_status_check;
+ALTER TABLE tasks ADD CONSTRAINT tasks_status_check
+  CHECK (status IN ('processing', 'generating_script', 'rendering', 'uploading', 'completed', 'failed', 'cancelled'));
@@ -0,0 +1,26 @@
+-- Apply a batch of coalesced task progress updates in one round trip.
+-- p_updates is a JSON array of objects with an "id" plus any of
+-- status, progress, generated_script, video_url, error_message, updated_at.
+-- Rows that already reached a terminal status are left untouched so a late
+-- progress flush can never overwrite completed/failed/cancelled.
+CREATE OR REPLACE FUNCTION batch_update_tasks(p_updates JSONB)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  affected INTEGER;
+BEGIN
+  UPDATE tasks t SET
+    status = CASE WHEN u ? 'status' THEN u->>'status' ELSE t.status END,
+    progress = CASE WHEN u ? 'progress' THEN (u->>'progress')::INTEGER ELSE t.progress END,
+    generated_script = CASE WHEN u ? 'generated_script' THEN u->>'generated_script' ELSE t.generated_script END,
+    video_url = CASE WHEN u ? 'video_url' THEN u->>'video_url' ELSE t.video_url END,
+    error_message = CASE WHEN u ? 'error_message' THEN u->>'error_message' ELSE t.error_message END,
+    updated_at = COALESCE((u->>'updated_at')::TIMESTAMPTZ, NOW())
+  FROM jsonb_array_elements(p_updates) AS u
+  WHERE t.id = (u->>'id')::UUID
+    AND t.status NOT IN ('completed', 'failed', 'cancelled');
+  GET DIAGNOSTICS affected = ROW_COUNT;
+  RETURN affected;
+END;
+$$;
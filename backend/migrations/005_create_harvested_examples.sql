@@ -0,0 +1,18 @@
+-- Successful renders promoted into the RAG corpus by app/services/harvester.py.
+-- fingerprint is a structural AST hash, so near-identical scripts are stored once.
+CREATE TABLE IF NOT EXISTS harvested_examples (
+  fingerprint TEXT PRIMARY KEY,
+  vector_id TEXT NOT NULL,
+  task_id UUID REFERENCES tasks(id) ON DELETE SET NULL,
+  prompt TEXT NOT NULL,
+  script TEXT NOT NULL,
+  score REAL NOT NULL,
+  render_seconds REAL,
+  retried BOOLEAN NOT NULL DEFAULT FALSE,
+  manim_version TEXT NOT NULL,
+  status TEXT NOT NULL DEFAULT 'active' CHECK (status IN ('active', 'expired')),
+  created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+  validated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX harvested_examples_status_version_idx ON harvested_examples(status, manim_version);
@@ -0,0 +1,27 @@
+-- Record of each self-heal attempt for a task: the error it answered, what
+-- fixed it (repair rule or LLM), the sanitizer rules that fired, and outcome.
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS repair_log JSONB;
+
+-- Same as 004, plus repair_log
+CREATE OR REPLACE FUNCTION batch_update_tasks(p_updates JSONB)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  affected INTEGER;
+BEGIN
+  UPDATE tasks t SET
+    status = CASE WHEN u ? 'status' THEN u->>'status' ELSE t.status END,
+    progress = CASE WHEN u ? 'progress' THEN (u->>'progress')::INTEGER ELSE t.progress END,
+    generated_script = CASE WHEN u ? 'generated_script' THEN u->>'generated_script' ELSE t.generated_script END,
+    video_url = CASE WHEN u ? 'video_url' THEN u->>'video_url' ELSE t.video_url END,
+    error_message = CASE WHEN u ? 'error_message' THEN u->>'error_message' ELSE t.error_message END,
+    repair_log = CASE WHEN u ? 'repair_log' THEN u->'repair_log' ELSE t.repair_log END,
+    updated_at = COALESCE((u->>'updated_at')::TIMESTAMPTZ, NOW())
+  FROM jsonb_array_elements(p_updates) AS u
+  WHERE t.id = (u->>'id')::UUID
+    AND t.status NOT IN ('completed', 'failed', 'cancelled');
+  GET DIAGNOSTICS affected = ROW_COUNT;
+  RETURN affected;
+END;
+$$;
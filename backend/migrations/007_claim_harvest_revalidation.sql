@@ -0,0 +1,6 @@
+-- Revalidation claims a row before re-rendering it so only one process works
+-- on each entry; claimed_at lets a crashed process's claims be released.
+ALTER TABLE harvested_examples DROP CONSTRAINT IF EXISTS harvested_examples_status_check;
+ALTER TABLE harvested_examples ADD CONSTRAINT harvested_examples_status_check
+  CHECK (status IN ('active', 'revalidating', 'expired'));
+ALTER TABLE harvested_examples ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP WITH TIME ZONE;
@@ -0,0 +1,9 @@
+-- Completed tasks double as the prompt cache shared by every process
+-- (app/services/prompt_cache.py): the normalized prompt for exact matches,
+-- its unit embedding for semantic ones, and the duration it was made for.
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS prompt_norm TEXT;
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS duration INTEGER;
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS prompt_embedding REAL[];
+
+CREATE INDEX IF NOT EXISTS tasks_prompt_cache_idx ON tasks(updated_at)
+  WHERE status = 'completed' AND prompt_norm IS NOT NULL;
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Settings require these; the code under test never talks to the services
+for name in ("GOOGLE_API_KEY", "PINECONE_API_KEY", "SUPABASE_URL", "SUPABASE_KEY"):
+    os.environ.setdefault(name, "test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,122 @@
+import pytest
+
+from app.services.manim import ast_sanitizer
+from app.services.manim.ast_sanitizer import sanitize_with_report
+
+HEADER = "from manim import *\n\n"
+
+
+def sanitize_fresh(code: str) -> tuple[str, list[str]]:
+    # Forget earlier results so every call really walks the tree
+    ast_sanitizer._seen.clear()
+    return sanitize_with_report(code)
+
+
+CASES = [
+    pytest.param(
+        HEADER + "class GeneratedScene(Scene):\n"
+        "    def construct(self):\n"
+        "        sq = Square(length=2, opacity=0.5)\n"
+        "        t = TextMobject(\"Hi\")\n"
+        "        self.play(ShowCreation(sq), FadeInn(t))\n"
+        "        sq.set_width_to(3)\n"
+        "        dot = Dot(opacity=0.3)\n",
+        HEADER + "class GeneratedScene(Scene):\n"
+        "    def construct(self):\n"
+        "        sq = Square(side_length=2, fill_opacity=0.5)\n"
+        "        t = Text(\"Hi\")\n"
+        "        self.play(Create(sq), FadeIn(t))\n"
+        "        sq.set_width(3)\n"
+        "        dot = Dot(fill_opacity=0.3)\n",
+        {"renamed-kwarg", "deprecated-api", "hallucinated-name", "renamed-method"},
+        id="renames",
+    ),
+    pytest.param(
+        # Edits after multi-byte characters on the same line land at the right byte offsets
+        HEADER + "class GeneratedScene(Scene):\n"
+        "    def construct(self):\n"
+        "        t = Text(\"café ✓ π\"); self.play(ShowCreation(t))  # naïve → fixed\n",
+        HEADER + "class GeneratedScene(Scene):\n"
+        "    def construct(self):\n"
+        "        t = Text(\"café ✓ π\"); self.play(Create(t))  # naïve → fixed\n",
+        {"deprecated-api"},
+        id="utf8-offsets",
+    ),
+    pytest.param(
+        HEADER + "class GeneratedScene(ThreeDScene):\n"
+        "    def construct(self):\n"
+        "        self.set_camera_orientation(phi=60 * DEGREES)\n"
+        "        if True:\n"
+        "            self.play(self.camera.frame.animate.scale(2))\n"
+        "        self.wait()\n",
+        HEADER + "class GeneratedScene(ThreeDScene):\n"
+        "    def construct(self):\n"
+        "        self.set_camera_orientation(phi=60 * DEGREES)\n"
+        "        if True:\n"
+        "            pass\n"
+        "        self.wait()\n",
+        {"camera-animate-3d"},
+        id="emptied-block-gets-pass",
+    ),
+    pytest.param(
+        HEADER + "class GeneratedScene(ThreeDScene):\n"
+        "    def construct(self):\n"
+        "        d = Dot()\n"
+        "        d.add_updater(lambda m, alpha: m.shift(RIGHT * alpha))\n"
+        "        self.play(self.move_camera(phi=75 * DEGREES))\n",
+        HEADER + "class GeneratedScene(ThreeDScene):\n"
+        "    def construct(self):\n"
+        "        d = Dot()\n"
+        "        d.add_updater(lambda m, dt: m.shift(RIGHT * dt))\n"
+        "        self.move_camera(phi=75 * DEGREES)\n"
+        "        self.wait(0.5)\n",
+        {"updater-lambda", "play-move-camera"},
+        id="updater-and-move-camera",
+    ),
+    pytest.param(
+        "from manim import *\n\n"
+        "class GeneratedScene(Scene):\n"
+        "    def construct(self):\n"
+        "        d = Dot(np.array([1, 0, 0]))\n"
+        "        self.add(d)\n",
+        "from manim import *\n"
+        "import numpy as np\n\n"
+        "class GeneratedScene(Scene):\n"
+        "    def construct(self):\n"
+        "        d = Dot(np.array([1, 0, 0]))\n"
+        "        self.add(d)\n",
+        {"imports"},
+        id="numpy-import",
+    ),
+]
+
+
+@pytest.mark.parametrize("source, expected, rules", CASES)
+def test_rewrites(source, expected, rules):
+    result, applied = sanitize_fresh(source)
+    assert result == expected
+    assert set(applied) == rules
+
+
+@pytest.mark.parametrize("source, expected, rules", CASES)
+def test_output_is_a_fixed_point(source, expected, rules):
+    result, _ = sanitize_fresh(source)
+    assert sanitize_fresh(result) == (result, [])
+
+
+def test_clean_script_is_untouched():
+    source = HEADER + "class GeneratedScene(Scene):\n    def construct(self):\n        self.play(Create(Circle()))\n"
+    assert sanitize_fresh(source) == (source, [])
+
+
+def test_unparseable_script_goes_through_legacy_chain():
+    source = (
+        "from manim import *\n"
+        "class GeneratedScene(Scene):\n"
+        "    def construct(self)\n"
+        "        self.play(ShowCreation(Circle()))\n"
+    )
+    result, applied = sanitize_fresh(source)
+    assert applied == ["legacy-regex"]
+    assert "Create(Circle())" in result
+    assert "ShowCreation" not in result
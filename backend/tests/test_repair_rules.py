@@ -0,0 +1,83 @@
+import pytest
+
+from app.services.manim.repair_rules import classify_error, repair_script
+
+HEADER = (
+    "from manim import *\n\n"
+    "class GeneratedScene(Scene):\n"
+    "    def construct(self):\n"
+)
+
+
+def traceback(line: int, exception: str) -> str:
+    return (
+        "Traceback (most recent call last):\n"
+        f'  File "/tmp/manim_job/scene.py", line {line}, in construct\n'
+        f"{exception}\n"
+    )
+
+
+CASES = [
+    pytest.param(
+        HEADER + "        c = Circle(radius=1, glow=True)\n        self.add(c)\n",
+        traceback(5, "TypeError: Circle.__init__() got an unexpected keyword argument 'glow'"),
+        "unexpected-kwarg",
+        HEADER + "        c = Circle(radius=1)\n        self.add(c)\n",
+        ["drop-kwarg"],
+        id="unexpected-kwarg-traceback",
+    ),
+    pytest.param(
+        HEADER + "        c = Circle(radius=1, glow=True)\n",
+        "Line 5: [unknown-kwarg] Circle() got an unexpected keyword argument 'glow'",
+        "unexpected-kwarg",
+        HEADER + "        c = Circle(radius=1)\n",
+        ["drop-kwarg"],
+        id="unexpected-kwarg-report",
+    ),
+    pytest.param(
+        HEADER + "        eq = MathTex(r\"\\alpha^2 + x_1\")\n        self.add(eq)\n",
+        traceback(5, "RuntimeError: LaTeX compilation error: LaTeX error converting to dvi."),
+        "latex",
+        HEADER + "        eq = Text('α² + x₁')\n        self.add(eq)\n",
+        ["latex-to-text"],
+        id="latex-to-text",
+    ),
+    pytest.param(
+        HEADER + "        self.move_camera(phi=75 * DEGREES)\n",
+        traceback(5, "AttributeError: 'GeneratedScene' object has no attribute 'move_camera'"),
+        "unknown-attribute",
+        HEADER.replace("(Scene)", "(ThreeDScene)") + "        self.move_camera(phi=75 * DEGREES)\n",
+        ["three-d-scene"],
+        id="move-camera",
+    ),
+    pytest.param(
+        HEADER + "        sq = Square()\n        self.play(self.camera.frame.animate.scale(0.5))\n",
+        traceback(6, "AttributeError: 'Camera' object has no attribute 'frame'"),
+        "unknown-attribute",
+        HEADER.replace("(Scene)", "(MovingCameraScene)")
+        + "        sq = Square()\n        self.play(self.camera.frame.animate.scale(0.5))\n",
+        ["moving-camera-scene"],
+        id="camera-animate",
+    ),
+    pytest.param(
+        HEADER + "        y = sqrt(2)\n        self.add(Dot(RIGHT * y))\n",
+        traceback(5, "NameError: name 'sqrt' is not defined"),
+        "undefined-name",
+        HEADER + "        y = np.sqrt(2)\n        self.add(Dot(RIGHT * y))\n",
+        ["rename-name"],
+        id="numpy-name",
+    ),
+]
+
+
+@pytest.mark.parametrize("script, error, kind, expected, rules", CASES)
+def test_repair(script, error, kind, expected, rules):
+    assert [failure["kind"] for failure in classify_error(error)] == [kind]
+    assert repair_script(script, error) == (expected, rules)
+
+
+def test_unclassified_error_is_not_repaired():
+    script = HEADER + "        self.wait(1 / 0)\n"
+    error = traceback(5, "ZeroDivisionError: division by zero")
+    assert classify_error(error) == [{"kind": None, "line": 5, "error": "ZeroDivisionError"}]
+    assert repair_script(script, error) is None
@@ -57,6 +57,7 @@ export default function DashboardPage() {
   const [error, setError] = useState('');
   const [wsConnected, setWsConnected] = useState(false);
   const [videoUrl, setVideoUrl] = useState<string | null>(null);
+  const [previewUrl, setPreviewUrl] = useState<string | null>(null);
   const [generatedCode, setGeneratedCode] = useState<string>('');
 
   // Delete State
@@ -219,10 +220,11 @@ export default function DashboardPage() {
       setStatus(data.status);
       if (data.progress !== undefined) setProgress(data.progress);
       if (data.generated_script) setGeneratedCode(data.generated_script);
+      if (data.preview_url) setPreviewUrl(data.preview_url);
 
       if (data.status === 'completed') {
         handleTaskCompletion(data);
-      } else if (data.status === 'failed') {
+      } else if (data.status === 'failed' || data.status === 'cancelled') {
         handleTaskFailure(data);
       }
     });
@@ -245,6 +247,7 @@ export default function DashboardPage() {
       setTaskId(null);
       taskIdRef.current = null;
       setIsGenerating(false);
+      setPreviewUrl(null);
       if (data.video_url) setVideoUrl(data.video_url);
       if (data.generated_script) setGeneratedCode(data.generated_script);
       loadChats();
@@ -253,6 +256,7 @@ export default function DashboardPage() {
 
     const handleTaskFailure = (data: any) => {
       setError(data.error || 'Generation failed');
+      setPreviewUrl(null);
       setTaskId(null);
       taskIdRef.current = null;
       setIsGenerating(false);
@@ -289,8 +293,8 @@ export default function DashboardPage() {
               if (task.video_url) setVideoUrl(task.video_url);
               if (task.generated_script) setGeneratedCode(task.generated_script);
               loadChats();
-            } else if (task.status === 'failed') {
-              setError(task.error || 'Generation failed');
+            } else if (task.status === 'failed' || task.status === 'cancelled') {
+              setError(task.error_message || task.error || 'Generation failed');
               setTaskId(null);
               taskIdRef.current = null;
               setIsGenerating(false);
@@ -315,6 +319,7 @@ export default function DashboardPage() {
     setStatus('starting');
     setProgress(0);
     setVideoUrl(null);
+    setPreviewUrl(null);
 
     try {
       const data = await generateAnimation(prompt, quality, duration, session.access_token, activeChatId || undefined, useImage);
@@ -419,6 +424,7 @@ export default function DashboardPage() {
             progress={progress}
             error={error}
             videoUrl={videoUrl}
+            previewUrl={previewUrl}
             generatedCode={generatedCode}
             handleGenerate={handleGenerate}
             credits={credits}
@@ -13,6 +13,7 @@ const Plyr = dynamic(() => import('plyr-react').then((mod) => mod.Plyr), {
 
 interface ViewportProps {
   videoUrl: string | null
+  previewUrl?: string | null
   generatedCode: string
   mobileTab?: 'chat' | 'output'
   isGenerating?: boolean
@@ -22,6 +23,7 @@ interface ViewportProps {
 
 export function Viewport({
   videoUrl,
+  previewUrl = null,
   generatedCode,
   mobileTab,
   isGenerating = false,
@@ -99,7 +101,28 @@ export function Viewport({
 
       {activeTab === 'viewport' ? (
         <div className="flex-1 flex items-center justify-center p-6 lg:p-8 bg-[#111] overflow-hidden min-h-[400px]">
-          {isGenerating ? (
+          {isGenerating && previewUrl ? (
+            <div key={previewUrl} className="w-full max-w-4xl aspect-video rounded-xl border border-white/10 overflow-hidden relative group bg-black">
+              <Plyr
+                source={{
+                  type: 'video',
+                  sources: [
+                    {
+                      src: previewUrl,
+                      type: 'video/mp4',
+                    },
+                  ],
+                }}
+                options={{
+                  controls: ['play-large', 'play', 'progress', 'current-time'],
+                }}
+              />
+              <div className="absolute top-3 left-3 flex items-center gap-2 rounded-md bg-black/70 px-2.5 py-1 text-xs text-white/70">
+                <Loader2 className="h-3 w-3 animate-spin" />
+                Preview · rendering full quality
+              </div>
+            </div>
+          ) : isGenerating ? (
             <div className="w-full max-w-4xl aspect-video rounded-xl border border-white/10 bg-white/5 flex flex-col items-center justify-center gap-6">
               <AITextLoading
                 className="text-2xl md:text-3xl"
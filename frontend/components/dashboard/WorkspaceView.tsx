@@ -25,6 +25,7 @@ interface WorkspaceViewProps {
   progress: number
   error: string
   videoUrl: string | null
+  previewUrl?: string | null
   generatedCode: string
   handleGenerate: () => void
   credits: number | null
@@ -45,6 +46,7 @@ export function WorkspaceView({
   progress,
   error,
   videoUrl,
+  previewUrl = null,
   generatedCode,
   handleGenerate,
   credits,
@@ -271,6 +273,7 @@ export function WorkspaceView({
       {/* Viewport Pane - now receives generation state */}
       <Viewport
         videoUrl={videoUrl}
+        previewUrl={previewUrl}
         generatedCode={generatedCode}
         mobileTab={mobileTab}
         isGenerating={isGenerating}
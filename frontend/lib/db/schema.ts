@@ -91,7 +91,7 @@ export const tasks = pgTable('tasks', {
   chatId: uuid('chat_id').references(() => chats.id, { onDelete: 'cascade' }),
   prompt: text('prompt').notNull(),
   quality: text('quality', { enum: ['l', 'm', 'h', 'k'] }).notNull(),
-  status: text('status', { enum: ['processing', 'generating_script', 'rendering', 'uploading', 'completed', 'failed'] }).notNull().default('processing'),
+  status: text('status', { enum: ['processing', 'generating_script', 'rendering', 'uploading', 'completed', 'failed', 'cancelled'] }).notNull().default('processing'),
   progress: integer('progress').notNull().default(0),
   videoUrl: text('video_url'),
   generatedScript: text('generated_script'),